@@ -0,0 +1,68 @@
+"""Micro-benchmark of the per-request chain setup path of rag_backend.
+
+Compares building the prompt, Qdrant clients and chain on every request (the
+behaviour before the chain registry) with fetching them from the registry.
+Settings are read from `.env` like the backend does.
+
+    python benchmarks/bench_chain_setup.py --model <model_name>
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "rag_backend"))
+
+from rag_backend.langchain_utils.chain import (  # noqa: E402
+    build_rag_chain,
+    get_rag_chain,
+)
+from rag_backend.langchain_utils.prompts import get_prompt  # noqa: E402
+from rag_backend.langchain_utils.retriever import (  # noqa: E402
+    get_async_qdrant_client,
+    get_qdrant_client,
+)
+
+
+def uncached_setup(model_name):
+    """Request setup as it was done before the registry existed."""
+    get_qdrant_client.cache_clear()
+    get_async_qdrant_client.cache_clear()
+    return build_rag_chain(model_name, get_prompt.__wrapped__())
+
+
+def cached_setup(model_name):
+    return get_rag_chain(model_name)
+
+
+def measure(func, model_name, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(model_name)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", required=True, help="LLM model name.")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    # Warm imports and the registry entry before measuring
+    cached_setup(args.model)
+
+    for name, func in (("uncached", uncached_setup), ("cached", cached_setup)):
+        timings = measure(func, args.model, args.iterations)
+        print(
+            f"{name:>9}: median {statistics.median(timings):8.3f} ms, "
+            f"mean {statistics.mean(timings):8.3f} ms "
+            f"({args.iterations} iterations)"
+        )
+
+
+if __name__ == "__main__":
+    main()
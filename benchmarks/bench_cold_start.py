@@ -0,0 +1,146 @@
+"""Cold start benchmark of the RAG backend.
+
+Every measurement runs in a fresh interpreter against the local stand-ins
+of the load test (see `bench_load.py`):
+
+- cli: `python -m rag_backend --help`, i.e. starting the CLI;
+- import: importing `rag_backend.app`;
+- ready: from the server accepting requests until `/health/ready` passes,
+  i.e. the warmup building clients and opening connections;
+- first/second request: `/rag/chat` once the process is ready, or with
+  `--cold`, right after the server started, racing the warmup.
+
+    python benchmarks/bench_cold_start.py --runs 5
+    python benchmarks/bench_cold_start.py --runs 5 --cold
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+REPO = Path(__file__).parents[1]
+BACKEND = REPO / "rag_backend"
+
+IMPORT_APP = (
+    "import time; started = time.perf_counter(); import rag_backend.app; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def timed_subprocess(args, **kwargs):
+    """Return the wall time of running `args` to completion."""
+    started = time.perf_counter()
+    subprocess.run(args, check=True, capture_output=True, **kwargs)
+    return time.perf_counter() - started
+
+
+def measure_import(env):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_APP],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=BACKEND,
+        env=env,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def child(cold, documents):
+    """Serve the backend on the stand-ins and time its first requests."""
+    import httpx
+    from loadtest.scenarios import TOKEN, Environment, _chat_body
+
+    # A fast fake LLM, so the requests time the backend rather than it
+    env = await Environment(
+        documents=documents, ttft=0.0, token_rate=100000.0
+    ).start(wait_ready=False)
+    timings = {}
+    try:
+        async with httpx.AsyncClient(
+            base_url=env.backend.url, timeout=300
+        ) as client:
+            started = time.perf_counter()
+            while not cold:
+                response = await client.get("/health/ready")
+                if response.status_code == 200:
+                    timings["ready"] = time.perf_counter() - started
+                    break
+                if response.json()["status"] == "not ready":
+                    raise RuntimeError(f"Warmup failed: {response.text}")
+                await asyncio.sleep(0.01)
+
+            for name in ("first_request", "second_request"):
+                started = time.perf_counter()
+                response = await client.post(
+                    "/rag/chat",
+                    json=_chat_body(0),
+                    headers={"X-Internal-Token": TOKEN},
+                )
+                response.raise_for_status()
+                timings[name] = time.perf_counter() - started
+    finally:
+        env.stop()
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="Send the first request without waiting for readiness.",
+    )
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args.cold, args.documents))
+        return
+
+    # Only settings are read on import, no service needs to be reachable
+    from loadtest.scenarios import Environment
+
+    Environment.configure("http://127.0.0.1:9")
+    env = dict(os.environ, PYTHONPATH=str(BACKEND))
+    timings = {}
+    for _ in range(args.runs):
+        runs = {
+            "cli": timed_subprocess(
+                [sys.executable, "-m", "rag_backend", "--help"],
+                cwd=BACKEND,
+                env=env,
+            ),
+            "import": measure_import(env),
+        }
+        child_args = [__file__, "--child", f"--documents={args.documents}"]
+        output = subprocess.run(
+            [sys.executable, *child_args] + ["--cold"] * args.cold,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.update(json.loads(output.strip().splitlines()[-1]))
+        for name, seconds in runs.items():
+            timings.setdefault(name, []).append(seconds)
+
+    for name, values in timings.items():
+        print(
+            f"{name:>15}  median {statistics.median(values) * 1000:8.1f} ms"
+            f"  min {min(values) * 1000:8.1f} ms"
+            f"  max {max(values) * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
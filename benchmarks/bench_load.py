@@ -0,0 +1,148 @@
+"""Offline load test of the RAG backend, the bot and the ingestion.
+
+Runs every scenario at each concurrency level against local stand-ins (a
+fake OpenAI-compatible server, in-memory Qdrant, fakeredis and a fake
+Matrix homeserver) and writes p50/p95/p99 latency, throughput and memory
+to a JSON file per commit. Comparing two files flags regressions.
+
+    python benchmarks/bench_load.py --concurrency 1 8 32
+    python benchmarks/bench_load.py --scenarios chat_stream history \\
+        --compare benchmarks/results/<baseline>.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from loadtest.stats import compare, git_commit, write_results  # noqa: E402
+
+REPO = Path(__file__).parents[1]
+ALL_SCENARIOS = [
+    "chat",
+    "chat_stream",
+    "rag_service",
+    "history",
+    "matrix_send",
+    "ingest",
+]
+
+
+async def run(args):
+    # Reads the environment, which must point at the stand-ins first
+    from loadtest.scenarios import SCENARIOS, Environment
+
+    env = Environment(
+        dim=args.dim,
+        documents=args.documents,
+        ttft=args.ttft,
+        token_rate=args.token_rate,
+        answer_tokens=args.answer_tokens,
+        matrix_latency=args.matrix_latency,
+        rate_limit_ratio=args.rate_limit_ratio,
+    )
+    await env.start()
+    results = []
+    try:
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                requests = (
+                    args.ingest_runs
+                    if name == "ingest"
+                    else max(args.requests, concurrency)
+                )
+                recorder = await SCENARIOS[name](env, concurrency, requests)
+                result = recorder.result()
+                results.append(result)
+                latency = result["latency_ms"] or {}
+                print(
+                    f"{name:>12} c={concurrency:<4} "
+                    f"{result['throughput_rps']:8.2f} req/s  "
+                    f"p50 {latency.get('p50', 0):9.1f} ms  "
+                    f"p95 {latency.get('p95', 0):9.1f} ms  "
+                    f"p99 {latency.get('p99', 0):9.1f} ms  "
+                    f"errors {result['errors']}",
+                    flush=True,
+                )
+    finally:
+        env.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=ALL_SCENARIOS, default=ALL_SCENARIOS
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=100,
+        help="Requests per scenario and concurrency level.",
+    )
+    parser.add_argument(
+        "--ingest-runs", type=int, default=3, help="Ingestions per level."
+    )
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument(
+        "--ttft", type=float, default=0.2, help="Fake LLM first token delay."
+    )
+    parser.add_argument(
+        "--token-rate", type=float, default=50.0, help="Fake LLM tokens/s."
+    )
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument(
+        "--matrix-latency",
+        type=float,
+        default=0.02,
+        help="Seconds the fake homeserver takes per send.",
+    )
+    parser.add_argument(
+        "--rate-limit-ratio",
+        type=float,
+        default=0.0,
+        help="Share of sends the fake homeserver answers with 429.",
+    )
+    parser.add_argument(
+        "--output",
+        help="Result file, defaults to benchmarks/results/<commit>.json.",
+    )
+    parser.add_argument("--compare", help="Baseline result file.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative change flagged as a regression.",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = asyncio.run(run(args))
+    settings = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "compare", "threshold")
+    }
+    output = args.output or (
+        REPO / "benchmarks" / "results" / f"{git_commit(REPO)}.json"
+    )
+    report = write_results(output, REPO, settings, results)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline["settings"] != settings:
+            print("Warning: the baseline was run with other settings")
+        lines, regressions = compare(baseline, report, args.threshold)
+        print("\n".join(lines))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Benchmark of the REST and gRPC transports of Qdrant.
+
+Without a server, compares the size and the encoding/decoding time of the
+messages exchanged for the embedding size used in production: an upsert
+batch as sent by the ingestion, and a search response carrying the vectors
+of the candidates as fetched by the backend for the MMR rerank.
+
+With `--host`, also times upserts and searches against a running Qdrant
+over each transport, in a throwaway collection.
+
+    python benchmarks/bench_qdrant_transport.py
+    python benchmarks/bench_qdrant_transport.py --host localhost
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient, grpc, models
+from qdrant_client.conversions.conversion import GrpcToRest, RestToGrpc
+from qdrant_client.http import models as rest
+
+
+def make_points(count, dim, rng):
+    return [
+        models.PointStruct(
+            id=str(uuid.uuid4()),
+            vector=rng.standard_normal(dim).tolist(),
+            payload={
+                "page_content": "lorem ipsum " * 80,
+                "metadata": {"source": f"doc_{i}.md", "chunk": i},
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def scored(points):
+    return [
+        models.ScoredPoint(
+            id=point.id,
+            version=0,
+            score=1.0,
+            payload=point.payload,
+            vector=point.vector,
+        )
+        for point in points
+    ]
+
+
+def timed(function, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure_encoding(name, rest_message, build_grpc, to_rest, iterations):
+    """Print size and round trip time of a message in JSON and protobuf.
+
+    Decoding includes parsing into the models of the client. Over gRPC, the
+    client converts between them and protobuf messages: `build_grpc` (REST
+    models -> message) is counted in the encoding time and `to_rest`
+    (message -> REST models) in the decoding time.
+    """
+    body = rest_message.model_dump_json(exclude_unset=True)
+    encoded = build_grpc().SerializeToString()
+    message_type = type(build_grpc())
+    rows = {
+        "rest": (
+            len(body),
+            timed(
+                lambda: rest_message.model_dump_json(exclude_unset=True),
+                iterations,
+            ),
+            timed(
+                lambda: type(rest_message).model_validate_json(body),
+                iterations,
+            ),
+        ),
+        "grpc": (
+            len(encoded),
+            timed(lambda: build_grpc().SerializeToString(), iterations),
+            timed(
+                lambda: to_rest(message_type.FromString(encoded)), iterations
+            ),
+        ),
+    }
+    for transport, (size, encode, decode) in rows.items():
+        print(
+            f"{name:>8} {transport:>5}  {size / 1024:9.1f} KiB"
+            f"  encode {encode:7.2f} ms  decode {decode:7.2f} ms"
+        )
+
+
+def measure_server(args, points, query):
+    collection = f"bench_transport_{uuid.uuid4().hex[:8]}"
+    clients = {
+        "rest": QdrantClient(host=args.host, port=args.port),
+        "grpc": QdrantClient(
+            host=args.host, grpc_port=args.grpc_port, prefer_grpc=True
+        ),
+    }
+    clients["rest"].create_collection(
+        collection,
+        vectors_config=models.VectorParams(
+            size=args.dim, distance=models.Distance.COSINE
+        ),
+    )
+    try:
+        for transport, client in clients.items():
+            upsert = timed(
+                lambda: client.upsert(collection, points, wait=True),
+                args.iterations,
+            )
+            search = timed(
+                lambda: client.query_points(
+                    collection,
+                    query=query,
+                    limit=args.fetch_k,
+                    with_vectors=True,
+                ),
+                args.iterations,
+            )
+            print(
+                f"{transport:>5}  upsert {upsert:8.2f} ms"
+                f"  search {search:8.2f} ms"
+            )
+    finally:
+        clients["rest"].delete_collection(collection)
+        for client in clients.values():
+            client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dim", type=int, default=2560)
+    parser.add_argument(
+        "--batch", type=int, default=64, help="Points per upsert."
+    )
+    parser.add_argument(
+        "--fetch-k", type=int, default=20, help="Points per search response."
+    )
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--host", help="Qdrant to also benchmark against.")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--grpc-port", type=int, default=6334)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    points = make_points(args.batch, args.dim, rng)
+    measure_encoding(
+        "upsert",
+        models.PointsList(points=points),
+        lambda: grpc.UpsertPoints(
+            collection_name="bench",
+            points=[RestToGrpc.convert_point_struct(p) for p in points],
+        ),
+        lambda message: message,
+        args.iterations,
+    )
+    results = scored(points[: args.fetch_k])
+    measure_encoding(
+        "search",
+        rest.QueryResponse(points=results),
+        lambda: grpc.QueryResponse(
+            result=[RestToGrpc.convert_scored_point(p) for p in results]
+        ),
+        lambda message: [
+            GrpcToRest.convert_scored_point(p) for p in message.result
+        ],
+        args.iterations,
+    )
+
+    if args.host:
+        measure_server(args, points, rng.standard_normal(args.dim).tolist())
+
+
+if __name__ == "__main__":
+    main()
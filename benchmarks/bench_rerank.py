@@ -0,0 +1,54 @@
+"""Micro-benchmark of the MMR rerank stage of rag_backend.
+
+Selects the top k out of `fetch_k` random candidates of the embedding size
+used in production, which is the work added to every retrieval.
+
+    python benchmarks/bench_rerank.py --fetch-k 20 50 100
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "rag_backend"))
+
+from rag_backend.langchain_utils.rerank import mmr_select  # noqa: E402
+
+
+def measure(fetch_k, k, dim, iterations):
+    rng = np.random.default_rng(0)
+    timings = []
+    for _ in range(iterations):
+        # Retrieved vectors arrive as lists from the Qdrant client
+        query = rng.standard_normal(dim).tolist()
+        docs = rng.standard_normal((fetch_k, dim)).tolist()
+        start = time.perf_counter()
+        mmr_select(query, docs, k)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[20, 50])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=2560)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    for fetch_k in args.fetch_k:
+        timings = measure(fetch_k, args.k, args.dim, args.iterations)
+        print(
+            f"fetch_k {fetch_k:>4}: "
+            f"median {statistics.median(timings):7.3f} ms, "
+            f"p95 {np.percentile(timings, 95):7.3f} ms "
+            f"({args.iterations} iterations)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Offline load tests of the RAG backend, the bot and the ingestion.
+
+OpenAI, Qdrant, Redis and the Matrix homeserver are replaced by local
+stand-ins, so throughput and latency can be measured on any machine and
+compared across commits. Run it with ``python benchmarks/bench_load.py``.
+"""
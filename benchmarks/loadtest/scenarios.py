@@ -0,0 +1,470 @@
+"""Load scenarios against the local stand-ins.
+
+Import this module only after `Environment.configure` has set the
+environment, the backend reads its configuration on import.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import fakeredis
+import httpx
+from nio import AsyncClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from .servers import (
+    BackgroundServer,
+    embed_text,
+    fake_homeserver_app,
+    fake_openai_app,
+)
+from .stats import Recorder
+
+REPO = Path(__file__).parents[2]
+for package in ("rag_backend", "matrixbot", "ingest_data"):
+    sys.path.insert(0, str(REPO / package))
+
+MODEL = "bench-llm"
+EMBEDDING_MODEL = "bench-embed"
+TOKEN = "bench"
+COLLECTION = "bench"
+
+logger = logging.getLogger("loadtest")
+
+
+def question(i):
+    """A distinct question, so neither caches nor coalescing kick in."""
+    return f"Question {i}: how is indicator {i % 97} computed in report {i}?"
+
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one text page per string of `pages`."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None]
+    kids = []
+    for text in pages:
+        lines = [text[i : i + 90] for i in range(0, len(text), 90)]
+        stream = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(
+            "({}) '".format(
+                line.replace("\\", "").replace("(", "").replace(")", "")
+            )
+            for line in lines
+        )
+        stream += " ET"
+        objects.append(
+            f"<< /Length {len(stream)} >>\nstream\n{stream}\n" "endstream"
+        )
+        content = len(objects)
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Contents {content} 0 R /Resources << /Font << /F1 "
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = (
+        f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    )
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+    Path(path).write_bytes(out)
+
+
+def synthetic_text(i, words=160):
+    """Deterministic prose-like text of a corpus chunk."""
+    vocabulary = (
+        "index education income health report country region growth "
+        "inequality gender measure data survey average population"
+    ).split()
+    body = " ".join(
+        vocabulary[(i * 7 + j * 3) % len(vocabulary)] for j in range(words)
+    )
+    return f"Section {i}. {body}."
+
+
+class Environment:
+    """Starts the stand-ins and the backend served on them.
+
+    parameters
+    ----------
+    dim : int
+        Embedding size of the fake OpenAI server and the collection.
+    documents : int
+        Chunks of the synthetic Qdrant corpus.
+    ttft, token_rate, answer_tokens
+        Generation speed of the fake LLM, see `fake_openai_app`.
+    matrix_latency, rate_limit_ratio
+        Behaviour of the fake homeserver, see `fake_homeserver_app`.
+    """
+
+    def __init__(
+        self,
+        dim=256,
+        documents=2000,
+        ttft=0.2,
+        token_rate=50.0,
+        answer_tokens=64,
+        matrix_latency=0.02,
+        rate_limit_ratio=0.0,
+    ):
+        self.dim = dim
+        self.documents = documents
+        self.openai = BackgroundServer(
+            fake_openai_app(dim, ttft, token_rate, answer_tokens)
+        )
+        self.homeserver = BackgroundServer(
+            fake_homeserver_app(matrix_latency, rate_limit_ratio)
+        )
+        self.backend = None
+        self.workdir = Path(tempfile.mkdtemp(prefix="loadtest-"))
+
+    @staticmethod
+    def configure(openai_url):
+        """Point the backend configuration at the stand-ins.
+
+        Set explicitly so a local `.env` cannot reach real services.
+        """
+        os.environ.update(
+            OPENAI_API_KEY=TOKEN,
+            OPENAI_ENDPOINT=f"{openai_url}/v1",
+            OPENAI_ENDPOINTS="",
+            OPENAI_EMBEDDING_MODEL_NAME=EMBEDDING_MODEL,
+            VECTORDB_HOST="localhost",
+            VECTORDB_PORT="6333",
+            VECTORDB_COLLECTION=COLLECTION,
+            VECTORDB_TOPK="5",
+            RETRIEVAL_MODE="dense",
+            SEMANTIC_CACHE="off",
+            EMBEDDING_CACHE_REDIS_URL="",
+            WARMUP_MODELS=MODEL,
+            INTERNAL_FASTAPI_TOKEN=TOKEN,
+        )
+
+    async def _build_corpus(self):
+        client = AsyncQdrantClient(":memory:")
+        await client.create_collection(
+            COLLECTION,
+            vectors_config=VectorParams(
+                size=self.dim, distance=Distance.COSINE
+            ),
+        )
+        points = []
+        for i in range(self.documents):
+            text = synthetic_text(i)
+            points.append(
+                PointStruct(
+                    id=i,
+                    vector=embed_text(text, self.dim),
+                    payload={
+                        "page_content": text,
+                        "metadata": {"source": f"report-{i // 20}.pdf"},
+                    },
+                )
+            )
+        for start in range(0, len(points), 500):
+            await client.upsert(COLLECTION, points[start : start + 500])
+        return client
+
+    async def start(self, wait_ready=True):
+        """Start the stand-ins and the backend, by default waiting until
+        its warmup is done so the scenarios do not time it.
+        """
+        self.openai.start()
+        self.homeserver.start()
+        self.configure(self.openai.url)
+
+        from rag_backend.langchain_utils import retriever
+
+        qdrant = await self._build_corpus()
+        # The backend creates its clients lazily from these classes
+        retriever.AsyncQdrantClient = lambda **kwargs: qdrant
+        retriever.QdrantClient = lambda **kwargs: qdrant
+        # The context length check needs a tiktoken download
+        retriever.get_embedder().embeddings.check_embedding_ctx_length = False
+
+        from rag_backend.app import app
+
+        self.backend = BackgroundServer(app).start()
+        async with httpx.AsyncClient(base_url=self.backend.url) as client:
+            while wait_ready:
+                response = await client.get("/health/ready")
+                if response.status_code == 200:
+                    break
+                if response.json()["status"] == "not ready":
+                    raise RuntimeError(f"Warmup failed: {response.text}")
+                await asyncio.sleep(0.01)
+        return self
+
+    def stop(self):
+        for server in (self.backend, self.openai, self.homeserver):
+            if server is not None:
+                server.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def bot_config(self, **overrides):
+        """Bot settings for the stand-ins, without the bot's `.env`."""
+        settings = dict(
+            rag_api_url=f"{self.backend.url}/rag/chat",
+            rag_stream_url=f"{self.backend.url}/rag/chat/stream",
+            rag_summarize_url=f"{self.backend.url}/rag/summarize",
+            rag_api_key=TOKEN,
+            rag_model=MODEL,
+            rag_connect_timeout=5.0,
+            rag_read_timeout=300.0,
+            rag_max_connections=100,
+            rag_max_retries=0,
+            rag_retry_backoff=0.5,
+            redis_host="localhost",
+            redis_port=6379,
+            redis_db=0,
+            redis_max_connections=100,
+            redis_history_size=30,
+            history_cache_size=1000,
+            # Send as fast as the homeserver answers, the limits of the
+            # production settings would only measure the throttling
+            matrix_send_rate=10000.0,
+            matrix_send_burst=10000,
+            matrix_room_send_rate=10000.0,
+            matrix_room_send_burst=10000,
+            matrix_send_retries=3,
+            markdown_cache_size=256,
+            markdown_offload_chars=4000,
+        )
+        settings.update(overrides)
+        return SimpleNamespace(**settings)
+
+
+async def drive(recorder, concurrency, requests, call):
+    """Run ``call(i)`` for `requests` indices with `concurrency` workers.
+
+    `call` returns the seconds to the first token (or None) and the number
+    of units (e.g. tokens) it produced.
+    """
+    indices = iter(range(requests))
+
+    async def worker():
+        for i in indices:
+            started = time.perf_counter()
+            try:
+                first_token, units = await call(i)
+            except Exception as exc:
+                logger.warning(f"{recorder.scenario} request failed: {exc}")
+                recorder.error()
+                continue
+            recorder.add(time.perf_counter() - started, first_token, units)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return recorder.stop()
+
+
+def _chat_body(i):
+    return {
+        "model": MODEL,
+        "chat_history": [{"role": "user", "content": question(i)}],
+    }
+
+
+async def chat(env, concurrency, requests):
+    """`/rag/chat` requests over HTTP."""
+    headers = {"X-Internal-Token": TOKEN}
+    async with httpx.AsyncClient(
+        base_url=env.backend.url,
+        timeout=300,
+        limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+
+        async def call(i):
+            response = await client.post(
+                "/rag/chat", json=_chat_body(i), headers=headers
+            )
+            response.raise_for_status()
+            return None, 1
+
+        return await drive(
+            Recorder("chat", concurrency), concurrency, requests, call
+        )
+
+
+async def chat_stream(env, concurrency, requests):
+    """`/rag/chat/stream` requests, with the time to the first token."""
+    headers = {"X-Internal-Token": TOKEN}
+    async with httpx.AsyncClient(
+        base_url=env.backend.url,
+        timeout=300,
+        limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+
+        async def call(i):
+            started = time.perf_counter()
+            first_token = None
+            tokens = 0
+            async with client.stream(
+                "POST", "/rag/chat/stream", json=_chat_body(i), headers=headers
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if '"type": "token"' in line:
+                        tokens += 1
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                    elif '"type": "error"' in line:
+                        raise RuntimeError(line)
+            return first_token, tokens
+
+        return await drive(
+            Recorder("chat_stream", concurrency), concurrency, requests, call
+        )
+
+
+async def rag_service(env, concurrency, requests):
+    """Streamed answers through the bot's `RAGService`."""
+    from matrixbot.core.rag_service import RAGService
+
+    service = RAGService(env.bot_config())
+
+    async def call(i):
+        started = time.perf_counter()
+        first_token = None
+        tokens = 0
+        history = [{"role": "user", "content": question(i)}]
+        async for frame in service.stream_model(question(i), history, logger):
+            if frame["type"] == "token":
+                tokens += 1
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+        return first_token, tokens
+
+    try:
+        return await drive(
+            Recorder("rag_service", concurrency), concurrency, requests, call
+        )
+    finally:
+        await service.close()
+
+
+async def history(env, concurrency, requests):
+    """Conversation turns of `RedisHistoryManager` on fakeredis.
+
+    A turn adds the question, reads the history and summary and adds the
+    answer. Users outnumber the cached histories, so reads also miss.
+    """
+    from matrixbot.core.history import RedisHistoryManager
+
+    users = concurrency * 8
+    manager = RedisHistoryManager(
+        env.bot_config(history_cache_size=concurrency * 4)
+    )
+    await manager.close()
+    manager.redis_client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    async def call(i):
+        user = f"@user{i % users}:bench"
+        await manager.add("!room:bench", user, "user", question(i))
+        await manager.get("!room:bench", user)
+        await manager.get_summary("!room:bench", user)
+        await manager.add("!room:bench", user, "assistant", synthetic_text(i))
+        return None, 1
+
+    try:
+        return await drive(
+            Recorder("history", concurrency), concurrency, requests, call
+        )
+    finally:
+        await manager.redis_client.aclose()
+
+
+async def matrix_send(env, concurrency, requests):
+    """Rendered messages sent by `MatrixClient` to the fake homeserver."""
+    from matrixbot.core.matrix_client import MatrixClient
+
+    nio_client = AsyncClient(env.homeserver.url, "@bench:localhost")
+    nio_client.access_token = TOKEN
+    nio_client.user_id = "@bench:localhost"
+    client = MatrixClient(nio_client, env.bot_config(), logger)
+    message = (
+        "## Answer\n\n" + synthetic_text(1) + "\n\n```python\nprint(1)\n```\n"
+    )
+
+    async def call(i):
+        event_id = await client.send_message(
+            f"!room{i % concurrency}:bench", message, return_event_id=True
+        )
+        if event_id is None:
+            raise RuntimeError("send failed")
+        return None, 1
+
+    try:
+        return await drive(
+            Recorder("matrix_send", concurrency), concurrency, requests, call
+        )
+    finally:
+        client.close()
+        await nio_client.close()
+
+
+async def ingest(env, concurrency, requests, files=20, pages=5):
+    """Full ingestions of synthetic PDFs into an in-memory collection.
+
+    Every request ingests all files into a fresh collection, `concurrency`
+    is the number of embedding requests and upserts in flight.
+    """
+    import qdrant_ingest
+
+    corpus = env.workdir / "pdfs"
+    if not corpus.exists():
+        corpus.mkdir()
+        for f in range(files):
+            write_pdf(
+                corpus / f"report-{f}.pdf",
+                [synthetic_text(f * pages + p, 600) for p in range(pages)],
+            )
+    # Configured on import, see `Environment.configure`
+    qdrant_ingest.embedder.check_embedding_ctx_length = False
+
+    def run(i):
+        qdrant = QdrantClient(":memory:")
+        qdrant_ingest.QdrantClient = lambda **kwargs: qdrant
+        qdrant_ingest.ingest_paths(
+            [str(corpus)],
+            collection_name=COLLECTION,
+            vector_size=env.dim,
+            workers=2,
+            concurrency=concurrency,
+            manifest_path=str(env.workdir / f"manifest-{i}.json"),
+        )
+        return qdrant.count(COLLECTION).count
+
+    async def call(i):
+        chunks = await asyncio.to_thread(run, i)
+        return None, chunks
+
+    # Ingestions run one after the other, each is parallel internally
+    return await drive(Recorder("ingest", concurrency), 1, requests, call)
+
+
+SCENARIOS = {
+    "chat": chat,
+    "chat_stream": chat_stream,
+    "rag_service": rag_service,
+    "history": history,
+    "matrix_send": matrix_send,
+    "ingest": ingest,
+}
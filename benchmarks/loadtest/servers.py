@@ -0,0 +1,197 @@
+"""Local stand-ins for the OpenAI API and the Matrix homeserver."""
+
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "the human development index combines life expectancy education and "
+    "income into a single measure of the capabilities of people in a country"
+).split()
+
+
+def embed_text(text, dim):
+    """Deterministic unit vector of `text`, similar texts are not close."""
+    seed = int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], "big")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def fake_openai_app(dim=256, ttft=0.2, token_rate=50.0, answer_tokens=64):
+    """OpenAI-compatible API with embeddings and chat completions.
+
+    parameters
+    ----------
+    dim : int
+        Size of the embeddings.
+    ttft : float
+        Seconds until the first answer token.
+    token_rate : float
+        Answer tokens per second after the first.
+    answer_tokens : int
+        Tokens of every answer.
+    """
+    app = FastAPI()
+
+    @app.get("/v1/models")
+    def models():
+        return {
+            "object": "list",
+            "data": [
+                {"id": "bench-llm", "object": "model", "owned_by": "bench"},
+                {"id": "bench-embed", "object": "model", "owned_by": "bench"},
+            ],
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        texts = body["input"]
+        if isinstance(texts, str):
+            texts = [texts]
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": embed_text(str(text), dim),
+                }
+                for i, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def chunk(model, content, finish_reason=None):
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": content} if content else {},
+                    "finish_reason": finish_reason,
+                }
+            ],
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body["model"]
+        tokens = [
+            (" " if i else "") + WORDS[i % len(WORDS)]
+            for i in range(answer_tokens)
+        ]
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + (answer_tokens - 1) / token_rate)
+            return {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": "".join(tokens),
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": answer_tokens,
+                    "total_tokens": answer_tokens,
+                },
+            }
+
+        async def events():
+            await asyncio.sleep(ttft)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(1 / token_rate)
+                yield f"data: {json.dumps(chunk(model, token))}\n\n"
+            yield f"data: {json.dumps(chunk(model, '', 'stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def fake_homeserver_app(latency=0.02, rate_limit_ratio=0.0, retry_after=100):
+    """Matrix homeserver accepting room events.
+
+    parameters
+    ----------
+    latency : float
+        Seconds to answer a send.
+    rate_limit_ratio : float
+        Share of sends answered with 429.
+    retry_after : int
+        Milliseconds the client is asked to wait after a 429.
+    """
+    app = FastAPI()
+    rng = random.Random(0)
+
+    @app.put("/_matrix/client/{version}/rooms/{room_id}/send/{kind}/{txn}")
+    async def send(version: str, room_id: str, kind: str, txn: str):
+        await asyncio.sleep(latency)
+        if rng.random() < rate_limit_ratio:
+            return JSONResponse(
+                {
+                    "errcode": "M_LIMIT_EXCEEDED",
+                    "error": "Too many requests",
+                    "retry_after_ms": retry_after,
+                },
+                status_code=429,
+            )
+        return {"event_id": f"${uuid.uuid4().hex}"}
+
+    return app
+
+
+class BackgroundServer:
+    """Serves an ASGI app with uvicorn in a daemon thread.
+
+    The app runs on its own event loop, like a separate service would.
+    """
+
+    def __init__(self, app, host="127.0.0.1", port=None):
+        if port is None:
+            with socket.socket() as sock:
+                sock.bind((host, 0))
+                port = sock.getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        self.server = uvicorn.Server(
+            uvicorn.Config(app, host=host, port=port, log_level="warning")
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self, timeout=10.0):
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server at {self.url} did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
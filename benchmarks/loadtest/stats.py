@@ -0,0 +1,164 @@
+"""Latency recording and the JSON result format."""
+
+import json
+import platform
+import resource
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Result fields compared across runs and whether higher is better
+COMPARED = {
+    "throughput_rps": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "first_token_ms.p50": False,
+    "first_token_ms.p95": False,
+}
+
+
+def rss_mb():
+    """Current resident memory of the process in MiB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak resident memory of the process in MiB."""
+    # KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(values):
+    """p50/p95/p99, mean and max of `values` in milliseconds."""
+    if not values:
+        return None
+    ms = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "mean": round(float(ms.mean()), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+
+class Recorder:
+    """Collects the latencies and errors of one scenario run."""
+
+    def __init__(self, scenario, concurrency):
+        self.scenario = scenario
+        self.concurrency = concurrency
+        self.latencies = []
+        self.first_tokens = []
+        self.errors = 0
+        self.units = 0
+        self.rss_before = rss_mb()
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def add(self, latency, first_token=None, units=1):
+        self.latencies.append(latency)
+        if first_token is not None:
+            self.first_tokens.append(first_token)
+        self.units += units
+
+    def error(self):
+        self.errors += 1
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def result(self, **extra):
+        """The run as a JSON-serializable dict."""
+        duration = self.duration or time.perf_counter() - self.started
+        return {
+            "scenario": self.scenario,
+            "concurrency": self.concurrency,
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(self.latencies) / duration, 3),
+            "units_per_s": round(self.units / duration, 3),
+            "latency_ms": percentiles(self.latencies),
+            "first_token_ms": percentiles(self.first_tokens),
+            "memory_mb": {
+                "rss_before": round(self.rss_before, 1),
+                "rss_after": round(rss_mb(), 1),
+                "peak_rss": round(peak_rss_mb(), 1),
+            },
+            **extra,
+        }
+
+
+def git_commit(repo):
+    try:
+        return subprocess.run(
+            ["git", "-C", str(repo), "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(path, repo, settings, results):
+    """Write a run in the comparable JSON format and return it."""
+    report = {
+        "commit": git_commit(repo),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": settings,
+        "results": results,
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n")
+    return report
+
+
+def _field(result, name):
+    value = result
+    for key in name.split("."):
+        value = (value or {}).get(key)
+    return value
+
+
+def compare(baseline, current, threshold=0.1):
+    """Return comparison lines of two reports, flagging regressions.
+
+    A change worse than `threshold` (relative) is marked as a regression.
+    """
+    old = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    lines = [f"{baseline['commit']} -> {current['commit']}"]
+    regressions = 0
+    for result in current["results"]:
+        key = (result["scenario"], result["concurrency"])
+        if key not in old:
+            continue
+        for name, higher_is_better in COMPARED.items():
+            before, after = _field(old[key], name), _field(result, name)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            lines.append(
+                f"{key[0]:>12} c={key[1]:<4} {name:<20} "
+                f"{before:>10.1f} -> {after:>10.1f} ({change:+.1%}){flag}"
+            )
+    lines.append(f"{regressions} regressions above {threshold:.0%}")
+    return lines, regressions
@@ -1,67 +1,695 @@
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
 import os
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from pathlib import Path
 
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore
+from openai import APIConnectionError, InternalServerError, RateLimitError
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.http.models import (
+    Distance,
+    Modifier,
+    PointIdsList,
+    PointStruct,
+    SparseVectorParams,
+    VectorParams,
+)
+from qdrant_quantize import QUANTIZATIONS, quantization_config
+
+# The BM25 encoding is shared with the queries of the RAG backend
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "rag_backend"))
+from rag_backend.langchain_utils.sparse import encode_document  # noqa: E402
 
 load_dotenv("./.env")
 
+# Embedding errors after which a batch is retried: rate limits, lost
+# connections and timeouts, and server errors
+TRANSIENT_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
 embedder = OpenAIEmbeddings(
     model=os.getenv("OPENAI_EMBEDDING_MODEL_NAME"),
     openai_api_base=os.getenv("OPENAI_ENDPOINT"),
     openai_api_key=os.getenv("OPENAI_API_KEY"),
 )
 
+# Payload keys read by the RAG backend (same as `QdrantVectorStore`)
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
 
-def ingest_to_qdrant(
-    file_path: str,
-    collection_name="rag_data",
-    host="localhost",
-    vector_size=2560,  # qwen3-embedding-4b embedding size
-    port=6333,
+# Namespace of the deterministic point IDs, never change it: existing points
+# would no longer be recognized and would be duplicated on the next run
+POINT_ID_NAMESPACE = uuid.UUID("6f1f4a52-8a56-4c1b-9d3e-2b7c1e0a9f64")
+
+# Name of the sparse (BM25) vector used by the hybrid retrieval mode
+SPARSE_VECTOR_NAME = os.getenv("VECTORDB_SPARSE_NAME", "sparse")
+
+
+def mark_collection_updated(qdrant_client, collection_name):
+    """Write a new content version to the collection metadata.
+
+    The RAG backend keys its semantic answer cache on this version, so
+    answers cached before this ingestion are no longer served. Errors are
+    raised, except if Qdrant does not support collection metadata at all.
+    """
+    try:
+        qdrant_client.update_collection(
+            collection_name=collection_name,
+            metadata={"ingest_version": uuid.uuid4().hex},
+        )
+    except UnexpectedResponse as exc:
+        # Qdrant versions without collection metadata reject the field
+        if exc.status_code not in (400, 422) or b"metadata" not in (
+            exc.content or b""
+        ):
+            raise
+        metadata = None
+    else:
+        # or ignore it over gRPC
+        metadata = qdrant_client.get_collection(
+            collection_name
+        ).config.metadata
+    if not (metadata or {}).get("ingest_version"):
+        print(
+            f"Qdrant cannot store the version of '{collection_name}': "
+            "set SEMANTIC_CACHE=off in the RAG backend, it would serve "
+            "answers cached before this ingestion."
+        )
+
+
+def ensure_collection(
+    qdrant_client, collection_name, vector_size, quantization=None
 ):
-    # Load document
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
+    """Create the collection if it does not exist yet.
 
-    # Split into chunks
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=900, chunk_overlap=150
-    )
-    chunks = splitter.split_documents(documents)
+    With a quantization, the original vectors are stored on disk.
 
-    # Connect to Qdrant and create collection
-    qdrant_client = QdrantClient(host=host, port=port)
+    Returns True if the collection was created.
+    """
     if not qdrant_client.collection_exists(collection_name):
+        quantized = quantization_config(quantization)
         qdrant_client.create_collection(
             collection_name=collection_name,
             vectors_config=VectorParams(
                 size=vector_size,
                 distance=Distance.COSINE,
+                on_disk=quantized is not None,
             ),
+            sparse_vectors_config={
+                SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)
+            },
+            quantization_config=quantized,
         )
-    else:
-        print(f"Collection {collection_name} is already existed!")
+        return True
+    print(f"Collection {collection_name} is already existed!")
+    return False
+
+
+def has_sparse_vectors(qdrant_client, collection_name):
+    """Return True if the collection accepts the BM25 sparse vector.
+
+    Sparse vectors can only be configured when a collection is created, so
+    older collections are ingested with dense vectors only.
+    """
+    params = qdrant_client.get_collection(collection_name).config.params
+    if SPARSE_VECTOR_NAME in (params.sparse_vectors or {}):
+        return True
+    print(
+        f"Collection {collection_name} has no '{SPARSE_VECTOR_NAME}' sparse "
+        "vector, hybrid retrieval needs it to be recreated."
+    )
+    return False
+
+
+def file_hash(file_path):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def point_id(source, content):
+    """Deterministic point ID of a chunk, from its source and content hash.
+
+    Re-ingesting the same chunk overwrites its point instead of adding a
+    duplicate.
+    """
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\0{content_hash}"))
+
+
+class IngestManifest:
+    """Content hash and point IDs of every ingested file, stored as JSON.
+
+    It lets re-ingestion skip unchanged files without parsing or embedding
+    them, and tells which points of a changed file have to be deleted.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                for file, entry in json.load(f).items():
+                    self._load(file, entry)
+
+    def _load(self, file, entry):
+        # Manifests written before paths were normalized may name a file in
+        # several ways, each with its own points. Merged entries get no hash
+        # so the file is ingested again and the duplicates are deleted.
+        file = os.path.realpath(file)
+        known = self.files.get(file)
+        if known is not None:
+            entry = dict(
+                entry,
+                sha256=None,
+                point_ids=list(
+                    dict.fromkeys(known["point_ids"] + entry["point_ids"])
+                ),
+            )
+        self.files[file] = entry
+
+    def get(self, file_path):
+        return self.files.get(file_path)
+
+    def update(self, file_path, sha256, point_ids, sparse=False):
+        self.files[file_path] = {
+            "sha256": sha256,
+            "point_ids": point_ids,
+            "sparse": sparse,
+        }
+
+    def remove(self, file_path):
+        self.files.pop(file_path, None)
+
+    def save(self):
+        """Write the manifest atomically."""
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.files, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def collect_files(paths, pattern="**/*.pdf"):
+    """Expand directories (with `pattern`), glob patterns and file paths.
+
+    Files are returned as canonical absolute paths, so that the point IDs
+    and manifest entries of a file do not depend on how it was named.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(str(p) for p in Path(path).glob(pattern))
+        elif glob.has_magic(path):
+            files += sorted(glob.glob(path, recursive=True))
+        else:
+            files.append(path)
+    # Keep the first occurrence of files matched several times
+    return list(dict.fromkeys(os.path.realpath(file) for file in files))
+
+
+def load_and_split(file_path, chunk_size=900, chunk_overlap=150):
+    """Load a PDF and split it into chunks (runs in a worker process)."""
+    loader = PyPDFLoader(file_path)
+    documents = loader.load()
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    return splitter.split_documents(documents)
+
+
+def parse_file(file_path, known_hash=None):
+    """Hash a file and, unless unchanged, load and split it.
+
+    Runs in a worker process. Returns the file hash and the chunks, or None
+    instead of the chunks if the hash equals `known_hash`.
+    """
+    sha256 = file_hash(file_path)
+    if sha256 == known_hash:
+        return sha256, None
+    return sha256, load_and_split(file_path)
+
+
+class AdaptiveBatchSize:
+    """Embedding batch size adapted to the rate limits of the server.
+
+    The size is halved whenever the embedding server answers with a rate
+    limit or another transient error and grows back by a quarter after
+    every successful batch, between `minimum` and `maximum`.
+    """
+
+    def __init__(self, initial=64, minimum=1, maximum=512):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def success(self):
+        self.size = min(self.maximum, self.size + max(1, self.size // 4))
+
+    def rate_limited(self):
+        self.size = max(self.minimum, self.size // 2)
+
+
+class Progress:
+    """Print progress and throughput at most every `interval` seconds."""
+
+    def __init__(self, total_files, interval=5.0):
+        self.total_files = total_files
+        self.interval = interval
+        self.files_done = 0
+        self.files_skipped = 0
+        self.chunks_written = 0
+        self.chunks_deleted = 0
+        self.started = time.perf_counter()
+        self._last_report = 0.0
+
+    def report(self, batch_size, force=False):
+        now = time.perf_counter()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = now - self.started
+        print(
+            f"[{self.files_done}/{self.total_files} files, "
+            f"{self.files_skipped} unchanged] "
+            f"{self.chunks_written} chunks written, "
+            f"{self.chunks_deleted} deleted, "
+            f"{self.chunks_written / elapsed:.1f} chunks/s, "
+            f"batch size {batch_size}"
+        )
+
+
+def _to_points(batch, vectors, sparse):
+    return [
+        PointStruct(
+            id=chunk_id,
+            vector=(
+                {
+                    "": vector,
+                    SPARSE_VECTOR_NAME: encode_document(chunk.page_content),
+                }
+                if sparse
+                else vector
+            ),
+            payload={
+                CONTENT_KEY: chunk.page_content,
+                METADATA_KEY: chunk.metadata,
+            },
+        )
+        for (_, chunk_id, chunk), vector in zip(batch, vectors)
+    ]
 
-    qdrant = QdrantVectorStore(
-        client=qdrant_client,
+
+def _upsert(qdrant_client, collection_name, batch, vectors, sparse):
+    qdrant_client.upsert(
         collection_name=collection_name,
-        # retrieval_mode=RetrievalMode.SPARSE,
-        sparse_vector_name="sparse",
-        embedding=embedder,
+        points=_to_points(batch, vectors, sparse),
+    )
+    return batch
+
+
+def _delete(qdrant_client, collection_name, point_ids):
+    if point_ids:
+        qdrant_client.delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=list(point_ids)),
+        )
+
+
+def ingest_paths(
+    paths,
+    collection_name="rag_data",
+    host="localhost",
+    vector_size=2560,  # qwen3-embedding-4b embedding size
+    port=6333,
+    workers=None,
+    concurrency=4,
+    batch_size=64,
+    rate_limit_cooldown=5.0,
+    manifest_path=None,
+    prune=False,
+    grpc_port=6334,
+    prefer_grpc=False,
+    quantization=None,
+):
+    """Ingest many documents in parallel into a Qdrant collection.
+
+    Files are parsed and split in a process pool while earlier chunks are
+    already embedded and written, so the stages overlap. Embedding requests
+    and Qdrant upserts each run with at most `concurrency` batches in flight.
+
+    Ingestion is incremental: point IDs are derived from the source and the
+    chunk content, and a manifest remembers the hash and point IDs of every
+    ingested file. Unchanged files are skipped, and for changed files only
+    new chunks are embedded and vanished chunks are deleted.
+
+    Chunks are also written with a BM25 sparse vector for hybrid retrieval
+    if the collection has one. Files ingested before it existed are written
+    again.
+
+    parameters
+    ----------
+    paths : list of str
+        Files, directories (searched for PDFs recursively) or glob patterns.
+    workers : int, optional
+        Processes parsing documents, defaults to the number of CPUs.
+    concurrency : int
+        Maximum number of concurrent embedding requests and upserts.
+    batch_size : int
+        Initial number of chunks per embedding request, adapted on rate
+        limit and transient errors.
+    rate_limit_cooldown : float
+        Seconds without new embedding requests after a rate limit or
+        transient error, see `TRANSIENT_ERRORS`. Failed batches are retried
+        until they succeed, other errors abort the ingestion.
+    manifest_path : str, optional
+        Manifest file, defaults to ".ingest_manifest_<collection>.json".
+    prune : bool
+        Also delete the points of manifest files that no longer exist.
+    grpc_port : int
+        Port of the Qdrant gRPC API.
+    prefer_grpc : bool
+        Upsert over gRPC, which sends the vectors as packed floats instead
+        of JSON text.
+    quantization : str
+        "scalar" or "binary" to create the collection with quantized vectors
+        and on-disk originals, see `quantization_config`. Existing
+        collections are left as they are, see `qdrant_quantize.py`.
+    """
+    files = collect_files(paths)
+    qdrant_client = QdrantClient(
+        host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc
     )
+    created = ensure_collection(
+        qdrant_client, collection_name, vector_size, quantization
+    )
+    sparse = has_sparse_vectors(qdrant_client, collection_name)
+
+    manifest = IngestManifest(
+        manifest_path or f".ingest_manifest_{collection_name}.json"
+    )
+    if created:
+        # Nothing from an earlier manifest is in the new collection
+        manifest.files = {}
+
+    batcher = AdaptiveBatchSize(batch_size)
+    progress = Progress(len(files))
+    # (file, point ID, chunk) waiting to be embedded
+    pending_chunks = deque()
+    # file -> [hash, all point IDs, number of chunks not yet written]
+    in_progress = {}
+    cooldown_until = 0.0
 
-    qdrant.add_documents(documents=chunks)
+    def manifest_entry(file):
+        """Manifest entry of `file`, or None if it must be written again."""
+        entry = manifest.get(file)
+        if entry is not None and sparse and not entry.get("sparse"):
+            return None
+        return entry
 
+    def file_written(file):
+        sha256, point_ids, _ = in_progress.pop(file)
+        manifest.update(file, sha256, point_ids, sparse)
+
+    def record_upserts(futures):
+        for future in futures:
+            batch = future.result()
+            progress.chunks_written += len(batch)
+            for file, _, _ in batch:
+                in_progress[file][2] -= 1
+                if in_progress[file][2] == 0:
+                    file_written(file)
+
+    def file_parsed(file, sha256, chunks):
+        if chunks is None:
+            progress.files_skipped += 1
+            return
+
+        old_ids = set((manifest.get(file) or {"point_ids": []})["point_ids"])
+        # Points without the sparse vector are rewritten, not only new ones
+        written_ids = old_ids if manifest_entry(file) else set()
+        point_ids = {}
+        new_chunks = 0
+        for chunk in chunks:
+            chunk_id = point_id(file, chunk.page_content)
+            if chunk_id not in point_ids and chunk_id not in written_ids:
+                pending_chunks.append((file, chunk_id, chunk))
+                new_chunks += 1
+            point_ids[chunk_id] = None
+        point_ids = list(point_ids)
+
+        stale_ids = old_ids.difference(point_ids)
+        _delete(qdrant_client, collection_name, stale_ids)
+        progress.chunks_deleted += len(stale_ids)
+
+        in_progress[file] = [sha256, point_ids, new_chunks]
+        if new_chunks == 0:
+            file_written(file)
+
+    try:
+        if prune:
+            for file in list(manifest.files):
+                if not os.path.exists(file):
+                    stale_ids = manifest.get(file)["point_ids"]
+                    _delete(qdrant_client, collection_name, stale_ids)
+                    progress.chunks_deleted += len(stale_ids)
+                    manifest.remove(file)
+
+        # A forked process would inherit the open gRPC channel, which gRPC
+        # does not support
+        mp_context = (
+            multiprocessing.get_context("spawn") if prefer_grpc else None
+        )
+        parse_pool = ProcessPoolExecutor(workers, mp_context=mp_context)
+        with parse_pool, ThreadPoolExecutor(
+            concurrency
+        ) as embed_pool, ThreadPoolExecutor(concurrency) as upsert_pool:
+            parse_futures = {
+                parse_pool.submit(
+                    parse_file,
+                    file,
+                    (manifest_entry(file) or {}).get("sha256"),
+                ): file
+                for file in files
+            }
+            embed_futures = {}
+            upsert_futures = set()
+
+            while parse_futures or pending_chunks or embed_futures:
+                # Send full batches (or the remainder once parsing is over)
+                while (
+                    pending_chunks
+                    and len(embed_futures) < concurrency
+                    and time.monotonic() >= cooldown_until
+                    and (
+                        len(pending_chunks) >= batcher.size
+                        or not parse_futures
+                    )
+                ):
+                    size = min(batcher.size, len(pending_chunks))
+                    batch = [pending_chunks.popleft() for _ in range(size)]
+                    future = embed_pool.submit(
+                        embedder.embed_documents,
+                        [chunk.page_content for _, _, chunk in batch],
+                    )
+                    embed_futures[future] = batch
+
+                if not parse_futures and not embed_futures:
+                    # Only chunks waiting for a retry are left
+                    time.sleep(max(0.0, cooldown_until - time.monotonic()))
+                    continue
+
+                done, _ = wait(
+                    [*parse_futures, *embed_futures],
+                    timeout=1.0,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    if future in parse_futures:
+                        file = parse_futures.pop(future)
+                        try:
+                            file_parsed(file, *future.result())
+                        except Exception as exc:
+                            print(f"Skipping '{file}': {exc}")
+                        progress.files_done += 1
+                        continue
+
+                    batch = embed_futures.pop(future)
+                    try:
+                        vectors = future.result()
+                    except TRANSIENT_ERRORS as exc:
+                        # Retry the batch later, in smaller pieces
+                        if not isinstance(exc, RateLimitError):
+                            print(f"Embedding failed, retrying: {exc}")
+                        batcher.rate_limited()
+                        pending_chunks.extendleft(reversed(batch))
+                        cooldown_until = time.monotonic() + rate_limit_cooldown
+                        continue
+                    batcher.success()
+
+                    if len(upsert_futures) >= concurrency:
+                        finished, upsert_futures = wait(
+                            upsert_futures, return_when=FIRST_COMPLETED
+                        )
+                        record_upserts(finished)
+                    upsert_futures.add(
+                        upsert_pool.submit(
+                            _upsert,
+                            qdrant_client,
+                            collection_name,
+                            batch,
+                            vectors,
+                            sparse,
+                        )
+                    )
+
+                progress.report(batcher.size)
+
+            record_upserts(wait(upsert_futures).done)
+    finally:
+        try:
+            # Also if the run failed midway, some points were replaced
+            if progress.chunks_written or progress.chunks_deleted:
+                mark_collection_updated(qdrant_client, collection_name)
+        except Exception as exc:
+            raise RuntimeError(
+                f"Could not write a new version of '{collection_name}', the "
+                "RAG backend serves answers cached before this ingestion "
+                f"until they expire: {exc}"
+            ) from exc
+        finally:
+            # Files written so far are skipped if the run is restarted
+            manifest.save()
+
+    progress.report(batcher.size, force=True)
     print(
-        f"Ingested {len(chunks)} chunks into '{collection_name}' collection."
+        f"Ingested {progress.chunks_written} chunks into "
+        f"'{collection_name}' collection."
+    )
+
+
+def ingest_to_qdrant(
+    file_path: str,
+    collection_name="rag_data",
+    host="localhost",
+    vector_size=2560,  # qwen3-embedding-4b embedding size
+    port=6333,
+    grpc_port=6334,
+    prefer_grpc=False,
+    quantization=None,
+):
+    """Ingest a single document into a Qdrant collection."""
+    ingest_paths(
+        [file_path],
+        collection_name=collection_name,
+        host=host,
+        vector_size=vector_size,
+        port=port,
+        workers=1,
+        grpc_port=grpc_port,
+        prefer_grpc=prefer_grpc,
+        quantization=quantization,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest documents into a Qdrant collection."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="PDF files, directories or glob patterns (quote them).",
+    )
+    parser.add_argument("--collection", default="rag_data")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument(
+        "--grpc-port",
+        type=int,
+        default=int(os.getenv("VECTORDB_GRPC_PORT", 6334)),
+    )
+    parser.add_argument(
+        "--prefer-grpc",
+        action=argparse.BooleanOptionalAction,
+        default=os.getenv("VECTORDB_PREFER_GRPC", "false").lower()
+        in ("1", "true", "yes"),
+        help="Upsert over gRPC (default: $VECTORDB_PREFER_GRPC).",
+    )
+    parser.add_argument("--vector-size", type=int, default=2560)
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATIONS,
+        default=os.getenv("VECTORDB_QUANTIZATION", "none"),
+        help="Quantization of a new collection, with the original vectors "
+        "on disk (default: $VECTORDB_QUANTIZATION or none).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes parsing documents (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Concurrent embedding requests and Qdrant upserts.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="Initial chunks per embedding request.",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Manifest of ingested files "
+        "(default: .ingest_manifest_<collection>.json).",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Delete the points of previously ingested files that are gone.",
+    )
+    args = parser.parse_args()
+
+    ingest_paths(
+        args.paths,
+        collection_name=args.collection,
+        host=args.host,
+        vector_size=args.vector_size,
+        port=args.port,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        manifest_path=args.manifest,
+        prune=args.prune,
+        grpc_port=args.grpc_port,
+        prefer_grpc=args.prefer_grpc,
+        quantization=args.quantization,
     )
 
 
-# Example usage
 if __name__ == "__main__":
-    ingest_to_qdrant("test_data/sample.pdf")
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    CollectionStatus,
+    Disabled,
+    QuantizationSearchParams,
+    QueryRequest,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParamsDiff,
+)
+
+load_dotenv("./.env")
+
+QUANTIZATIONS = ("none", "scalar", "binary")
+
+
+def quantization_config(quantization):
+    """Return the Qdrant quantization of "none", "scalar" or "binary".
+
+    Scalar quantization keeps one byte per dimension (4x smaller than
+    float32), binary quantization one bit (32x smaller). The quantized
+    vectors stay in RAM and are searched first; the float32 originals are
+    only read to rescore the best candidates.
+    """
+    if quantization in (None, "none"):
+        return None
+    if quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if quantization == "binary":
+        return BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=True)
+        )
+    raise ValueError(
+        f"Unknown quantization {quantization!r}, expected one of "
+        f"{', '.join(QUANTIZATIONS)}"
+    )
+
+
+def migrate_collection(qdrant_client, collection_name, quantization):
+    """Switch an existing collection to `quantization` in place.
+
+    With a quantization the original vectors are moved to disk, without
+    one they are loaded back in RAM. Qdrant rebuilds the segments in the
+    background and keeps serving searches meanwhile.
+    """
+    quantized = quantization_config(quantization)
+    vectors = qdrant_client.get_collection(collection_name).config.params
+    # "" is the unnamed dense vector written by the ingestion
+    names = (
+        list(vectors.vectors) if isinstance(vectors.vectors, dict) else [""]
+    )
+    qdrant_client.update_collection(
+        collection_name=collection_name,
+        vectors_config={
+            name: VectorParamsDiff(on_disk=quantized is not None)
+            for name in names
+        },
+        quantization_config=quantized or Disabled.DISABLED,
+    )
+
+
+def wait_optimized(qdrant_client, collection_name, interval=5.0):
+    """Block until Qdrant finished rebuilding the collection."""
+    while True:
+        info = qdrant_client.get_collection(collection_name)
+        if info.status == CollectionStatus.GREEN:
+            return
+        if info.status == CollectionStatus.RED:
+            raise RuntimeError(
+                f"Optimization of '{collection_name}' failed: "
+                f"{info.optimizer_status}"
+            )
+        print(
+            f"Optimizing '{collection_name}': {info.indexed_vectors_count}/"
+            f"{info.points_count} vectors indexed"
+        )
+        time.sleep(interval)
+
+
+def measure_recall(
+    qdrant_client,
+    collection_name,
+    samples=100,
+    k=5,
+    oversampling=None,
+    rescore=True,
+):
+    """Recall@k of the quantized search against an exact float32 search.
+
+    Stored vectors are used as queries; the point itself is left out of
+    both results.
+    """
+    points, _ = qdrant_client.scroll(
+        collection_name, limit=samples * 10, with_vectors=True
+    )
+    points = random.Random(0).sample(points, min(samples, len(points)))
+    if not points:
+        raise ValueError(f"Collection '{collection_name}' is empty")
+
+    def search(params):
+        requests = [
+            QueryRequest(
+                query=(
+                    point.vector.get("", point.vector)
+                    if isinstance(point.vector, dict)
+                    else point.vector
+                ),
+                limit=k + 1,
+                params=params,
+            )
+            for point in points
+        ]
+        responses = qdrant_client.query_batch_points(
+            collection_name, requests=requests
+        )
+        return [
+            [hit.id for hit in response.points if hit.id != point.id][:k]
+            for point, response in zip(points, responses)
+        ]
+
+    exact = search(
+        SearchParams(
+            exact=True, quantization=QuantizationSearchParams(ignore=True)
+        )
+    )
+    approximate = search(
+        SearchParams(
+            quantization=QuantizationSearchParams(
+                rescore=rescore, oversampling=oversampling
+            )
+        )
+    )
+    found = sum(
+        len(set(truth) & set(hits)) for truth, hits in zip(exact, approximate)
+    )
+    return found / max(sum(len(truth) for truth in exact), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Quantize an existing Qdrant collection and check its "
+        "recall."
+    )
+    parser.add_argument("collection")
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATIONS,
+        default=os.getenv("VECTORDB_QUANTIZATION", "binary"),
+        help="Target quantization, none restores float32 vectors in RAM "
+        "(default: $VECTORDB_QUANTIZATION or binary).",
+    )
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument(
+        "--check-only",
+        action="store_true",
+        help="Only measure the recall of the collection as it is.",
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=100,
+        help="Queries of the recall check, 0 to skip it.",
+    )
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument(
+        "--oversampling",
+        type=float,
+        default=float(os.getenv("VECTORDB_OVERSAMPLING", 0)) or None,
+        help="Candidates rescored, as a multiple of k "
+        "(default: $VECTORDB_OVERSAMPLING).",
+    )
+    parser.add_argument(
+        "--rescore",
+        action=argparse.BooleanOptionalAction,
+        default=os.getenv("VECTORDB_RESCORE", "true").lower()
+        in ("1", "true", "yes"),
+        help="Rescore candidates with the original vectors.",
+    )
+    args = parser.parse_args()
+
+    qdrant_client = QdrantClient(host=args.host, port=args.port)
+    if not args.check_only:
+        started = time.perf_counter()
+        migrate_collection(qdrant_client, args.collection, args.quantization)
+        wait_optimized(qdrant_client, args.collection)
+        print(
+            f"Collection '{args.collection}' migrated to "
+            f"{args.quantization} quantization in "
+            f"{time.perf_counter() - started:.1f}s."
+        )
+    if args.samples:
+        recall = measure_recall(
+            qdrant_client,
+            args.collection,
+            samples=args.samples,
+            k=args.k,
+            oversampling=args.oversampling,
+            rescore=args.rescore,
+        )
+        print(f"Recall@{args.k} against exact search: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
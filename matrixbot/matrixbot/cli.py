@@ -5,9 +5,11 @@ from nio import AsyncClient, InviteEvent, LoginResponse, RoomMessageText
 
 from .core.commands import CommandHandler
 from .core.config import bot_config
+from .core.dispatcher import Dispatcher
 from .core.history import RedisHistoryManager
 from .core.logger import Logger
 from .core.matrix_client import MatrixClient
+from .core.metrics import start_metrics_server
 from .core.rag_service import RAGService
 
 logger = Logger(name="RAG Pipeline")
@@ -47,10 +49,18 @@ async def main():
             logger.error(f"Login failed: {resp}")
             return
 
-    matrix_client = MatrixClient(nio_client, bot_config)
+    matrix_client = MatrixClient(nio_client, bot_config, logger)
     history = RedisHistoryManager(bot_config)
     rag = RAGService(bot_config)
     commands = CommandHandler(matrix_client, rag, history, bot_config, logger)
+    dispatcher = Dispatcher(
+        bot_config.max_concurrency, bot_config.max_queue_depth, logger
+    )
+    if bot_config.metrics_port:
+        start_metrics_server(
+            bot_config.metrics_port, dispatcher, history, matrix_client
+        )
+        logger.info(f"Serving metrics on port {bot_config.metrics_port}")
 
     # Joining time of the bot
     join_time = datetime.datetime.now()
@@ -66,19 +76,28 @@ async def main():
         room_id = room.room_id
 
         if message_time > join_time:
+            # Handled in the background, in order per room and user
             if content.startswith(".help"):
-                await commands.handle_help(room_id=room_id)
+                accepted = dispatcher.submit(
+                    (room_id, sender), commands.handle_help, room_id=room_id
+                )
             elif content.startswith(".reset"):
-                await commands.handle_reset(
+                accepted = dispatcher.submit(
+                    (room_id, sender),
+                    commands.handle_reset,
                     room_id=room_id,
                     user_id=sender,
                 )
             else:
-                await commands.handle_ai(
+                accepted = dispatcher.submit(
+                    (room_id, sender),
+                    commands.handle_ai,
                     room_id=room_id,
                     user_id=sender,
                     query=content,
                 )
+            if not accepted:
+                commands.notify_busy(room_id=room_id, user_id=sender)
 
     async def invite_callback(room, event):
         await nio_client.join(room.room_id)
@@ -101,5 +120,11 @@ async def main():
     except (KeyboardInterrupt, asyncio.CancelledError):
         logger.info("Received exit signal, shutting down...")
     finally:
+        await dispatcher.close(bot_config.shutdown_timeout)
+        await commands.close()
+        logger.info("Closing RAG API connections...")
+        await rag.close()
+        await history.close()
         logger.info("Closing Matrix client...")
+        matrix_client.close()
         await nio_client.close()
@@ -1,3 +1,10 @@
+import asyncio
+import time
+
+from .compaction import HistoryCompactor
+from .streaming import StreamingEditor
+
+
 class CommandHandler:
     """Handles commands for the Matrix bot, including AI queries, resets, and
     help requests.
@@ -25,6 +32,22 @@ class CommandHandler:
         self.history_manager = history_manager
         self.config = config
         self.logger = logger
+        self.compactor = (
+            HistoryCompactor(history_manager, rag_service, config, logger)
+            if config.history_compaction
+            else None
+        )
+        # (room, user) -> time of the last busy reply, and replies being sent
+        self._busy_replied = {}
+        self._busy_tasks = set()
+
+    async def close(self):
+        """Stop background work started by the handlers."""
+        for task in self._busy_tasks:
+            task.cancel()
+        await asyncio.gather(*self._busy_tasks, return_exceptions=True)
+        if self.compactor is not None:
+            await self.compactor.close()
 
     async def handle_ai(self, room_id, user_id, query):
         """Process AI-related commands and respond accordingly.
@@ -40,13 +63,71 @@ class CommandHandler:
         """
         await self.history_manager.add(room_id, user_id, "user", query)
         self.logger.info(f"Querying rag with prompt: {query}")
-        chat_history = self.history_manager.get(room_id, user_id)
+        chat_history = await self.history_manager.get(room_id, user_id)
+        summary = None
+        if self.compactor is not None:
+            summary = await self.history_manager.get_summary(room_id, user_id)
 
-        response = await self.rag_service.query_model(
-            query, chat_history, self.logger
-        )
+        if self.config.rag_streaming:
+            response = await self._stream_ai(
+                room_id, query, chat_history, summary
+            )
+            if response is None:
+                return
+        else:
+            response = await self.rag_service.query_model(
+                query, chat_history, self.logger, summary
+            )
+            await self.matrix_client.send_message(room_id, response)
         await self.history_manager.add(room_id, user_id, "assistant", response)
-        await self.matrix_client.send_message(room_id, response)
+
+        if self.compactor is not None:
+            # Off the request path, the reply has already been sent
+            self.compactor.schedule(room_id, user_id)
+
+    async def _stream_ai(self, room_id, query, chat_history, summary=None):
+        """Post a placeholder and edit it while the answer is streamed.
+
+        Returns
+        -------
+        str or None
+            The final formatted response, or None if generation failed.
+        """
+        event_id = await self.matrix_client.send_message(
+            room_id, "_Generating answer..._", return_event_id=True
+        )
+        if event_id is None:
+            return None
+        editor = StreamingEditor(
+            self.matrix_client,
+            room_id,
+            event_id,
+            render=self.rag_service.format_partial,
+            min_interval=self.config.stream_edit_interval,
+            min_chars=self.config.stream_edit_min_chars,
+        )
+
+        answer = ""
+        relevant_docs = []
+        try:
+            async for frame in self.rag_service.stream_model(
+                query, chat_history, self.logger, summary
+            ):
+                if frame["type"] == "token":
+                    answer += frame["content"]
+                    await editor.update(answer)
+                elif frame["type"] == "done":
+                    relevant_docs = frame.get("relevant_docs", [])
+        except Exception as exc:
+            self.logger.error(f"Streaming answer failed: {exc}")
+            await editor.finish(
+                "⚠️ Sorry, something went wrong while generating the answer."
+            )
+            return None
+
+        response = self.rag_service.format_response(answer, relevant_docs)
+        await editor.finish(response)
+        return response
 
     async def handle_reset(self, room_id, user_id):
         """Reset the message history for a specific user in a channel.
@@ -57,11 +138,65 @@ class CommandHandler:
         user_id : str
             User ID of the person who sent the reset command.
         """
+        if self.compactor is not None:
+            self.compactor.cancel(room_id, user_id)
         await self.history_manager.reset(room_id, user_id)
         await self.matrix_client.send_message(
             room_id, f"{user_id} conversation history reset."
         )
 
+    def notify_busy(self, room_id, user_id):
+        """Send `handle_busy` in the background, at most once per
+        `busy_reply_interval` seconds to a user in a room.
+
+        Messages are only refused under overload, when sending waits longest
+        on the outbound rate limit; the event callback must not wait for it.
+
+        Parameters
+        ----------
+        room_id : str
+            Room ID where the message was sent.
+        user_id : str
+            User ID of the person who sent the message.
+
+        Returns
+        -------
+        bool
+            True if a reply is sent, False if it was dropped as a repeat.
+        """
+        now = time.monotonic()
+        interval = self.config.busy_reply_interval
+        last = self._busy_replied.get((room_id, user_id))
+        if last is not None and now - last < interval:
+            return False
+        if len(self._busy_replied) > 1000:
+            self._busy_replied = {
+                key: sent
+                for key, sent in self._busy_replied.items()
+                if now - sent < interval
+            }
+        self._busy_replied[(room_id, user_id)] = now
+        task = asyncio.create_task(self.handle_busy(room_id, user_id))
+        self._busy_tasks.add(task)
+        task.add_done_callback(self._busy_tasks.discard)
+        return True
+
+    async def handle_busy(self, room_id, user_id):
+        """Tell a user that their earlier messages are still being handled.
+
+        Parameters
+        ----------
+        room_id : str
+            Room ID where the message was sent.
+        user_id : str
+            User ID of the person who sent the message.
+        """
+        await self.matrix_client.send_message(
+            room_id,
+            f"{user_id} I am still working on your previous messages, "
+            "please send this one again in a moment.",
+        )
+
     async def handle_help(self, room_id):
         """Display the help menu with available commands.
         Parameters
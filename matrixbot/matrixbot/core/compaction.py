@@ -0,0 +1,92 @@
+import asyncio
+
+
+def estimate_tokens(messages):
+    """Rough token count of messages (about four characters per token)."""
+    return sum(len(message["content"]) // 4 + 4 for message in messages)
+
+
+class HistoryCompactor:
+    """Folds old conversation turns into a running summary in the background.
+
+    After a reply has been sent, `schedule` checks the history of the user
+    and, if it exceeds the token threshold, asks the RAG API to fold all but
+    the most recent turns into the stored summary. Queries then carry the
+    summary and the recent turns only, so their size stays bounded however
+    long the conversation runs.
+
+    Parameters
+    ----------
+    history_manager : RedisHistoryManager
+        Storage of the history and the summary.
+    rag_service : RAGService
+        Service summarizing the messages.
+    config : Config
+        Configuration with the compaction threshold and kept turns.
+    logger : Logger
+        Logger instance for logging information and errors.
+    """
+
+    def __init__(self, history_manager, rag_service, config, logger):
+        self.history_manager = history_manager
+        self.rag_service = rag_service
+        self.threshold_tokens = config.compaction_threshold_tokens
+        self.keep_messages = 2 * config.compaction_keep_turns
+        self.logger = logger
+        # (room_id, user_id) -> running compaction task
+        self._tasks = {}
+
+    def schedule(self, room_id, user_id):
+        """Start compacting the history of a user unless already running."""
+        key = (room_id, user_id)
+        if key in self._tasks:
+            return
+        task = asyncio.create_task(self._compact(room_id, user_id))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    async def _compact(self, room_id, user_id):
+        try:
+            history, offset = await self.history_manager.get_with_offset(
+                room_id, user_id
+            )
+            if estimate_tokens(history) <= self.threshold_tokens:
+                return
+            old_messages = history[: -self.keep_messages or None]
+            if not old_messages:
+                return
+
+            summary = await self.history_manager.get_summary(room_id, user_id)
+            summary = await self.rag_service.summarize(
+                summary, old_messages, self.logger
+            )
+            compacted = await self.history_manager.compact(
+                room_id, user_id, summary, offset, len(old_messages)
+            )
+            if not compacted:
+                # Messages were dropped or reset while summarizing
+                self.logger.info(
+                    f"Skipped compaction of {user_id} in {room_id}, "
+                    "the history changed"
+                )
+                return
+            self.logger.info(
+                f"Compacted {len(old_messages)} messages of {user_id} "
+                f"in {room_id}"
+            )
+        except Exception as exc:
+            # The history is left as is and compacted after the next reply
+            self.logger.error(f"History compaction failed: {exc}")
+
+    def cancel(self, room_id, user_id):
+        """Cancel the running compaction of a user, if any."""
+        task = self._tasks.get((room_id, user_id))
+        if task is not None:
+            task.cancel()
+
+    async def close(self):
+        """Cancel running compactions, they are retried on the next turn."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
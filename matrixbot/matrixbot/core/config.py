@@ -24,12 +24,83 @@ class Config:
         self.rag_api_key = os.getenv("RAG_API_KEY")
         self.rag_model = os.getenv("RAG_MODEL")
         self.history_size = int(os.getenv("HISTORY_SIZE", 30))
+        self.rag_stream_url = os.getenv(
+            "RAG_STREAM_API_URL", f"{self.rag_api_url}/stream"
+        )
+        self.rag_streaming = os.getenv("RAG_STREAMING", "true").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+        # RAG API connection pool, timeouts (seconds) and retries
+        self.rag_connect_timeout = float(os.getenv("RAG_CONNECT_TIMEOUT", 5))
+        self.rag_read_timeout = float(os.getenv("RAG_READ_TIMEOUT", 300))
+        self.rag_max_connections = int(os.getenv("RAG_MAX_CONNECTIONS", 20))
+        self.rag_max_retries = int(os.getenv("RAG_MAX_RETRIES", 3))
+        self.rag_retry_backoff = float(os.getenv("RAG_RETRY_BACKOFF", 0.5))
+        # Progressive edits are coalesced: a new edit is sent only when both
+        # the interval (seconds) has elapsed and enough new characters arrived
+        self.stream_edit_interval = float(
+            os.getenv("STREAM_EDIT_INTERVAL", 1.5)
+        )
+        self.stream_edit_min_chars = int(
+            os.getenv("STREAM_EDIT_MIN_CHARS", 80)
+        )
+
+        # Outbound messages per second and bursts, over all rooms and per room
+        self.matrix_send_rate = float(os.getenv("MATRIX_SEND_RATE", 5))
+        self.matrix_send_burst = int(os.getenv("MATRIX_SEND_BURST", 10))
+        self.matrix_room_send_rate = float(
+            os.getenv("MATRIX_ROOM_SEND_RATE", 1)
+        )
+        self.matrix_room_send_burst = int(
+            os.getenv("MATRIX_ROOM_SEND_BURST", 3)
+        )
+        self.matrix_send_retries = int(os.getenv("MATRIX_SEND_RETRIES", 3))
+
+        # Rendered code blocks and edited messages cached, and message length
+        # from which Markdown is rendered in a thread
+        self.markdown_cache_size = int(os.getenv("MARKDOWN_CACHE_SIZE", 256))
+        self.markdown_offload_chars = int(
+            os.getenv("MARKDOWN_OFFLOAD_CHARS", 4000)
+        )
+
+        # Conversations handled concurrently, messages of a user in order
+        self.max_concurrency = int(os.getenv("BOT_MAX_CONCURRENCY", 8))
+        self.max_queue_depth = int(os.getenv("BOT_MAX_QUEUE_DEPTH", 3))
+        self.shutdown_timeout = float(os.getenv("BOT_SHUTDOWN_TIMEOUT", 30))
+        # Seconds during which further busy replies to a user are dropped
+        self.busy_reply_interval = float(
+            os.getenv("BOT_BUSY_REPLY_INTERVAL", 30)
+        )
+        # Port of the Prometheus metrics server, 0 disables it
+        self.metrics_port = int(os.getenv("BOT_METRICS_PORT", 0))
 
         # User history (Redis)
         self.redis_host = os.getenv("REDIS_HOST")
         self.redis_port = int(os.getenv("REDIS_PORT"))
         self.redis_db = int(os.getenv("REDIS_DB"))
         self.redis_history_size = int(os.getenv("REDIS_HISTORY_SIZE_PER_USER"))
+        self.redis_max_connections = int(
+            os.getenv("REDIS_MAX_CONNECTIONS", 10)
+        )
+        # Histories of recently active users kept in memory
+        self.history_cache_size = int(os.getenv("HISTORY_CACHE_SIZE", 1000))
+        # Opt-in compaction: once the history exceeds the token threshold,
+        # all but the most recent turns are folded into a running summary
+        self.history_compaction = os.getenv(
+            "HISTORY_COMPACTION", "false"
+        ).lower() in ("1", "true", "yes")
+        self.compaction_threshold_tokens = int(
+            os.getenv("HISTORY_COMPACTION_TOKENS", 2000)
+        )
+        self.compaction_keep_turns = int(
+            os.getenv("HISTORY_COMPACTION_KEEP_TURNS", 3)
+        )
+        self.rag_summarize_url = os.getenv(
+            "RAG_SUMMARIZE_API_URL",
+            f"{(self.rag_api_url or '').rsplit('/', 1)[0]}/summarize",
+        )
 
         # Login credentials (saved after first login for reuse)
         self.access_token = None
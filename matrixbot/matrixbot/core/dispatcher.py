@@ -0,0 +1,92 @@
+import asyncio
+
+from .metrics import HANDLERS_IN_FLIGHT, MESSAGES
+
+
+class Dispatcher:
+    """Runs message handlers concurrently across conversations.
+
+    Every conversation (room and user) has its own queue and worker, so the
+    messages of a user are handled one after the other in arrival order,
+    while different conversations proceed in parallel. A global semaphore
+    caps the number of handlers running at once, i.e. the number of
+    in-flight RAG backend calls.
+
+    Parameters
+    ----------
+    max_concurrency : int
+        Maximum number of handlers running at the same time.
+    max_queue_depth : int
+        Maximum number of messages waiting per conversation.
+    logger : Logger
+        Logger instance for logging information and errors.
+    """
+
+    def __init__(self, max_concurrency, max_queue_depth, logger):
+        self.max_queue_depth = max_queue_depth
+        self.logger = logger
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # conversation key -> (queue of pending calls, worker task)
+        self._conversations = {}
+        self._closing = False
+
+    def submit(self, key, handler, *args, **kwargs):
+        """Queue `handler(*args, **kwargs)` in the conversation `key`.
+
+        Returns False without queuing if the conversation already has
+        `max_queue_depth` messages waiting or the dispatcher is closing.
+        """
+        if self._closing:
+            MESSAGES.labels("rejected").inc()
+            return False
+        if key not in self._conversations:
+            queue = asyncio.Queue(self.max_queue_depth)
+            worker = asyncio.create_task(self._work(key, queue))
+            self._conversations[key] = (queue, worker)
+        queue, _ = self._conversations[key]
+        try:
+            queue.put_nowait((handler, args, kwargs))
+        except asyncio.QueueFull:
+            MESSAGES.labels("rejected").inc()
+            return False
+        MESSAGES.labels("queued").inc()
+        return True
+
+    async def _work(self, key, queue):
+        while True:
+            try:
+                handler, args, kwargs = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                # Nothing can be queued between the check and the removal
+                del self._conversations[key]
+                return
+            async with self._semaphore:
+                try:
+                    with HANDLERS_IN_FLIGHT.track_inprogress():
+                        await handler(*args, **kwargs)
+                except Exception as exc:
+                    self.logger.error(
+                        f"Handling message in {key} failed: {exc}"
+                    )
+
+    def pending(self):
+        """Return the number of messages waiting over all conversations."""
+        return sum(q.qsize() for q, _ in self._conversations.values())
+
+    async def close(self, timeout=30.0):
+        """Stop accepting messages and let queued ones finish.
+
+        Handlers still running after `timeout` seconds are cancelled.
+        """
+        self._closing = True
+        workers = [worker for _, worker in self._conversations.values()]
+        if not workers:
+            return
+        self.logger.info(
+            f"Draining {len(workers)} conversations "
+            f"({self.pending()} messages waiting)..."
+        )
+        _, unfinished = await asyncio.wait(workers, timeout=timeout)
+        for worker in unfinished:
+            worker.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
@@ -1,45 +1,209 @@
+import asyncio
 import json
+from collections import OrderedDict
 
-import redis
+import redis.asyncio as redis
+
+from .metrics import stage
 
 
 class RedisHistoryManager:
-    """Manages conversation history using Redis for persistence."""
+    """Manages conversation history using Redis for persistence.
+
+    Redis is accessed asynchronously through a connection pool, and every
+    read or write of a message is a single pipelined round trip. The
+    histories and summaries of recently active users are also kept in a
+    bounded in-process cache that is updated on every write, so reading the
+    history of an active conversation costs no round trip. The cache is only
+    consistent with Redis if a single bot instance writes these keys; several
+    instances sharing a Redis database would serve each other stale
+    histories and are not supported.
+
+    A counter of the messages ever added to a history gives the position of
+    its first message, which changes whenever messages are trimmed, compacted
+    or reset. Compaction only applies if that position is unchanged.
+    """
 
     def __init__(self, config):
-        self.redis_client = redis.StrictRedis(
-            host=config.redis_host,
-            port=config.redis_port,
-            db=config.redis_db,
-            decode_responses=True,
+        self.redis_client = redis.Redis(
+            connection_pool=redis.ConnectionPool(
+                host=config.redis_host,
+                port=config.redis_port,
+                db=config.redis_db,
+                decode_responses=True,
+                max_connections=config.redis_max_connections,
+            )
         )
         self.history_size = config.redis_history_size
+        self.cache_size = config.history_cache_size
+        # (room_id, user_id) -> {"messages": [...], "summary": str or None,
+        #                        "offset": position of the first message}
+        self._cache = OrderedDict()
+        # Writes of one user are applied to Redis and the cache in order
+        self._locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def close(self):
+        """Close the pooled connections to Redis."""
+        await self.redis_client.aclose()
 
     def _get_history_key(self, room_id, user_id):
         """Generates a unique Redis key for a user's history."""
         return f"history:{room_id}:{user_id}"
 
-    def get(self, room_id, user_id):
+    def _get_summary_key(self, room_id, user_id):
+        """Generates the Redis key of a user's conversation summary."""
+        return f"summary:{room_id}:{user_id}"
+
+    def _get_added_key(self, room_id, user_id):
+        """Generates the Redis key counting the messages ever added."""
+        return f"history_added:{room_id}:{user_id}"
+
+    def _lock(self, key):
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+        return entry
+
+    def _remember(self, key, messages, summary, added):
+        self._cache[key] = {
+            "messages": [json.loads(msg) for msg in messages],
+            "summary": summary,
+            "offset": int(added or 0) - len(messages),
+        }
+        entry = self._cache[key]
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            evicted, _ = self._cache.popitem(last=False)
+            lock = self._locks.get(evicted)
+            if lock is not None and not lock.locked():
+                del self._locks[evicted]
+        return entry
+
+    async def _load(self, room_id, user_id):
+        """Return the cache entry of a user, reading Redis on a miss."""
+        key = (room_id, user_id)
+        entry = self._cached(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        # A write finishing during the read would be overwritten by it
+        async with self._lock(key):
+            entry = self._cached(key)
+            if entry is not None:
+                return entry
+            with stage("history_get").time():
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.lrange(self._get_history_key(room_id, user_id), 0, -1)
+                pipe.get(self._get_summary_key(room_id, user_id))
+                pipe.get(self._get_added_key(room_id, user_id))
+                messages, summary, added = await pipe.execute()
+            return self._remember(key, messages, summary, added)
+
+    async def get(self, room_id, user_id):
         """Retrieve the conversation history for a user."""
-        key = self._get_history_key(room_id, user_id)
-        # LTRIM keeps the list at the specified history_size
-        self.redis_client.ltrim(key, -self.history_size, -1)
-        # LPUSH pushes new items to the left, so we need to reverse
-        # the list when we retrieve it to get chronological order.
-        history = [
-            json.loads(msg) for msg in self.redis_client.lrange(key, 0, -1)
-        ]
-        return history
+        entry = await self._load(room_id, user_id)
+        return list(entry["messages"])
+
+    async def get_summary(self, room_id, user_id):
+        """Retrieve the summary of the compacted history, or None."""
+        entry = await self._load(room_id, user_id)
+        return entry["summary"]
+
+    async def get_with_offset(self, room_id, user_id):
+        """Retrieve the history and the position of its first message.
+
+        The position is passed back to `compact`, which only applies if the
+        history still starts at the same message.
+        """
+        entry = await self._load(room_id, user_id)
+        return list(entry["messages"]), entry["offset"]
 
     async def reset(self, room_id, user_id):
-        """Clear the history for a user."""
-        key = self._get_history_key(room_id, user_id)
-        self.redis_client.delete(key)
+        """Clear the history for a user.
+
+        The counter of added messages is kept, so that a compaction of the
+        former history does not apply to the new one.
+        """
+        key = (room_id, user_id)
+        async with self._lock(key):
+            await self.redis_client.delete(
+                self._get_history_key(room_id, user_id),
+                self._get_summary_key(room_id, user_id),
+            )
+            self._cache.pop(key, None)
 
     async def add(self, room_id, user_id, role, content):
-        """Add a message to the history."""
-        key = self._get_history_key(room_id, user_id)
-        message = json.dumps({"role": role, "content": content})
-        self.redis_client.rpush(key, message)
-        # Trim the list to ensure we don't exceed the history size
-        self.redis_client.ltrim(key, -self.history_size, -1)
+        """Add a message to the history.
+
+        Appending and trimming are one atomic transaction. If the history
+        is not cached yet, it is read back in the same round trip.
+        """
+        key = (room_id, user_id)
+        history_key = self._get_history_key(room_id, user_id)
+        message = {"role": role, "content": content}
+        async with self._lock(key):
+            entry = self._cached(key)
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.rpush(history_key, json.dumps(message))
+            # Trim the list to ensure we don't exceed the history size
+            pipe.ltrim(history_key, -self.history_size, -1)
+            pipe.incr(self._get_added_key(room_id, user_id))
+            if entry is None:
+                pipe.lrange(history_key, 0, -1)
+                pipe.get(self._get_summary_key(room_id, user_id))
+            with stage("history_add").time():
+                results = await pipe.execute()
+
+            if entry is None:
+                self._remember(key, results[3], results[4], results[2])
+            else:
+                entry["messages"].append(message)
+                del entry["messages"][: -self.history_size]
+                entry["offset"] = results[2] - len(entry["messages"])
+
+    async def compact(self, room_id, user_id, summary, offset, count):
+        """Replace the `count` oldest messages by a new summary.
+
+        `offset` is the position of the first message when the summarized
+        messages were read. Messages added meanwhile are appended at the end
+        of the list, but if the history was trimmed, compacted or reset
+        since, it no longer starts at `offset` and nothing is changed.
+
+        Returns
+        -------
+        bool
+            Whether the history was compacted.
+        """
+        key = (room_id, user_id)
+        history_key = self._get_history_key(room_id, user_id)
+        added_key = self._get_added_key(room_id, user_id)
+        async with self._lock(key):
+            # The lock keeps the history unchanged between check and trim
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.get(added_key)
+            pipe.llen(history_key)
+            added, length = await pipe.execute()
+            if int(added or 0) - length != offset:
+                return False
+
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.set(self._get_summary_key(room_id, user_id), summary)
+            pipe.ltrim(history_key, count, -1)
+            await pipe.execute()
+
+            entry = self._cached(key)
+            if entry is not None and entry["offset"] == offset:
+                del entry["messages"][:count]
+                entry["summary"] = summary
+                entry["offset"] += count
+            else:
+                self._cache.pop(key, None)
+            return True
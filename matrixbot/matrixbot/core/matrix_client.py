@@ -1,13 +1,31 @@
-import asyncio
-
-from markdown import markdown
 from nio import AsyncClient
 
+from .metrics import stage
+from .outbox import OutboundScheduler
+from .renderer import MarkdownRenderer
+
 
 class MatrixClient:
-    def __init__(self, client: AsyncClient, config):
+    def __init__(self, client: AsyncClient, config, logger):
         self.client = client
         self.config = config
+        self.outbox = OutboundScheduler(
+            client,
+            logger,
+            rate=config.matrix_send_rate,
+            burst=config.matrix_send_burst,
+            room_rate=config.matrix_room_send_rate,
+            room_burst=config.matrix_room_send_burst,
+            max_retries=config.matrix_send_retries,
+        )
+        self.renderer = MarkdownRenderer(
+            cache_size=config.markdown_cache_size,
+            offload_chars=config.markdown_offload_chars,
+        )
+
+    def close(self):
+        """Stop the rendering threads."""
+        self.renderer.close()
 
     async def send_message(self, room_id, message, return_event_id=False):
         """Send a markdown-formatted message.
@@ -18,35 +36,29 @@ class MatrixClient:
             Room ID to send the message to.
         message : str
             Plaintext message.
+        return_event_id : bool
+            Return the event ID of the sent message (None if sending
+            failed).
         """
-        markdown_format = markdown(
-            message,
-            extensions=[
-                "extra",
-                "fenced_code",
-                "nl2br",
-                "sane_lists",
-                "tables",
-                "codehilite",
-                "md_in_html",
-            ],
-        )
-        response = await self.client.room_send(
-            room_id=room_id,
-            message_type="m.room.message",
-            content={
-                "msgtype": "m.text",
-                "format": "org.matrix.custom.html",
-                "body": message,
-                "formatted_body": markdown_format,
-            },
-        )
+        with stage("render").time():
+            markdown_format = await self.renderer.render(message)
+        with stage("matrix_send").time():
+            response = await self.outbox.send(
+                room_id,
+                {
+                    "msgtype": "m.text",
+                    "format": "org.matrix.custom.html",
+                    "body": message,
+                    "formatted_body": markdown_format,
+                },
+            )
 
-        await asyncio.sleep(1)
         if return_event_id:
-            return response.event_id
+            return getattr(response, "event_id", None)
 
-    async def edit_message(self, room_id, event_id, new_message):
+    async def edit_message(
+        self, room_id, event_id, new_message, partial=False
+    ):
         """Replace existing message based on event_id.
 
         Parameters
@@ -57,23 +69,24 @@ class MatrixClient:
             Message ID that needs to be replaced.
         new_message : str
             Plaintext/makdown message.
+        partial : bool
+            Intermediate version of a message that is still generated. It
+            is rendered incrementally and only queued, a later edit of the
+            same message replaces it if it was not sent yet.
         """
-        markdown_format = markdown(
-            new_message,
-            extensions=[
-                "extra",
-                "fenced_code",
-                "nl2br",
-                "sane_lists",
-                "tables",
-                "codehilite",
-            ],
-        )
+        with stage("render").time():
+            if partial:
+                markdown_format = await self.renderer.render(
+                    new_message, key=event_id
+                )
+            else:
+                self.renderer.forget(event_id)
+                markdown_format = await self.renderer.render(new_message)
 
-        await self.client.room_send(
-            room_id=room_id,
-            message_type="m.room.message",
-            content={
+        sent = self.outbox.edit(
+            room_id,
+            event_id,
+            {
                 "msgtype": "m.text",
                 "body": new_message,
                 "format": "org.matrix.custom.html",
@@ -90,3 +103,6 @@ class MatrixClient:
                 },
             },
         )
+        if not partial:
+            with stage("matrix_edit").time():
+                await sent
@@ -0,0 +1,122 @@
+from prometheus_client import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    start_http_server,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+STAGE_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "matrixbot_stage_seconds",
+    "Time spent in each stage of answering a message.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+HANDLERS_IN_FLIGHT = Gauge(
+    "matrixbot_handlers_in_flight", "Messages being handled."
+)
+MESSAGES = Counter(
+    "matrixbot_messages",
+    "Messages received, by whether they were queued or rejected as busy.",
+    ["outcome"],
+)
+ANSWER_TOKENS = Counter(
+    "matrixbot_answer_tokens", "Answer tokens streamed from the RAG API."
+)
+
+
+def stage(name):
+    """Return the histogram of stage `name`, e.g. to use
+    ``with stage("render").time():``.
+    """
+    return STAGE_SECONDS.labels(name)
+
+
+class StatsCollector:
+    """Exposes counters the components keep anyway at scrape time.
+
+    Parameters
+    ----------
+    dispatcher : Dispatcher
+        Dispatcher whose waiting messages are reported.
+    history_manager : RedisHistoryManager
+        History storage with its cache hit counts.
+    matrix_client : MatrixClient
+        Client with the Markdown renderer and the outbound scheduler.
+    """
+
+    def __init__(self, dispatcher, history_manager, matrix_client):
+        self.dispatcher = dispatcher
+        self.history_manager = history_manager
+        self.matrix_client = matrix_client
+
+    def collect(self):
+        yield GaugeMetricFamily(
+            "matrixbot_messages_waiting",
+            "Messages queued behind an earlier message of the same user.",
+            value=self.dispatcher.pending(),
+        )
+
+        renderer = self.matrix_client.renderer
+        hits = CounterMetricFamily(
+            "matrixbot_cache_hits", "Cache lookups answered.", labels=["cache"]
+        )
+        misses = CounterMetricFamily(
+            "matrixbot_cache_misses", "Cache lookups missed.", labels=["cache"]
+        )
+        hits.add_metric(["history"], self.history_manager.hits)
+        misses.add_metric(["history"], self.history_manager.misses)
+        hits.add_metric(["code_block"], renderer.hits)
+        misses.add_metric(["code_block"], renderer.misses)
+        yield hits
+        yield misses
+
+        outbox = self.matrix_client.outbox
+        yield CounterMetricFamily(
+            "matrixbot_send_retries",
+            "Matrix sends retried after a transient error.",
+            value=outbox.retries,
+        )
+        yield CounterMetricFamily(
+            "matrixbot_rate_limited",
+            "Matrix requests answered with 429 by the homeserver.",
+            value=outbox.rate_limited,
+        )
+
+
+def start_metrics_server(
+    port, dispatcher, history_manager, matrix_client, addr="0.0.0.0"
+):
+    """Serve the metrics for Prometheus on `port` in a background thread.
+
+    Parameters
+    ----------
+    port : int
+        Port of the HTTP server.
+    dispatcher, history_manager, matrix_client
+        Components whose counters are reported, see `StatsCollector`.
+    addr : str
+        Address the server listens on.
+    """
+    REGISTRY.register(
+        StatsCollector(dispatcher, history_manager, matrix_client)
+    )
+    start_http_server(port, addr=addr)
@@ -0,0 +1,187 @@
+import asyncio
+import random
+import time
+import uuid
+from collections import deque
+
+from nio import ErrorResponse
+
+RATE_LIMITED = ("M_LIMIT_EXCEEDED", 429)
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` sends per second, bursts of `burst`.
+
+    `pause` empties the bucket for a while, e.g. when the homeserver asked
+    to retry later.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Job:
+    def __init__(self, content, replaces=None):
+        self.content = content
+        self.replaces = replaces
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class OutboundScheduler:
+    """Sends room messages as fast as the homeserver rate limits allow.
+
+    Every room has a queue sent in order by its own worker, throttled by a
+    per-room token bucket and a token bucket shared by all rooms. When the
+    homeserver answers 429, the shared bucket is paused for the requested
+    ``retry_after_ms``, so the other rooms do not run into the limit too.
+    Sends failing with a server or connection error are retried with the
+    same transaction ID, so the homeserver never stores them twice. An edit
+    of an event whose previous edit is still queued replaces that edit.
+
+    Parameters
+    ----------
+    client : nio.AsyncClient
+        Client sending the events.
+    logger : Logger
+        Logger instance for logging information and errors.
+    rate, burst : float, int
+        Sends per second and burst size over all rooms.
+    room_rate, room_burst : float, int
+        Sends per second and burst size per room.
+    max_retries : int
+        Retries of sends failing with a transient error.
+    """
+
+    def __init__(
+        self,
+        client,
+        logger,
+        rate=5.0,
+        burst=10,
+        room_rate=1.0,
+        room_burst=3,
+        max_retries=3,
+    ):
+        self.client = client
+        self.room_rate = room_rate
+        self.room_burst = room_burst
+        self.max_retries = max_retries
+        self.logger = logger
+        self.bucket = TokenBucket(rate, burst)
+        # room_id -> (queue of jobs, bucket, worker task)
+        self._rooms = {}
+        self.retries = 0
+        self.rate_limited = 0
+        # nio retries 429 responses itself, after calling the callbacks
+        client.add_response_callback(self._on_error, ErrorResponse)
+
+    async def _on_error(self, response):
+        if response.status_code in RATE_LIMITED:
+            self.rate_limited += 1
+            self.bucket.pause((response.retry_after_ms or 5000) / 1000)
+
+    def _enqueue(self, room_id, job):
+        if room_id not in self._rooms:
+            self._rooms[room_id] = (
+                deque(),
+                TokenBucket(self.room_rate, self.room_burst),
+                None,
+            )
+        queue, bucket, worker = self._rooms[room_id]
+        queue.append(job)
+        if worker is None:
+            worker = asyncio.create_task(self._work(room_id))
+            self._rooms[room_id] = (queue, bucket, worker)
+        return job.future
+
+    def send(self, room_id, content):
+        """Queue an `m.room.message` event.
+
+        Returns a future resolving to the nio response (None if sending
+        failed after all retries).
+        """
+        return self._enqueue(room_id, _Job(content))
+
+    def edit(self, room_id, event_id, content):
+        """Queue an edit of `event_id`, merged with a queued earlier edit."""
+        if room_id in self._rooms:
+            for job in self._rooms[room_id][0]:
+                if job.replaces == event_id:
+                    job.content = content
+                    return job.future
+        return self._enqueue(room_id, _Job(content, replaces=event_id))
+
+    async def _work(self, room_id):
+        queue, bucket, _ = self._rooms[room_id]
+        while queue:
+            await bucket.acquire()
+            await self.bucket.acquire()
+            # Edits arriving while waiting were merged into this job
+            job = queue.popleft()
+            response = await self._send(room_id, job.content)
+            if not job.future.done():
+                job.future.set_result(response)
+        del self._rooms[room_id]
+
+    async def _send(self, room_id, content):
+        tx_id = str(uuid.uuid4())
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.room_send(
+                    room_id=room_id,
+                    message_type="m.room.message",
+                    content=content,
+                    tx_id=tx_id,
+                )
+            except Exception as exc:
+                reason = repr(exc)
+            else:
+                if not isinstance(response, ErrorResponse):
+                    return response
+                reason = str(response)
+                if response.status_code in RATE_LIMITED:
+                    self.bucket.pause((response.retry_after_ms or 5000) / 1000)
+                    await self.bucket.acquire()
+                    continue
+                status = getattr(response.transport_response, "status", 0)
+                if status < 500:
+                    break
+
+            if attempt == self.max_retries:
+                break
+            self.retries += 1
+            delay = random.uniform(0, 0.5 * 2**attempt)
+            self.logger.warning(
+                f"Sending to {room_id} failed ({reason}), retrying in "
+                f"{delay:.2f}s ({attempt + 1}/{self.max_retries})"
+            )
+            await asyncio.sleep(delay)
+
+        self.logger.error(f"Sending to {room_id} failed: {reason}")
+        return None
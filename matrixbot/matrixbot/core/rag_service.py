@@ -1,10 +1,29 @@
-import requests
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from .metrics import ANSWER_TOKENS, stage
+
+# Failures where the request never reached the backend, or a gateway in front
+# of it gave up. Answering is side-effect free, so these are safe to retry.
+RETRYABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+)
+RETRYABLE_STATUS_CODES = {502, 503, 504}
 
 
 class RAGService:
     """Service to handle retrieval-augmented generation (RAG) queries. This
     service interacts with a RAG API to generate responses based on user
     prompts and chat history.
+
+    All requests share one keep-alive connection pool, so the backend
+    connection is reused across queries. Call `close` on shutdown.
     Parameters
     ----------
     config : Config
@@ -13,8 +32,59 @@ class RAGService:
 
     def __init__(self, config):
         self.api_url = config.rag_api_url
+        self.stream_url = config.rag_stream_url
+        self.summarize_url = config.rag_summarize_url
         self.rag_api_key = config.rag_api_key
         self.model = config.rag_model
+        self.max_retries = config.rag_max_retries
+        self.retry_backoff = config.rag_retry_backoff
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                config.rag_read_timeout,
+                connect=config.rag_connect_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=config.rag_max_connections,
+                max_keepalive_connections=config.rag_max_connections,
+            ),
+        )
+
+    async def close(self):
+        """Close the pooled connections to the RAG API."""
+        await self.client.aclose()
+
+    async def _send(self, url, payload, headers, logger, stream=False):
+        """POST to the RAG API, retrying retryable failures with jitter.
+
+        Only failures that happened before the backend produced an answer are
+        retried, so a streamed response is never replayed halfway.
+        """
+        for attempt in range(self.max_retries + 1):
+            request = self.client.build_request(
+                "POST", url, json=payload, headers=headers
+            )
+            try:
+                response = await self.client.send(request, stream=stream)
+            except RETRYABLE_ERRORS as exc:
+                if attempt == self.max_retries:
+                    raise
+                reason = repr(exc)
+            else:
+                if (
+                    response.status_code not in RETRYABLE_STATUS_CODES
+                    or attempt == self.max_retries
+                ):
+                    return response
+                reason = f"HTTP {response.status_code}"
+                await response.aclose()
+
+            # Full jitter exponential backoff
+            delay = random.uniform(0, self.retry_backoff * 2**attempt)
+            logger.warning(
+                f"RAG API request failed ({reason}), retrying in "
+                f"{delay:.2f}s ({attempt + 1}/{self.max_retries})"
+            )
+            await asyncio.sleep(delay)
 
     @staticmethod
     def _details_block(drop_head, message):
@@ -42,42 +112,49 @@ class RAGService:
             )
         return "", response_text.strip()
 
-    async def query_model(self, prompt, chat_history, logger):
-        """Query RAG API.
-
-        Parameters
-        ----------
-        prompt : str
-            Latest prompt.
-        chat_history : list
-            Chat history.
-        logger : logging.Logger
-            Logger instance for logging information.
-        Returns
-        -------
-        str
-            Generated answer.
-        """
+    def _payload_and_headers(self, prompt, chat_history, summary=None):
         payload = {
             "model": self.model,
             "prompt": prompt,
             "chat_history": chat_history,
         }
-        headers = {
+        if summary:
+            payload["summary"] = summary
+        return payload, self._headers()
+
+    def _headers(self):
+        return {
             "X-Internal-Token": self.rag_api_key,
             "Content-Type": "application/json",
         }
 
-        response = requests.post(self.api_url, json=payload, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+    @staticmethod
+    def format_partial(answer_text):
+        """Format an answer that is still being generated.
 
-        # async with httpx.AsyncClient() as client:
-        #     resp = await client.post(self.api_url, json=payload)
-        #     resp.raise_for_status()
-        #     data = resp.json()
+        While the model is inside a ``<think>`` block only a progress note is
+        shown, afterwards the answer generated so far.
+        """
+        if "<think>" in answer_text and "</think>" not in answer_text:
+            return "_Thinking..._"
+        _, answer = RAGService._format_reasoning(answer_text)
+        return answer or "_Generating answer..._"
 
-        reasoning_block, answer = self._format_reasoning(data["answer"])
+    def format_response(self, answer_text, relevant_docs):
+        """Format the final answer with reasoning and relevant documents.
+
+        Parameters
+        ----------
+        answer_text : str
+            Raw answer generated by the model.
+        relevant_docs : list
+            Metadata of the documents retrieved for the answer.
+        Returns
+        -------
+        str
+            Markdown/HTML message ready to be sent to the room.
+        """
+        reasoning_block, answer = self._format_reasoning(answer_text)
 
         # Add separators only if blocks exist
         if reasoning_block:
@@ -88,7 +165,7 @@ class RAGService:
         # Collect unique source names from relevant documents
         source_names = set(
             doc.get("source") or doc.get("title") or "Unknown"
-            for doc in data.get("relevant_docs", [])
+            for doc in relevant_docs
         )
 
         # Format the answer with reasoning and relevant documents
@@ -104,3 +181,113 @@ class RAGService:
         return "\n\n\n".join(
             block for block in (reasoning_block, answer, docs_block) if block
         )
+
+    async def query_model(self, prompt, chat_history, logger, summary=None):
+        """Query RAG API.
+
+        Parameters
+        ----------
+        prompt : str
+            Latest prompt.
+        chat_history : list
+            Chat history.
+        logger : logging.Logger
+            Logger instance for logging information.
+        summary : str, optional
+            Summary of the conversation before `chat_history`.
+        Returns
+        -------
+        str
+            Generated answer.
+        """
+        payload, headers = self._payload_and_headers(
+            prompt, chat_history, summary
+        )
+
+        with stage("rag_query").time():
+            response = await self._send(self.api_url, payload, headers, logger)
+            response.raise_for_status()
+            data = response.json()
+
+        return self.format_response(
+            data["answer"], data.get("relevant_docs", [])
+        )
+
+    async def stream_model(self, prompt, chat_history, logger, summary=None):
+        """Query the streaming RAG API and yield its frames.
+
+        Parameters
+        ----------
+        prompt : str
+            Latest prompt.
+        chat_history : list
+            Chat history.
+        logger : logging.Logger
+            Logger instance for logging information.
+        summary : str, optional
+            Summary of the conversation before `chat_history`.
+        Yields
+        ------
+        dict
+            ``{"type": "token", "content": ...}`` frames while the answer is
+            generated, then a single ``{"type": "done", "relevant_docs": ...}``
+            frame.
+        Raises
+        ------
+        RuntimeError
+            If the backend reports an error in the middle of the stream.
+        """
+        payload, headers = self._payload_and_headers(
+            prompt, chat_history, summary
+        )
+
+        started = time.perf_counter()
+        first_token = None
+        response = await self._send(
+            self.stream_url, payload, headers, logger, stream=True
+        )
+        try:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                frame = json.loads(line)
+                if frame["type"] == "error":
+                    logger.error(f"RAG stream failed: {frame['detail']}")
+                    raise RuntimeError(frame["detail"])
+                if frame["type"] == "token":
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                        stage("rag_first_token").observe(first_token - started)
+                    ANSWER_TOKENS.inc()
+                yield frame
+        finally:
+            await response.aclose()
+            stage("rag_stream").observe(time.perf_counter() - started)
+
+    async def summarize(self, summary, messages, logger):
+        """Fold messages into a running conversation summary.
+
+        Parameters
+        ----------
+        summary : str or None
+            Current summary of the conversation.
+        messages : list
+            Messages to add to the summary, oldest first.
+        logger : logging.Logger
+            Logger instance for logging information.
+        Returns
+        -------
+        str
+            Updated summary.
+        """
+        payload = {
+            "model": self.model,
+            "summary": summary,
+            "messages": messages,
+        }
+        response = await self._send(
+            self.summarize_url, payload, self._headers(), logger
+        )
+        response.raise_for_status()
+        return response.json()["summary"]
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import queue
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from markdown import Markdown
+
+EXTENSIONS = [
+    "extra",
+    "fenced_code",
+    "nl2br",
+    "sane_lists",
+    "tables",
+    "codehilite",
+    "md_in_html",
+]
+
+# A complete fenced code block, from its opening to its closing fence
+FENCED_BLOCK = re.compile(
+    r"^(?P<fence>`{3,}|~{3,})[^\n]*\n.*?\n(?P=fence)[ \t]*$",
+    re.MULTILINE | re.DOTALL,
+)
+FENCE = re.compile(r"^(`{3,}|~{3,})")
+# Lines continuing the previous block (indented or list items)
+CONTINUATION = re.compile(r"^(\s|[-*+]\s|\d+[.)]\s)")
+# Reference links, footnotes and abbreviations apply to the whole document
+DOCUMENT_WIDE = re.compile(r"^\s*\*?\[[^\]]+\]:", re.MULTILINE)
+
+
+def split_blocks(text):
+    """Split Markdown into top-level blocks that render independently.
+
+    Blocks are separated by blank lines, except inside fenced code and
+    before indented or list item lines, which may continue a list.
+    """
+    blocks = []
+    current = []
+    in_fence = False
+    after_blank = False
+    for line in text.split("\n"):
+        if (
+            current
+            and after_blank
+            and not in_fence
+            and line.strip()
+            and not CONTINUATION.match(line)
+        ):
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line)
+        if FENCE.match(line):
+            in_fence = not in_fence
+        after_blank = not line.strip()
+    blocks.append("\n".join(current))
+    return blocks
+
+
+class MarkdownRenderer:
+    """Markdown to HTML renderer for the messages of the bot.
+
+    Configured `Markdown` instances are reused from a pool instead of being
+    built for every message. Fenced code blocks are rendered (and syntax
+    highlighted) once and cached by content hash. For a message that is
+    repeatedly edited while it is generated, `render` with a `key` only
+    re-renders the blocks that changed since the previous call, normally
+    the tail. Texts of at least `offload_chars` characters are rendered in a
+    thread pool to keep the event loop responsive.
+
+    Parameters
+    ----------
+    cache_size : int
+        Number of rendered code blocks and edited messages kept.
+    offload_chars : int
+        Length from which rendering is done in a thread.
+    pool_size : int
+        Maximum number of idle `Markdown` instances kept.
+    """
+
+    def __init__(self, cache_size=256, offload_chars=4000, pool_size=4):
+        self.cache_size = cache_size
+        self.offload_chars = offload_chars
+        self._pool = queue.Queue(pool_size)
+        self._lock = threading.Lock()
+        # code block hash -> HTML
+        self._code_blocks = OrderedDict()
+        # message key -> [(block, HTML)] of the previous render
+        self._partials = OrderedDict()
+        # Stands in for cached code blocks while the rest is rendered
+        self._placeholder = f"codeblock{uuid.uuid4().hex}x"
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="markdown"
+        )
+        # Code block cache lookups
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _convert(self, text):
+        try:
+            md = self._pool.get_nowait()
+        except queue.Empty:
+            md = Markdown(extensions=EXTENSIONS)
+        try:
+            return md.convert(text)
+        finally:
+            md.reset()
+            try:
+                self._pool.put_nowait(md)
+            except queue.Full:
+                pass
+
+    def _remember(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def _code_block(self, block):
+        digest = hashlib.sha1(block.encode()).hexdigest()
+        with self._lock:
+            html = self._code_blocks.get(digest)
+        if html is not None:
+            self.hits += 1
+            return html
+        self.misses += 1
+        html = self._convert(block)
+        self._remember(self._code_blocks, digest, html)
+        return html
+
+    def _render(self, text):
+        code_blocks = []
+
+        def stash(match):
+            code_blocks.append(self._code_block(match.group(0)))
+            return f"\n\n{self._placeholder}{len(code_blocks) - 1}\n\n"
+
+        html = self._convert(FENCED_BLOCK.sub(stash, text))
+        for i, code_html in enumerate(code_blocks):
+            html = html.replace(f"<p>{self._placeholder}{i}</p>", code_html)
+        return html
+
+    def _render_incremental(self, key, text):
+        if DOCUMENT_WIDE.search(text):
+            return self._render(text)
+        with self._lock:
+            previous = self._partials.get(key, [])
+        rendered = []
+        for i, block in enumerate(split_blocks(text)):
+            if i < len(previous) and previous[i][0] == block:
+                rendered.append(previous[i])
+            else:
+                rendered.append((block, self._render(block)))
+        self._remember(self._partials, key, rendered)
+        return "\n".join(html for _, html in rendered if html)
+
+    async def render(self, text, key=None):
+        """Render Markdown `text` to HTML.
+
+        Parameters
+        ----------
+        text : str
+            Markdown to render.
+        key : str, optional
+            Identifies a message rendered repeatedly (e.g. its event ID),
+            enabling incremental rendering.
+        """
+        if key is None:
+            func, args = self._render, (text,)
+        else:
+            func, args = self._render_incremental, (key, text)
+        if len(text) < self.offload_chars:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    def forget(self, key):
+        """Drop the incremental state of a message that is final."""
+        with self._lock:
+            self._partials.pop(key, None)
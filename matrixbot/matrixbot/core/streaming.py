@@ -0,0 +1,67 @@
+import time
+
+
+class StreamingEditor:
+    """Progressively update a Matrix message while an answer is streamed.
+
+    Every token would otherwise become an edit event, which floods the
+    homeserver and the clients of everyone in the room. Updates are therefore
+    coalesced: an edit is only sent once at least ``min_interval`` seconds
+    passed since the previous one *and* at least ``min_chars`` new characters
+    arrived. Intermediate edits are queued without waiting for them to be
+    sent, so the outbound scheduler can merge them when the room is rate
+    limited. The final text is always sent by `finish`.
+
+    Parameters
+    ----------
+    matrix_client : MatrixClient
+        Client used to edit the message.
+    room_id : str
+        Room ID of the message.
+    event_id : str
+        Event ID of the placeholder message that is edited.
+    render : callable
+        Turns the raw text accumulated so far into the displayed message. It
+        is only called when an edit is actually sent.
+    min_interval : float
+        Minimum number of seconds between two edits.
+    min_chars : int
+        Minimum number of new characters between two edits.
+    """
+
+    def __init__(
+        self,
+        matrix_client,
+        room_id,
+        event_id,
+        render,
+        min_interval=1.5,
+        min_chars=80,
+    ):
+        self.matrix_client = matrix_client
+        self.room_id = room_id
+        self.event_id = event_id
+        self.render = render
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self._sent_length = 0
+        self._last_edit = time.monotonic()
+
+    async def update(self, text):
+        """Offer the text accumulated so far, editing if the budget allows."""
+        now = time.monotonic()
+        if now - self._last_edit < self.min_interval:
+            return
+        if len(text) - self._sent_length < self.min_chars:
+            return
+        self._sent_length = len(text)
+        self._last_edit = now
+        await self.matrix_client.edit_message(
+            self.room_id, self.event_id, self.render(text), partial=True
+        )
+
+    async def finish(self, message):
+        """Replace the message with its final, fully formatted content."""
+        await self.matrix_client.edit_message(
+            self.room_id, self.event_id, message
+        )
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+
+import fakeredis
+
+from matrixbot.core.compaction import HistoryCompactor
+from matrixbot.core.history import RedisHistoryManager
+
+ROOM, USER = "!room", "@user"
+
+
+class Config:
+    redis_host = "localhost"
+    redis_port = 6379
+    redis_db = 0
+    redis_max_connections = 4
+    redis_history_size = 8
+    history_cache_size = 16
+    compaction_threshold_tokens = 0
+    compaction_keep_turns = 1
+
+
+def history_manager(**settings):
+    config = Config()
+    for name, value in settings.items():
+        setattr(config, name, value)
+    manager = RedisHistoryManager(config)
+    manager.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return manager
+
+
+async def fill(manager, count, prefix="m"):
+    for i in range(count):
+        await manager.add(ROOM, USER, "user", f"{prefix}{i}")
+
+
+async def stored(manager):
+    """History, offset and summary as read back from Redis."""
+    manager._cache.clear()
+    messages, offset = await manager.get_with_offset(ROOM, USER)
+    summary = await manager.get_summary(ROOM, USER)
+    return [m["content"] for m in messages], offset, summary
+
+
+def test_compact_replaces_the_oldest_messages():
+    async def main():
+        manager = history_manager()
+        await fill(manager, 6)
+        _, offset = await manager.get_with_offset(ROOM, USER)
+
+        assert await manager.compact(ROOM, USER, "summary", offset, 4)
+        cached = await manager.get_with_offset(ROOM, USER)
+        assert await stored(manager) == (["m4", "m5"], 4, "summary")
+        assert ([m["content"] for m in cached[0]], cached[1]) == (
+            ["m4", "m5"],
+            4,
+        )
+
+    asyncio.run(main())
+
+
+def test_messages_appended_meanwhile_are_kept():
+    async def main():
+        manager = history_manager()
+        await fill(manager, 6)
+        _, offset = await manager.get_with_offset(ROOM, USER)
+        await fill(manager, 1, prefix="new")
+
+        assert await manager.compact(ROOM, USER, "summary", offset, 4)
+        assert (await stored(manager))[0] == ["m4", "m5", "new0"]
+
+    asyncio.run(main())
+
+
+def test_compact_is_skipped_if_messages_were_trimmed():
+    async def main():
+        manager = history_manager(redis_history_size=6)
+        await fill(manager, 6)
+        _, offset = await manager.get_with_offset(ROOM, USER)
+        # The full history drops its oldest message
+        await fill(manager, 1, prefix="new")
+
+        assert not await manager.compact(ROOM, USER, "summary", offset, 4)
+        messages, _, summary = await stored(manager)
+        assert messages == ["m1", "m2", "m3", "m4", "m5", "new0"]
+        assert summary is None
+
+    asyncio.run(main())
+
+
+def test_compact_is_skipped_after_a_reset():
+    async def main():
+        manager = history_manager()
+        await fill(manager, 6)
+        _, offset = await manager.get_with_offset(ROOM, USER)
+        await manager.reset(ROOM, USER)
+        await fill(manager, 6, prefix="r")
+
+        assert not await manager.compact(ROOM, USER, "summary", offset, 4)
+        messages, _, summary = await stored(manager)
+        assert messages == [f"r{i}" for i in range(6)]
+        assert summary is None
+
+    asyncio.run(main())
+
+
+class SlowSummarizer:
+    def __init__(self, during=None):
+        self.during = during
+
+    async def summarize(self, summary, messages, logger):
+        if self.during is not None:
+            await self.during()
+        await asyncio.sleep(0.01)
+        return f"summary of {len(messages)}"
+
+
+async def compact_in_background(manager, summarizer):
+    compactor = HistoryCompactor(
+        manager, summarizer, Config(), logging.getLogger("test")
+    )
+    compactor.schedule(ROOM, USER)
+    await asyncio.gather(*compactor._tasks.values())
+    return compactor
+
+
+def test_compactor_keeps_the_recent_turns():
+    async def main():
+        manager = history_manager()
+        await fill(manager, 6)
+        await compact_in_background(manager, SlowSummarizer())
+        assert await stored(manager) == (["m4", "m5"], 4, "summary of 4")
+
+    asyncio.run(main())
+
+
+def test_compactor_skips_a_history_trimmed_while_summarizing():
+    async def main():
+        manager = history_manager(redis_history_size=6)
+        await fill(manager, 6)
+        await compact_in_background(
+            manager, SlowSummarizer(lambda: fill(manager, 3, prefix="new"))
+        )
+        messages, _, summary = await stored(manager)
+        assert messages == ["m3", "m4", "m5", "new0", "new1", "new2"]
+        assert summary is None
+
+    asyncio.run(main())
+
+
+def test_cancelled_compaction_leaves_the_history_alone():
+    async def main():
+        manager = history_manager()
+        await fill(manager, 6)
+        compactor = HistoryCompactor(
+            manager, SlowSummarizer(), Config(), logging.getLogger("test")
+        )
+        compactor.schedule(ROOM, USER)
+        await asyncio.sleep(0)
+        compactor.cancel(ROOM, USER)
+        await asyncio.gather(
+            *compactor._tasks.values(), return_exceptions=True
+        )
+        messages, _, summary = await stored(manager)
+        assert messages == [f"m{i}" for i in range(6)]
+        assert summary is None
+
+    asyncio.run(main())
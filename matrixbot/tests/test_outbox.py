@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+from nio import RoomSendError, RoomSendResponse
+
+from matrixbot.core import outbox
+from matrixbot.core.outbox import OutboundScheduler, TokenBucket
+
+
+class FakeClient:
+    """Records the sent events, answering with queued error responses."""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.sent = []
+        # room_id -> time of the last send
+        self.times = {}
+        self.errors = list(errors)
+        self.delay = delay
+
+    def add_response_callback(self, callback, response_type):
+        pass
+
+    async def room_send(self, room_id, message_type, content, tx_id):
+        await asyncio.sleep(self.delay)
+        self.sent.append((room_id, content, tx_id))
+        self.times[room_id] = time.monotonic()
+        if self.errors:
+            return self.errors.pop(0)
+        return RoomSendResponse(f"$event{len(self.sent)}", room_id)
+
+
+def scheduler(client, **kwargs):
+    options = dict(rate=1000, burst=1000, room_rate=1000, room_burst=1000)
+    options.update(kwargs)
+    return OutboundScheduler(client, logging.getLogger("test"), **options)
+
+
+def server_error(status):
+    error = RoomSendError("unavailable", status_code="M_UNKNOWN")
+    error.transport_response = SimpleNamespace(status=status)
+    return error
+
+
+def test_token_bucket_allows_bursts_then_the_rate():
+    async def main():
+        bucket = TokenBucket(rate=50, burst=3)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        assert time.monotonic() - started < 0.01
+        for _ in range(2):
+            await bucket.acquire()
+        assert time.monotonic() - started >= 0.035
+
+    asyncio.run(main())
+
+
+def test_paused_bucket_waits():
+    async def main():
+        bucket = TokenBucket(rate=1000, burst=10)
+        bucket.pause(0.05)
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.045
+
+    asyncio.run(main())
+
+
+def test_messages_of_a_room_are_sent_in_order():
+    async def main():
+        client = FakeClient(delay=0.001)
+        out = scheduler(client)
+        futures = [out.send("!room", {"body": str(i)}) for i in range(5)]
+        responses = await asyncio.gather(*futures)
+        assert [c["body"] for _, c, _ in client.sent] == list("01234")
+        assert all(isinstance(r, RoomSendResponse) for r in responses)
+
+    asyncio.run(main())
+
+
+def test_queued_edits_of_an_event_are_merged():
+    async def main():
+        client = FakeClient(delay=0.01)
+        out = scheduler(client)
+        first = out.send("!room", {"body": "reply"})
+        edits = [
+            out.edit("!room", "$reply", {"body": f"edit {i}"})
+            for i in range(3)
+        ]
+        await asyncio.gather(first, *edits)
+        assert [c["body"] for _, c, _ in client.sent] == ["reply", "edit 2"]
+
+    asyncio.run(main())
+
+
+def test_server_errors_are_retried_with_the_same_transaction(monkeypatch):
+    monkeypatch.setattr(outbox.random, "uniform", lambda low, high: 0)
+
+    async def main():
+        client = FakeClient(errors=[server_error(502), server_error(503)])
+        out = scheduler(client)
+        response = await out.send("!room", {"body": "hi"})
+        assert isinstance(response, RoomSendResponse)
+        assert len(client.sent) == 3
+        assert len({tx_id for _, _, tx_id in client.sent}) == 1
+        assert out.retries == 2
+
+    asyncio.run(main())
+
+
+def test_client_errors_are_not_retried():
+    async def main():
+        client = FakeClient(errors=[server_error(403)])
+        out = scheduler(client)
+        assert await out.send("!room", {"body": "hi"}) is None
+        assert len(client.sent) == 1
+
+    asyncio.run(main())
+
+
+def test_rate_limits_pause_every_room():
+    async def main():
+        limited = RoomSendError(
+            "slow down", status_code="M_LIMIT_EXCEEDED", retry_after_ms=50
+        )
+        client = FakeClient(errors=[limited])
+        out = scheduler(client)
+        started = time.monotonic()
+        first = out.send("!a", {"body": "a"})
+        await asyncio.sleep(0.01)
+        # Sent after the pause although its room has tokens left
+        second = out.send("!b", {"body": "b"})
+        await asyncio.gather(first, second)
+        assert client.times["!b"] - started >= 0.045
+        assert out.retries == 0
+        assert len(client.sent) == 3
+
+    asyncio.run(main())
@@ -32,14 +32,36 @@ if [ "$collection_status" -eq 200 ]; then
 else
   echo "Collection '$VECTORDB_COLLECTION' not found. Creating it now..."
 
+  # Quantized vectors stay in RAM, the original ones are moved to disk
+  case "${VECTORDB_QUANTIZATION:-none}" in
+    scalar)
+      on_disk=true
+      quantization=',"quantization_config": {"scalar": {"type": "int8", "quantile": 0.99, "always_ram": true}}'
+      ;;
+    binary)
+      on_disk=true
+      quantization=',"quantization_config": {"binary": {"always_ram": true}}'
+      ;;
+    *)
+      on_disk=false
+      quantization=''
+      ;;
+  esac
+
   # Create the collection with an empty body
   curl -X PUT "http://qdrant_db:6333/collections/$VECTORDB_COLLECTION" \
     --header "Content-Type: application/json" \
     --data-raw '{
       "vectors": {
         "size": '"$VECTORDB_VECTOR_SIZE"',
-        "distance": "'"$VECTORDB_DISTANCE"'"
-      }
+        "distance": "'"$VECTORDB_DISTANCE"'",
+        "on_disk": '"$on_disk"'
+      },
+      "sparse_vectors": {
+        "'"${VECTORDB_SPARSE_NAME:-sparse}"'": {
+          "modifier": "idf"
+        }
+      }'"$quantization"'
     }'
 
   echo ""
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..core.config import rag_config
+from ..langchain_utils.chain import chain_registry
+from ..langchain_utils.llms import get_llm_router
+from ..langchain_utils.retriever import (
+    get_async_qdrant_client,
+    get_embedder,
+    get_retriever,
+)
+from . import rag
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/health")
+
+# Settings without a usable default
+REQUIRED_SETTINGS = (
+    "VECTORDB_HOST",
+    "VECTORDB_COLLECTION",
+    "VECTORDB_TOPK",
+    "OPENAI_ENDPOINTS",
+    "OPENAI_EMBEDDING_MODEL_NAME",
+)
+
+
+async def check_config():
+    missing = [
+        name for name in REQUIRED_SETTINGS if not getattr(rag_config, name)
+    ]
+    if missing:
+        raise ValueError(f"Missing settings: {', '.join(missing)}")
+    int(rag_config.VECTORDB_TOPK)
+
+
+# Clients are created in threads: their first creation imports heavy
+# modules, and the Qdrant client checks the server version with a blocking
+# request, either would stall the event loop serving the probes
+
+
+async def check_qdrant():
+    client = await asyncio.to_thread(get_async_qdrant_client)
+    # Opens the connection pool of the shared client
+    await client.get_collection(rag_config.VECTORDB_COLLECTION)
+
+
+async def check_embeddings():
+    # Past the caches, so warming up is not counted as a cache miss
+    embedder = await asyncio.to_thread(get_embedder)
+    await embedder.embeddings.aembed_query("warmup")
+
+
+async def check_llm():
+    llm_router = await asyncio.to_thread(get_llm_router)
+    llm_router.start()
+    if not await llm_router.refresh_models():
+        raise RuntimeError("No LLM endpoint answered")
+    llm_router.warmup(rag_config.WARMUP_MODELS)
+
+
+async def check_caches():
+    clients = [get_embedder().aredis]
+    if rag.semantic_cache is not None:
+        clients.append(getattr(rag.semantic_cache.backend, "redis", None))
+    for client in clients:
+        if client is not None:
+            await client.ping()
+
+
+async def build_chains():
+    # Also without warmup models, so the retrieval mode is checked now
+    await asyncio.to_thread(get_retriever)
+    await asyncio.to_thread(chain_registry.warmup, rag_config.WARMUP_MODELS)
+
+
+class Readiness:
+    """Warms the process up and tracks whether it can serve requests.
+
+    Every check builds a lazily created component and makes a first call
+    with it, so clients are constructed, heavy modules imported and
+    connection pools opened before traffic arrives rather than on the first
+    request. A failing check (a broken setting, an upstream that is down)
+    keeps the process alive but not ready; it is run again on the next
+    readiness probe until it passes.
+
+    parameters
+    ----------
+    stages : list of dict
+        Check name -> coroutine function raising if the check fails. The
+        checks of a stage run at the same time, after those of the previous
+        stages.
+    timeout : float
+        Seconds each check may take.
+    """
+
+    def __init__(self, stages, timeout=30.0):
+        self.stages = stages
+        self.timeout = timeout
+        # Check name -> error of the checks that did not pass yet
+        self.errors = {
+            name: "not run yet" for stage in stages for name in stage
+        }
+        self.warmup_seconds = None
+        self._started = time.monotonic()
+        self._running = None
+
+    @property
+    def ready(self):
+        return not self.errors
+
+    @property
+    def running(self):
+        return self._running is not None and not self._running.done()
+
+    async def _check(self, name, check):
+        try:
+            await asyncio.wait_for(check(), self.timeout)
+        except Exception as exc:
+            self.errors[name] = f"{type(exc).__name__}: {exc}"
+        else:
+            self.errors.pop(name, None)
+
+    async def _run(self):
+        for stage in self.stages:
+            await asyncio.gather(
+                *(
+                    self._check(name, check)
+                    for name, check in stage.items()
+                    if name in self.errors
+                )
+            )
+        if not self.ready:
+            logger.warning(f"Not ready, failed checks: {self.errors}")
+        elif self.warmup_seconds is None:
+            self.warmup_seconds = time.monotonic() - self._started
+            logger.info(f"Ready after {self.warmup_seconds:.2f}s")
+
+    async def check(self):
+        """Run the checks that did not pass yet, sharing a run in progress."""
+        if not self.running:
+            self._running = asyncio.create_task(self._run())
+        await asyncio.shield(self._running)
+
+    def start(self):
+        """Start warming up in the background."""
+        self._started = time.monotonic()
+        self._running = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._running.cancel()
+            await asyncio.gather(self._running, return_exceptions=True)
+
+
+readiness = Readiness(
+    [
+        {
+            "config": check_config,
+            "qdrant": check_qdrant,
+            "embeddings": check_embeddings,
+            "llm": check_llm,
+        },
+        # Use the clients built by the checks above
+        {"caches": check_caches, "chains": build_chains},
+    ],
+    timeout=rag_config.WARMUP_TIMEOUT,
+)
+
+
+@router.get("/live")
+def live():
+    """Liveness probe: the process serves requests, whatever its upstreams."""
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def ready():
+    """Readiness probe: the warmup finished and every upstream answered.
+
+    Checks that failed are run again, except while the startup warmup is
+    still in progress.
+    """
+    if not readiness.ready and not readiness.running:
+        await readiness.check()
+    if readiness.ready:
+        return {"status": "ready", "warmup_seconds": readiness.warmup_seconds}
+    return JSONResponse(
+        status_code=503,
+        content={
+            "status": "warming up" if readiness.running else "not ready",
+            "errors": readiness.errors,
+        },
+    )
@@ -1,16 +1,41 @@
-from functools import lru_cache
-from typing import List, Literal
+import asyncio
+import json
+import logging
+import time
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
+from ..core.config import rag_config
 from ..core.internal_auth import get_api_key
-from ..langchain_utils.chain import get_rag_chain
-from ..langchain_utils.llms import openai_client
-from ..langchain_utils.prompts import get_prompt
+from ..core.metrics import REQUEST_SECONDS, REQUESTS_IN_FLIGHT, stage
+from ..core.semantic_cache import build_semantic_cache
+from ..core.single_flight import SingleFlight, request_key
+from ..langchain_utils.chain import (
+    aget_rag_chain,
+    get_summary_chain,
+    reload_rag_chains,
+)
+from ..langchain_utils.llms import get_llm_router
+from ..langchain_utils.retriever import (
+    get_corpus_version,
+    get_embedder,
+    get_retriever,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/rag")
 
+semantic_cache = build_semantic_cache(
+    rag_config, version_loader=get_corpus_version
+)
+single_flight = SingleFlight() if rag_config.REQUEST_COALESCING else None
+# Set in the workers of the prefork server, replaces all of them
+reload_workers = None
+
 
 class Message(BaseModel):
     """User message."""
@@ -23,16 +48,286 @@ class QueryRequest(BaseModel):
     """User query request."""
 
     model: str
-    chat_history: List[Message] = []
+    # The last message is the query
+    chat_history: List[Message] = Field(min_length=1)
+    # Summary of the conversation before `chat_history`
+    summary: Optional[str] = None
+
+
+class BatchQuery(BaseModel):
+    """One conversation of a batch request."""
+
+    # Echoed back in the result, e.g. the ID of an evaluation question
+    id: Optional[str] = None
+    chat_history: List[Message] = Field(min_length=1)
+    summary: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    """Many queries answered by the same model."""
+
+    model: str
+    queries: List[BatchQuery]
+    # Answers generated at the same time, capped by BATCH_CONCURRENCY
+    concurrency: Optional[int] = None
+
+
+class SummaryRequest(BaseModel):
+    """Request to fold messages into a running conversation summary."""
+
+    model: str
+    summary: Optional[str] = None
+    messages: List[Message]
+
+
+def _chain_inputs(query):
+    """Split the request into the latest user message and prior history."""
+    # Separate the latest user message
+    latest_user_message = query.chat_history[-1].content
+
+    # Exclude the last message
+    chat_history = [m.model_dump() for m in query.chat_history[:-1]]
+    if query.summary:
+        chat_history.insert(
+            0,
+            {
+                "role": "system",
+                "content": "Summary of the earlier conversation:\n"
+                + query.summary,
+            },
+        )
+
+    return {
+        "input": latest_user_message,
+        "chat_history": chat_history,
+    }
+
+
+async def _cache_lookup(model, query_vector, chat_history):
+    """Look a query up in the semantic cache, treating errors as a miss.
+
+    The cache only saves work, a Redis or Qdrant failure while reading it
+    must not fail the request.
+    """
+    try:
+        return await semantic_cache.lookup(model, query_vector, chat_history)
+    except Exception as exc:
+        logger.warning(f"Semantic cache lookup failed: {exc}")
+        return None
+
+
+async def _lookup_cache(model, inputs):
+    """Look the latest user message up in the semantic cache.
+
+    Returns the cached entry (None on a miss or if the cache is disabled)
+    and the query embedding, which is needed again to store a new answer.
+    """
+    if semantic_cache is None:
+        return None, None
+    with stage("embed").time():
+        query_vector = await get_embedder().aembed_query(inputs["input"])
+    with stage("cache_lookup").time():
+        entry = await _cache_lookup(
+            model, query_vector, inputs["chat_history"]
+        )
+    return entry, query_vector
+
+
+async def _store_cache(model, inputs, query_vector, answer, docs, started):
+    """Store a freshly generated answer in the semantic cache.
+
+    Errors are logged and otherwise ignored, the answer is still returned.
+    """
+    if semantic_cache is None:
+        return
+    try:
+        await semantic_cache.store(
+            model,
+            query_vector,
+            inputs["chat_history"],
+            answer,
+            docs,
+            generation_time=time.perf_counter() - started,
+        )
+    except Exception as exc:
+        logger.warning(f"Semantic cache store failed: {exc}")
+
+
+def _coalesced(model, inputs, func):
+    """Run `func` once for concurrent identical requests if enabled."""
+    if single_flight is None:
+        return func()
+    key = request_key(model, inputs["input"], inputs["chat_history"])
+    return single_flight.do(key, func)
+
+
+def _coalesced_stream(model, inputs, func):
+    """Streaming variant of `_coalesced`, sharing the yielded frames."""
+    if single_flight is None:
+        return func()
+    key = request_key(model, inputs["input"], inputs["chat_history"])
+    return single_flight.stream(key, func)
+
+
+async def _generate_answer(model, chain, inputs, query_vector):
+    """Run the chain, store the answer in the cache and return the reply."""
+    started = time.perf_counter()
+    result = await chain.ainvoke(inputs)
+    answer = result["answer"]
+    docs = [doc.metadata for doc in result["packed"]["context"]]
+    await _store_cache(model, inputs, query_vector, answer, docs, started)
+
+    return {
+        "answer": answer,
+        "relevant_docs": docs,
+        "prompt_tokens": result["packed"]["tokens"],
+    }
+
+
+async def _prepare_batch(model, inputs):
+    """Embed and retrieve the queries of a batch in bulk.
+
+    All queries are embedded in one request and looked up in the semantic
+    cache, the misses are retrieved with Qdrant batch searches by the
+    retriever the chains share. Returns the cached results (None for
+    misses), the query embeddings and the retrieved documents of each miss
+    by index.
+    """
+    results = [None] * len(inputs)
+    with stage("embed").time():
+        vectors = await get_embedder().aembed_documents(
+            [i["input"] for i in inputs]
+        )
+
+    if semantic_cache is not None:
+        with stage("cache_lookup").time():
+            entries = await asyncio.gather(
+                *(
+                    _cache_lookup(model, vector, i["chat_history"])
+                    for i, vector in zip(inputs, vectors)
+                )
+            )
+        for index, entry in enumerate(entries):
+            if entry is not None:
+                results[index] = {
+                    "answer": entry["answer"],
+                    "relevant_docs": entry["relevant_docs"],
+                    "cached": True,
+                }
+
+    misses = [index for index, result in enumerate(results) if result is None]
+    contexts = await get_retriever().abatch_retrieve(
+        [inputs[index]["input"] for index in misses],
+        [vectors[index] for index in misses],
+    )
+    return results, vectors, dict(zip(misses, contexts))
+
+
+async def _generate_batch(
+    model, chain, queries, inputs, results, vectors, contexts, concurrency
+):
+    """Yield the NDJSON results of a batch as they finish.
+
+    Cached results come first, the others are generated `concurrency` at a
+    time from their retrieved documents.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(index):
+        async with semaphore:
+            try:
+                return index, await _generate_answer(
+                    model,
+                    chain,
+                    dict(inputs[index], context=contexts[index]),
+                    vectors[index],
+                )
+            except Exception as exc:
+                return index, {"error": str(exc)}
+
+    def frame(index, result):
+        return _ndjson_frame(index=index, id=queries[index].id, **result)
+
+    for index, result in enumerate(results):
+        if result is not None:
+            yield frame(index, result)
+    tasks = [asyncio.create_task(generate(index)) for index in contexts]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield frame(*await next_done)
+    finally:
+        # The client went away, stop generating for nobody
+        for task in tasks:
+            task.cancel()
+
+
+async def _tracked(endpoint, frames, started):
+    """Yield `frames`, counting the request as in flight until the last."""
+    in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        in_flight.dec()
+        REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+
+
+def _ndjson_frame(**frame):
+    """Serialize a single streaming frame as one line of NDJSON."""
+    return json.dumps(frame) + "\n"
+
+
+async def _stream_answer(model, chain, inputs, query_vector):
+    """Run the chain in streaming mode and yield NDJSON frames.
+
+    Answer tokens are sent as ``{"type": "token", "content": ...}`` frames
+    as soon as the LLM produces them. The metadata of the documents in the
+    prompt and the prompt token counts are sent last in a
+    ``{"type": "done", "relevant_docs": [...], "prompt_tokens": {...}}``
+    frame. If the chain fails midway, an
+    ``{"type": "error", "detail": ...}`` frame is sent instead, because the
+    HTTP status has already been committed.
+    """
+    started = time.perf_counter()
+    answer = ""
+    docs = []
+    prompt_tokens = {}
+    try:
+        async for chunk in chain.astream(inputs):
+            if "packed" in chunk:
+                docs = [doc.metadata for doc in chunk["packed"]["context"]]
+                prompt_tokens = chunk["packed"]["tokens"]
+            token = chunk.get("answer")
+            if token:
+                answer += token
+                yield _ndjson_frame(type="token", content=token)
+        await _store_cache(model, inputs, query_vector, answer, docs, started)
+    except Exception as exc:
+        yield _ndjson_frame(type="error", detail=str(exc))
+        return
+
+    yield _ndjson_frame(
+        type="done", relevant_docs=docs, prompt_tokens=prompt_tokens
+    )
+
+
+async def _stream_cached(entry):
+    """Yield a cached answer with the same frames as `_stream_answer`."""
+    yield _ndjson_frame(type="token", content=entry["answer"])
+    yield _ndjson_frame(
+        type="done", relevant_docs=entry["relevant_docs"], cached=True
+    )
 
 
-@lru_cache(maxsize=100)
 @router.get("/models", response_model=List[str])
-def list_models():
-    """API endpoint to list available models."""
-    models = openai_client.models.list()
-    model_names = [m.id for m in models]
-    return model_names
+async def list_models():
+    """API endpoint to list the models available on any LLM endpoint.
+
+    The model lists of the endpoints are refreshed every LLM_MODELS_TTL
+    seconds rather than fetched on every call.
+    """
+    return await get_llm_router().list_models()
 
 
 @router.post("/chat")
@@ -53,29 +348,195 @@ async def chat_api(query: QueryRequest, api_key: str = Depends(get_api_key)):
     }
     """
 
-    # Separate the latest user message
-    latest_user_message = query.chat_history[-1].content
+    with (
+        REQUESTS_IN_FLIGHT.labels("chat").track_inprogress(),
+        REQUEST_SECONDS.labels("chat").time(),
+    ):
+        inputs = _chain_inputs(query)
+        cached, query_vector = await _lookup_cache(query.model, inputs)
+        if cached is not None:
+            return {
+                "answer": cached["answer"],
+                "relevant_docs": cached["relevant_docs"],
+                "cached": True,
+            }
 
-    # Exclude the last message
-    chat_history = [m.model_dump() for m in query.chat_history[:-1]]
+        # Get the (cached) chain
+        chain = await aget_rag_chain(query.model)
+
+        # Call the chain, once for concurrent identical requests
+        return await _coalesced(
+            query.model,
+            inputs,
+            lambda: _generate_answer(query.model, chain, inputs, query_vector),
+        )
+
+
+@router.post("/chat/stream")
+async def chat_stream_api(
+    query: QueryRequest, api_key: str = Depends(get_api_key)
+):
+    """Streaming variant of `chat_api`.
+
+    The response body is newline-delimited JSON (``application/x-ndjson``).
+    Every answer token is sent as soon as it is generated, followed by a
+    final frame with the metadata of the documents in the prompt and the
+    prompt token counts:
+
+    {"type": "token", "content": "The Human"}
+    {"type": "token", "content": " Development Index"}
+    ...
+    {"type": "done", "relevant_docs": [{"source": "hdi.pdf", ...}],
+     "prompt_tokens": {"system": 212, "history": 0, ..., "total": 3120}}
+    """
+    started = time.perf_counter()
+    inputs = _chain_inputs(query)
+    cached, query_vector = await _lookup_cache(query.model, inputs)
+    if cached is not None:
+        frames = _stream_cached(cached)
+    else:
+        chain = await aget_rag_chain(query.model)
+        # Concurrent identical requests receive the same token stream
+        frames = _coalesced_stream(
+            query.model,
+            inputs,
+            lambda: _stream_answer(query.model, chain, inputs, query_vector),
+        )
+    return StreamingResponse(
+        _tracked("stream", frames, started),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/chat/batch")
+async def chat_batch_api(
+    request: BatchRequest, api_key: str = Depends(get_api_key)
+):
+    """API endpoint answering many queries, e.g. an evaluation set.
+
+    The response body is newline-delimited JSON with one result per query,
+    sent as soon as it is ready, so in completion order rather than request
+    order. `index` is the position of the query in the request:
+
+    {"index": 3, "id": "q4", "answer": "...", "relevant_docs": [...],
+     "prompt_tokens": {...}}
+    {"index": 0, "id": "q1", "error": "..."}
 
-    # Prepare the chain
-    model_name = query.model
-    prompt = get_prompt()
-    chain = get_rag_chain(model_name, prompt)
+    example:
+    {
+        "model": "meta-llama-3.1-8b-instruct",
+        "queries": [
+            {"id": "q1", "chat_history": [
+                {"role": "user", "content": "summarize HDI"}]},
+            {"id": "q2", "chat_history": [
+                {"role": "user", "content": "what is the GDI?"}]}
+        ]
+    }
+    """
+    if len(request.queries) > rag_config.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {rag_config.BATCH_MAX_QUERIES} queries "
+            "per batch",
+        )
+    concurrency = min(
+        request.concurrency or rag_config.BATCH_CONCURRENCY,
+        rag_config.BATCH_CONCURRENCY,
+    )
+    started = time.perf_counter()
+    inputs = [_chain_inputs(query) for query in request.queries]
+    # Built first, so that the shared retriever is built off the event loop
+    chain = await aget_rag_chain(request.model)
+    results, vectors, contexts = await _prepare_batch(request.model, inputs)
+    frames = _generate_batch(
+        request.model,
+        chain,
+        request.queries,
+        inputs,
+        results,
+        vectors,
+        contexts,
+        concurrency,
+    )
+    return StreamingResponse(
+        _tracked("batch", frames, started),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/summarize")
+async def summarize_api(
+    request: SummaryRequest, api_key: str = Depends(get_api_key)
+):
+    """API endpoint folding messages into a running conversation summary.
+
+    Used by clients compacting long conversations: they send the summary
+    and the latest messages instead of the whole history.
 
-    # Call the chain
-    result = chain.invoke(
+    example:
+    {
+        "model": "meta-llama-3.1-8b-instruct",
+        "summary": "The user asked how the HDI is computed...",
+        "messages": [
+            {"role": "user", "content": "and the GDI?"},
+            {"role": "assistant", "content": "The Gender Development..."}
+        ]
+    }
+    """
+    # Built on first use with blocking I/O, keep it off the event loop
+    chain = await asyncio.to_thread(get_summary_chain, request.model)
+    summary = await chain.ainvoke(
         {
-            "input": latest_user_message,
-            "chat_history": chat_history,
+            "summary": request.summary or "(none)",
+            "messages": "\n\n".join(
+                f"{m.role}: {m.content}" for m in request.messages
+            ),
         }
     )
-    # Process the result
-    answer = result["answer"]
-    docs = [doc.metadata for doc in result.get("context", [])]
+    return {"summary": summary.strip()}
+
+
+@router.post("/chains/invalidate")
+async def invalidate_chains_api(
+    model: Optional[str] = None, api_key: str = Depends(get_api_key)
+):
+    """API endpoint to drop cached chains, e.g. after the prompt or the
+    Qdrant collection changed.
+
+    If `model` is given only its chain is rebuilt on the next request,
+    otherwise all chains and the shared Qdrant clients are. Under the
+    prefork server the request only reaches one worker, so every worker is
+    gracefully replaced instead and starts without chains. Settings read
+    from the environment are only read again on restart.
+    """
+    if reload_workers is not None:
+        reload_workers()
+        return {"invalidated": "all", "workers_reloaded": True}
+    await reload_rag_chains(model)
+    return {"invalidated": model or "all"}
 
+
+@router.get("/cache/stats")
+def cache_stats_api(api_key: str = Depends(get_api_key)):
+    """API endpoint reporting the semantic cache hit rate and saved time."""
+    if semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **semantic_cache.stats()}
+
+
+@router.get("/coalescing/stats")
+def coalescing_stats_api(api_key: str = Depends(get_api_key)):
+    """API endpoint reporting how many requests shared a computation."""
+    if single_flight is None:
+        return {"enabled": False}
+    return {"enabled": True, **single_flight.stats()}
+
+
+@router.get("/endpoints/stats")
+def endpoints_stats_api(api_key: str = Depends(get_api_key)):
+    """API endpoint reporting the load and health of the LLM endpoints."""
+    llm_router = get_llm_router()
     return {
-        "answer": answer,
-        "relevant_docs": docs,
+        "strategy": llm_router.strategy,
+        "endpoints": llm_router.stats(),
     }
@@ -0,0 +1,58 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from .api import health, rag
+from .core.config import rag_config
+from .core.metrics import latest
+from .langchain_utils.llms import get_llm_router
+from .langchain_utils.retriever import close_qdrant_clients
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Prepare the serving process and release its resources on shutdown.
+
+    Sync-only LangChain components are run in the loop's default executor,
+    which is bounded here so a burst of requests cannot spawn unbounded
+    threads. Clients are built on first use; the warmup started here uses
+    them in the background (pre-connecting Qdrant and the OpenAI endpoints,
+    building the chains of the configured models) while `/health/ready`
+    reports it unfinished.
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=rag_config.EXECUTOR_WORKERS,
+        thread_name_prefix="rag-sync",
+    )
+    asyncio.get_running_loop().set_default_executor(executor)
+
+    health.readiness.start()
+    yield
+
+    await health.readiness.stop()
+    if get_llm_router.cache_info().currsize:
+        await get_llm_router().close()
+    await close_qdrant_clients()
+    executor.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/")
+def root():
+    return {"RAGbot health status": "Running!"}
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics of the process."""
+    return Response(latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+# Include the health and RAG routers
+app.include_router(health.router)
+app.include_router(rag.router)
@@ -0,0 +1,113 @@
+"""Client running a question set through the batch endpoint.
+
+Questions are read from a JSONL file, one object per line with either a
+"question" or a full "chat_history", and an optional "id":
+
+    {"id": "hdi-1", "question": "How is the HDI computed?"}
+
+Results are written to a JSONL file as they arrive:
+
+    python -m rag_backend.batch_client questions.jsonl \
+        --model meta-llama-3.1-8b-instruct --output answers.jsonl
+"""
+
+import json
+import os
+import sys
+import time
+
+import click
+import httpx
+
+
+def load_queries(path):
+    """Read the queries of a JSONL question file."""
+    queries = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "chat_history" in item:
+                chat_history = item["chat_history"]
+            else:
+                chat_history = [{"role": "user", "content": item["question"]}]
+            queries.append(
+                {
+                    "id": str(item.get("id", number)),
+                    "chat_history": chat_history,
+                }
+            )
+    return queries
+
+
+def run_batch(client, url, model, queries, concurrency):
+    """Send one batch request and yield its results as they arrive."""
+    body = {"model": model, "queries": queries, "concurrency": concurrency}
+    with client.stream("POST", url, json=body) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+@click.command()
+@click.argument("questions", type=click.Path(exists=True, dir_okay=False))
+@click.option("--model", required=True, help="Model answering the queries.")
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="JSONL file the results are written to (default: stdout).",
+)
+@click.option(
+    "--url", default="http://localhost:8000", help="URL of the RAG backend."
+)
+@click.option(
+    "--token",
+    default=lambda: os.getenv("INTERNAL_FASTAPI_TOKEN"),
+    help="API token (default: $INTERNAL_FASTAPI_TOKEN).",
+)
+@click.option(
+    "--batch-size", default=500, help="Queries sent per batch request."
+)
+@click.option(
+    "--concurrency", default=8, help="Answers generated at the same time."
+)
+@click.option("--timeout", default=3600.0, help="Seconds to wait for a batch.")
+def main(
+    questions, model, output, url, token, batch_size, concurrency, timeout
+):
+    """Answer the QUESTIONS of a JSONL file with the RAG backend."""
+    queries = load_queries(questions)
+    started = time.perf_counter()
+    errors = 0
+    with httpx.Client(
+        headers={"X-Internal-Token": token or ""},
+        timeout=httpx.Timeout(timeout, connect=10.0),
+    ) as client:
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start : start + batch_size]
+            for result in run_batch(
+                client, f"{url}/rag/chat/batch", model, batch, concurrency
+            ):
+                result["index"] += start
+                errors += "error" in result
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+            click.echo(
+                f"{min(start + batch_size, len(queries))}/{len(queries)} "
+                f"queries answered",
+                err=True,
+            )
+
+    click.echo(
+        f"Answered {len(queries)} queries in "
+        f"{time.perf_counter() - started:.1f}s ({errors} errors)",
+        err=True,
+    )
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
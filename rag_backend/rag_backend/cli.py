@@ -1,28 +1,71 @@
 import click
 import uvicorn
-from fastapi import FastAPI
 
-from .api import rag
-
-app = FastAPI()
-
-
-@app.get("/")
-def root():
-    return {"RAGbot health status": "Running!"}
-
-
-# Include the RAG router
-app.include_router(rag.router)
+from .core.config import rag_config
 
 
 @click.command()
 @click.option("--port", default=8000, help="Port for the FastAPI app.")
 @click.option("--local", is_flag=True, help="Run app locally.")
-def serve(port=8000, local=False):
+@click.option(
+    "--workers",
+    default=rag_config.WORKERS,
+    help="Worker processes; more than one serves with gunicorn.",
+)
+@click.option(
+    "--max-requests",
+    default=rag_config.WORKER_MAX_REQUESTS,
+    help="Requests after which a worker is replaced (0: never).",
+)
+@click.option(
+    "--max-requests-jitter",
+    default=rag_config.WORKER_MAX_REQUESTS_JITTER,
+    help="Random extra requests per worker before it is replaced.",
+)
+@click.option(
+    "--graceful-timeout",
+    default=rag_config.WORKER_GRACEFUL_TIMEOUT,
+    help="Seconds a stopping worker gets to finish its requests.",
+)
+@click.option(
+    "--preload/--no-preload",
+    default=True,
+    help="Import the app before forking the workers (HUP then only "
+    "restarts them, without loading new code).",
+)
+def serve(
+    port=8000,
+    local=False,
+    workers=1,
+    max_requests=0,
+    max_requests_jitter=0,
+    graceful_timeout=30,
+    preload=True,
+):
     """Run the rag_backend app with specified options."""
     if not local:
         host = "0.0.0.0"  # Host IP address
     else:
         host = "127.0.0.1"
-    uvicorn.run(app, log_level="info", port=port, host=host)
+    if workers > 1:
+        from .server import run
+
+        run(
+            host,
+            port,
+            workers,
+            max_requests=max_requests,
+            max_requests_jitter=max_requests_jitter,
+            graceful_timeout=graceful_timeout,
+            preload_app=preload,
+        )
+        return
+    # Imported by uvicorn, so parsing the options does not load the app
+    uvicorn.run(
+        "rag_backend.app:app",
+        log_level="info",
+        port=port,
+        host=host,
+        limit_max_requests=max_requests or None,
+        timeout_graceful_shutdown=graceful_timeout,
+    )
@@ -1,3 +1,4 @@
+import json
 import os
 
 from dotenv import load_dotenv
@@ -13,12 +14,141 @@ class Config:
     VECTORDB_PORT = os.getenv("VECTORDB_PORT")
     VECTORDB_COLLECTION = os.getenv("VECTORDB_COLLECTION")
     VECTORDB_TOPK = os.getenv("VECTORDB_TOPK")
+    # Talk to Qdrant over gRPC instead of REST: vectors are sent as packed
+    # floats rather than JSON text
+    VECTORDB_PREFER_GRPC = os.getenv(
+        "VECTORDB_PREFER_GRPC", "false"
+    ).lower() in ("1", "true", "yes")
+    VECTORDB_GRPC_PORT = int(os.getenv("VECTORDB_GRPC_PORT", 6334))
+    # Search parameters of every query: HNSW beam size (0 for the
+    # collection's default), exact search instead of HNSW, and the seconds
+    # after which Qdrant aborts a search (0 for no limit)
+    VECTORDB_HNSW_EF = int(os.getenv("VECTORDB_HNSW_EF", 0))
+    VECTORDB_EXACT = os.getenv("VECTORDB_EXACT", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    VECTORDB_TIMEOUT = int(os.getenv("VECTORDB_TIMEOUT", 0))
+    # Searches of quantized collections: candidates fetched with the
+    # quantized vectors, as a multiple of the limit (0 for Qdrant's default),
+    # and whether they are rescored with the original vectors
+    VECTORDB_OVERSAMPLING = float(os.getenv("VECTORDB_OVERSAMPLING", 0))
+    VECTORDB_RESCORE = os.getenv("VECTORDB_RESCORE", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    # "dense" or "hybrid" (dense + sparse BM25 with reciprocal rank fusion)
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense").lower()
+    VECTORDB_SPARSE_NAME = os.getenv("VECTORDB_SPARSE_NAME", "sparse")
+    # Candidates of each search fused in hybrid mode
+    VECTORDB_PREFETCH_K = int(os.getenv("VECTORDB_PREFETCH_K", 20))
+    # Candidates fetched for MMR reranking (no reranking if <= TOPK)
+    RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", 20))
+    # 1 ranks by relevance only, 0 by diversity only
+    RERANK_MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA", 0.7))
+    # Optional "package.module:function" scoring (query, texts)
+    RERANKER = os.getenv("RERANKER", "")
+
+    # Prompt token budgets, "default" and overrides per model name, e.g.
+    # '{"meta-llama-3.1-8b-instruct": {"context": 3000}}'; budgets left out
+    # keep their built-in default
+    PROMPT_TOKEN_BUDGETS = json.loads(os.getenv("PROMPT_TOKEN_BUDGETS", "{}"))
+    PROMPT_TOKEN_BUDGETS["default"] = {
+        "system": 1024,
+        "history": 2048,
+        "context": 6144,
+        **PROMPT_TOKEN_BUDGETS.get("default", {}),
+    }
+    # tiktoken encoding used to count prompt tokens
+    TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
 
     # LLM API key from OPENAPI
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     OPENAI_ENDPOINT = os.getenv("OPENAI_ENDPOINT")
     OPENAI_EMBEDDING_MODEL_NAME = os.getenv("OPENAI_EMBEDDING_MODEL_NAME")
 
+    # Generation endpoints balanced by the LLM router (comma separated),
+    # defaulting to OPENAI_ENDPOINT, and optionally the endpoints serving
+    # each model, e.g. '{"meta-llama-3.1-8b-instruct": ["http://a/v1"]}'
+    OPENAI_ENDPOINTS = [
+        url.strip()
+        for url in (
+            os.getenv("OPENAI_ENDPOINTS") or OPENAI_ENDPOINT or ""
+        ).split(",")
+        if url.strip()
+    ]
+    LLM_MODEL_ENDPOINTS = json.loads(os.getenv("LLM_MODEL_ENDPOINTS") or "{}")
+    # "least_outstanding" or "ewma" (latency weighted by outstanding calls)
+    LLM_ROUTING_STRATEGY = os.getenv(
+        "LLM_ROUTING_STRATEGY", "least_outstanding"
+    )
+    LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", 3))
+    LLM_EJECTION_TIME = float(os.getenv("LLM_EJECTION_TIME", 30))
+    LLM_PROBE_INTERVAL = float(os.getenv("LLM_PROBE_INTERVAL", 10))
+    LLM_MODELS_TTL = float(os.getenv("LLM_MODELS_TTL", 60))
+    LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 3))
+
+    # Query embedding cache (the Redis tier is optional) and batching
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+    EMBEDDING_CACHE_REDIS_URL = os.getenv("EMBEDDING_CACHE_REDIS_URL") or None
+    EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 86400))
+    EMBEDDING_BATCH_WINDOW_MS = float(
+        os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5)
+    )
+    EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", 64))
+
+    # Chain registry: max number of cached models and models built at startup
+    CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", 16))
+    WARMUP_MODELS = [
+        m.strip()
+        for m in os.getenv("WARMUP_MODELS", "").split(",")
+        if m.strip()
+    ]
+    # Seconds each warmup and readiness check (Qdrant, LLM, ...) may take
+    WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", 30))
+
+    # Serving processes; more than one runs gunicorn, replacing a worker
+    # after WORKER_MAX_REQUESTS (+ random jitter) requests, 0 for never
+    WORKERS = int(os.getenv("WORKERS", 1))
+    WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", 0))
+    WORKER_MAX_REQUESTS_JITTER = int(
+        os.getenv("WORKER_MAX_REQUESTS_JITTER", 0)
+    )
+    WORKER_GRACEFUL_TIMEOUT = float(os.getenv("WORKER_GRACEFUL_TIMEOUT", 30))
+
+    # Threads for sync-only work (e.g. sync callbacks) run from async chains
+    EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", 8))
+
+    # Semantic answer cache: "off", "memory" or "redis"
+    SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "off").lower()
+    SEMANTIC_CACHE_REDIS_URL = os.getenv(
+        "SEMANTIC_CACHE_REDIS_URL", "redis://redis_db:6379/1"
+    )
+    SEMANTIC_CACHE_THRESHOLD = float(
+        os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)
+    )
+    SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 1000))
+    SEMANTIC_CACHE_HISTORY_TURNS = int(
+        os.getenv("SEMANTIC_CACHE_HISTORY_TURNS", 2)
+    )
+    SEMANTIC_CACHE_VERSION_CHECK = float(
+        os.getenv("SEMANTIC_CACHE_VERSION_CHECK", 30)
+    )
+
+    # Share one computation between concurrent identical requests
+    REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # Batch endpoint: max queries per request and answers generated at once
+    BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 1000))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+
     # FastAPI token
     INTERNAL_FASTAPI_TOKEN = os.getenv("INTERNAL_FASTAPI_TOKEN")
 
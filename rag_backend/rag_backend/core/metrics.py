@@ -0,0 +1,102 @@
+import os
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# From a cache hit or a Qdrant search up to a long generation
+STAGE_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Time spent in each stage of answering a query.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "rag_request_seconds",
+    "Time until the response of an API endpoint is complete.",
+    ["endpoint"],
+    buckets=STAGE_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "rag_requests_in_flight",
+    "Requests being answered.",
+    ["endpoint"],
+    # Summed over the live workers when serving with several
+    multiprocess_mode="livesum",
+)
+TOKENS = Counter(
+    "rag_tokens",
+    "Prompt tokens sent to and completion tokens received from the LLM.",
+    ["kind"],
+)
+TOKENS_PER_SECOND = Histogram(
+    "rag_generation_tokens_per_second",
+    "Completion tokens per second after the first token.",
+    buckets=(1, 5, 10, 20, 40, 80, 160, 320),
+)
+CACHE_HITS = Counter("rag_cache_hits", "Cache lookups answered.", ["cache"])
+CACHE_MISSES = Counter("rag_cache_misses", "Cache lookups missed.", ["cache"])
+COALESCED_REQUESTS = Counter(
+    "rag_coalesced_requests",
+    "Requests answered by an identical in-flight request.",
+)
+LLM_ENDPOINT_OUTSTANDING = Gauge(
+    "rag_llm_endpoint_outstanding",
+    "Calls in flight per LLM endpoint.",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+LLM_ENDPOINT_HEALTHY = Gauge(
+    "rag_llm_endpoint_healthy",
+    "1 if the LLM endpoint is in rotation, 0 if ejected.",
+    ["endpoint"],
+    # Ejected as soon as one worker ejected it
+    multiprocess_mode="livemin",
+)
+LLM_ENDPOINT_FAILURES = Counter(
+    "rag_llm_endpoint_failures",
+    "Failed calls per LLM endpoint.",
+    ["endpoint"],
+)
+
+
+def stage(name):
+    """Return the histogram of stage `name`, e.g. to use
+    ``with stage("search").time():``.
+    """
+    return STAGE_SECONDS.labels(name)
+
+
+def latest():
+    """Return the metrics of the process in the Prometheus text format.
+
+    With several workers (PROMETHEUS_MULTIPROC_DIR set), the histograms,
+    counters and gauges of all workers are merged instead.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
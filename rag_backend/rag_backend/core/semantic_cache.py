@@ -0,0 +1,417 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import redis.asyncio as redis
+
+from .metrics import CACHE_HITS, CACHE_MISSES
+
+
+def _normalize(vector):
+    """Return `vector` as a unit-length float32 array (cosine == dot)."""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def history_fingerprint(chat_history, turns):
+    """Hash the last `turns` messages of a conversation.
+
+    Two queries only share cached answers if their fingerprints match, so a
+    follow-up question ("and what about the second one?") is not answered
+    with an answer given in another context. With `turns` set to 0 the
+    history is ignored.
+    """
+    if turns <= 0:
+        return ""
+    recent = [
+        (m["role"], " ".join(m["content"].lower().split()))
+        for m in chat_history[-turns:]
+    ]
+    return hashlib.sha1(json.dumps(recent).encode()).hexdigest()
+
+
+class InMemoryCacheBackend:
+    """Process-local semantic cache storage with TTL and LRU eviction.
+
+    parameters
+    ----------
+    max_size : int
+        Maximum number of entries over all namespaces.
+    ttl : float
+        Seconds after which an entry expires.
+    """
+
+    def __init__(self, max_size=1000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        # (namespace, entry_id) -> entry, ordered from least recently used
+        self._entries = OrderedDict()
+        # namespace -> (entry keys, stacked vectors), rebuilt after changes
+        self._matrices = {}
+
+    def _matrix(self, namespace):
+        if namespace not in self._matrices:
+            keys = [key for key in self._entries if key[0] == namespace]
+            entries = [self._entries[key] for key in keys]
+            self._matrices[namespace] = (
+                keys,
+                np.stack([e["vector"] for e in entries]) if entries else None,
+                np.array([e["expires_at"] for e in entries]),
+            )
+        return self._matrices[namespace]
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._matrices.pop(key[0], None)
+
+    async def search(self, namespace, vector, threshold):
+        """Return the most similar live entry above `threshold`, or None."""
+        keys, matrix, expires_at = self._matrix(namespace)
+        if matrix is None:
+            return None
+
+        # Expired entries are skipped here and left for LRU eviction
+        similarities = np.where(
+            expires_at >= time.time(), matrix @ vector, -np.inf
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold:
+            return None
+
+        key = keys[best]
+        self._entries.move_to_end(key)
+        entry = self._entries[key]
+        return {
+            "answer": entry["answer"],
+            "relevant_docs": entry["relevant_docs"],
+            "generation_time": entry["generation_time"],
+            "similarity": float(similarities[best]),
+        }
+
+    async def put(self, namespace, vector, entry):
+        """Store `entry` for `vector`, evicting the LRU entry if full."""
+        key = (namespace, uuid.uuid4().hex)
+        self._entries[key] = dict(
+            entry, vector=vector, expires_at=time.time() + self.ttl
+        )
+        self._matrices.pop(namespace, None)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+
+class RedisCacheBackend:
+    """Semantic cache storage shared through Redis.
+
+    Every entry is a hash holding the float32 query vector, the answer and its
+    sources, expiring after `ttl` seconds. Each namespace keeps a sorted set
+    of its entries scored by last access, used for LRU eviction once it holds
+    more than `max_size` entries, and a version token replaced whenever
+    entries are added or removed.
+
+    Searches compare the query with a copy of the namespace vectors kept in
+    the process, reloaded from Redis only when the version changed, so a
+    lookup costs one small read instead of transferring every vector. The
+    copies of the most recently searched namespaces are kept, up to
+    `max_size` vectors in total.
+
+    parameters
+    ----------
+    url : str
+        Redis connection URL, e.g. "redis://redis_db:6379/1".
+    max_size : int
+        Maximum number of entries per namespace.
+    ttl : float
+        Seconds after which an entry expires.
+    prefix : str
+        Prefix of all keys written by the cache.
+    """
+
+    def __init__(self, url, max_size=1000, ttl=3600, prefix="semantic_cache"):
+        self.redis = redis.Redis.from_url(url)
+        self.max_size = max_size
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        # namespace -> (version, entry ids, stacked vectors), from least
+        # recently searched
+        self._mirror = OrderedDict()
+        # (namespace, version) -> task loading its vectors
+        self._loading = {}
+
+    def _index_key(self, namespace):
+        return f"{self.prefix}:{namespace}:index"
+
+    def _version_key(self, namespace):
+        return f"{self.prefix}:{namespace}:version"
+
+    def _entry_key(self, namespace, entry_id):
+        return f"{self.prefix}:{namespace}:{entry_id}"
+
+    def _new_version(self, pipe, namespace):
+        # A random token rather than a counter: a namespace expiring and
+        # written again must not match the version of an older copy
+        pipe.set(self._version_key(namespace), uuid.uuid4().hex, ex=self.ttl)
+
+    async def _load(self, namespace):
+        """Read the entry ids and vectors of `namespace` from Redis."""
+        index_key = self._index_key(namespace)
+        entry_ids = await self.redis.zrange(index_key, 0, -1)
+        if not entry_ids:
+            return [], None
+
+        pipe = self.redis.pipeline(transaction=False)
+        for entry_id in entry_ids:
+            pipe.hget(self._entry_key(namespace, entry_id.decode()), "vector")
+        raw_vectors = await pipe.execute()
+
+        live = [(i, raw) for i, raw in zip(entry_ids, raw_vectors) if raw]
+        expired = [i for i, raw in zip(entry_ids, raw_vectors) if not raw]
+        if expired:
+            await self.redis.zrem(index_key, *expired)
+        if not live:
+            return [], None
+        matrix = np.stack([np.frombuffer(raw, np.float32) for _, raw in live])
+        return [i for i, _ in live], matrix
+
+    async def _vectors(self, namespace):
+        """Return the entry ids and vectors of `namespace`, from the copy
+        in the process if it is still current.
+        """
+        version = await self.redis.get(self._version_key(namespace))
+        mirrored = self._mirror.get(namespace)
+        if mirrored is not None and mirrored[0] == version:
+            self._mirror.move_to_end(namespace)
+            return mirrored[1], mirrored[2]
+
+        # Concurrent searches of a stale namespace share one reload
+        key = (namespace, version)
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(namespace))
+            self._loading[key] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(key, None))
+        entry_ids, matrix = await asyncio.shield(loading)
+
+        self._mirror[namespace] = (version, entry_ids, matrix)
+        self._mirror.move_to_end(namespace)
+        mirrored_vectors = sum(len(m[1]) for m in self._mirror.values())
+        while mirrored_vectors > self.max_size and len(self._mirror) > 1:
+            _, (_, evicted_ids, _) = self._mirror.popitem(last=False)
+            mirrored_vectors -= len(evicted_ids)
+        return entry_ids, matrix
+
+    async def search(self, namespace, vector, threshold):
+        """Return the most similar entry above `threshold`, or None."""
+        entry_ids, matrix = await self._vectors(namespace)
+        if matrix is None:
+            return None
+
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold:
+            return None
+
+        entry_id = entry_ids[best]
+        index_key = self._index_key(namespace)
+        fields = await self.redis.hgetall(
+            self._entry_key(namespace, entry_id.decode())
+        )
+        if not fields:
+            # Expired or evicted since the vectors were loaded
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.zrem(index_key, entry_id)
+            self._new_version(pipe, namespace)
+            await pipe.execute()
+            return None
+        await self.redis.zadd(index_key, {entry_id: time.time()})
+        return {
+            "answer": fields[b"answer"].decode(),
+            "relevant_docs": json.loads(fields[b"relevant_docs"]),
+            "generation_time": float(fields[b"generation_time"]),
+            "similarity": float(similarities[best]),
+        }
+
+    async def put(self, namespace, vector, entry):
+        """Store `entry` for `vector`, evicting LRU entries if full."""
+        entry_id = uuid.uuid4().hex
+        index_key = self._index_key(namespace)
+        entry_key = self._entry_key(namespace, entry_id)
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(
+            entry_key,
+            mapping={
+                "vector": vector.astype(np.float32).tobytes(),
+                "answer": entry["answer"],
+                "relevant_docs": json.dumps(entry["relevant_docs"]),
+                "generation_time": entry["generation_time"],
+            },
+        )
+        pipe.expire(entry_key, self.ttl)
+        pipe.zadd(index_key, {entry_id: time.time()})
+        pipe.expire(index_key, self.ttl)
+        self._new_version(pipe, namespace)
+        pipe.zcard(index_key)
+        size = (await pipe.execute())[-1]
+
+        if size > self.max_size:
+            evicted = await self.redis.zpopmin(index_key, size - self.max_size)
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(
+                *(self._entry_key(namespace, i.decode()) for i, _ in evicted)
+            )
+            self._new_version(pipe, namespace)
+            await pipe.execute()
+
+
+class SemanticCache:
+    """Answer cache matching new queries to similar earlier ones.
+
+    A query hits the cache when a stored query of the same model, with a
+    compatible chat history and the same corpus version, has a cosine
+    similarity of at least `threshold`. The corpus version is written to the
+    collection metadata by the ingestion script, so entries made before an
+    ingestion are never served afterwards.
+
+    parameters
+    ----------
+    backend : InMemoryCacheBackend or RedisCacheBackend
+        Storage of the cached entries.
+    threshold : float
+        Minimum cosine similarity for a hit.
+    history_turns : int
+        Number of most recent history messages that must match.
+    version_loader : callable, optional
+        Coroutine function returning the current corpus version.
+    version_check_interval : float
+        Seconds for which a loaded corpus version is reused.
+    """
+
+    def __init__(
+        self,
+        backend,
+        threshold=0.95,
+        history_turns=2,
+        version_loader=None,
+        version_check_interval=30,
+    ):
+        self.backend = backend
+        self.threshold = threshold
+        self.history_turns = history_turns
+        self.version_loader = version_loader
+        self.version_check_interval = version_check_interval
+        self._version = ""
+        self._version_checked = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    async def _corpus_version(self):
+        if self.version_loader is None:
+            return ""
+        now = time.monotonic()
+        if now - self._version_checked > self.version_check_interval:
+            self._version = await self.version_loader()
+            self._version_checked = now
+        return self._version
+
+    async def _namespace(self, model, chat_history):
+        version = await self._corpus_version()
+        fingerprint = history_fingerprint(chat_history, self.history_turns)
+        return f"{version}:{model}:{fingerprint}"
+
+    async def lookup(self, model, query_vector, chat_history):
+        """Return the cached answer for the query, or None on a miss.
+
+        parameters
+        ----------
+        model : str
+            Model name of the request.
+        query_vector : list of float
+            Embedding of the latest user message.
+        chat_history : list of dict
+            Messages preceding the latest user message.
+        """
+        namespace = await self._namespace(model, chat_history)
+        entry = await self.backend.search(
+            namespace, _normalize(query_vector), self.threshold
+        )
+        if entry is None:
+            self.misses += 1
+            CACHE_MISSES.labels("semantic").inc()
+            return None
+        self.hits += 1
+        CACHE_HITS.labels("semantic").inc()
+        self.saved_seconds += entry["generation_time"]
+        return entry
+
+    async def store(
+        self,
+        model,
+        query_vector,
+        chat_history,
+        answer,
+        relevant_docs,
+        generation_time,
+    ):
+        """Store the answer generated for a query.
+
+        parameters
+        ----------
+        generation_time : float
+            Seconds spent on retrieval and generation, reported as saved
+            time whenever the entry is hit.
+        """
+        namespace = await self._namespace(model, chat_history)
+        await self.backend.put(
+            namespace,
+            _normalize(query_vector),
+            {
+                "answer": answer,
+                "relevant_docs": relevant_docs,
+                "generation_time": generation_time,
+            },
+        )
+
+    def stats(self):
+        """Return hit rate and latency saved since the process started."""
+        lookups = self.hits + self.misses
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+def build_semantic_cache(config, version_loader=None):
+    """Create the semantic cache selected by `config.SEMANTIC_CACHE`.
+
+    Returns None if the cache is disabled.
+    """
+    if config.SEMANTIC_CACHE == "redis":
+        backend = RedisCacheBackend(
+            config.SEMANTIC_CACHE_REDIS_URL,
+            max_size=config.SEMANTIC_CACHE_SIZE,
+            ttl=config.SEMANTIC_CACHE_TTL,
+        )
+    elif config.SEMANTIC_CACHE == "memory":
+        backend = InMemoryCacheBackend(
+            max_size=config.SEMANTIC_CACHE_SIZE,
+            ttl=config.SEMANTIC_CACHE_TTL,
+        )
+    else:
+        return None
+
+    return SemanticCache(
+        backend,
+        threshold=config.SEMANTIC_CACHE_THRESHOLD,
+        history_turns=config.SEMANTIC_CACHE_HISTORY_TURNS,
+        version_loader=version_loader,
+        version_check_interval=config.SEMANTIC_CACHE_VERSION_CHECK,
+    )
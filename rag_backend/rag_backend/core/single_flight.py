@@ -0,0 +1,116 @@
+import asyncio
+
+from .metrics import COALESCED_REQUESTS
+from .semantic_cache import history_fingerprint
+
+
+def request_key(model, query, chat_history):
+    """Return the coalescing key of a chat request.
+
+    Requests share a key if they are for the same model, their queries only
+    differ in case and whitespace and their whole histories match.
+    """
+    normalized = " ".join(query.lower().split())
+    history = history_fingerprint(chat_history, len(chat_history))
+    return f"{model}\0{normalized}\0{history}"
+
+
+class _Broadcast:
+    """Runs an async generator once and replays its items to subscribers.
+
+    Subscribers joining late first get the items produced so far. The
+    generator is cancelled if every subscriber leaves before it finished.
+    """
+
+    def __init__(self, source):
+        self.items = []
+        self.done = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(source))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, source):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self):
+        self.subscribers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(self.items):
+                    yield self.items[position]
+                    position += 1
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.task.cancel()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests into one computation.
+
+    The first request for a key (the leader) starts the computation, the
+    requests arriving with the same key while it runs share its result, or
+    for streams, its items. The computation runs in its own task, so a
+    leader that disconnects does not fail the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _track(self, registry, key, task):
+        self.leaders += 1
+        task.add_done_callback(lambda _: registry.pop(key, None))
+
+    async def do(self, key, func):
+        """Return the result of ``await func()``, shared per key."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self._calls[key] = task
+            self._track(self._calls, key, task)
+        else:
+            self.coalesced += 1
+            COALESCED_REQUESTS.inc()
+        return await asyncio.shield(task)
+
+    def stream(self, key, func):
+        """Return an async iterator over the items of ``func()``, shared
+        per key.
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast(func())
+            self._streams[key] = broadcast
+            self._track(self._streams, key, broadcast.task)
+        else:
+            self.coalesced += 1
+            COALESCED_REQUESTS.inc()
+        return broadcast.subscribe()
+
+    def stats(self):
+        """Return how many requests ran and how many were coalesced."""
+        total = self.leaders + self.coalesced
+        return {
+            "requests": total,
+            "computed": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
@@ -1,22 +1,134 @@
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.retrieval import create_retrieval_chain
+from functools import lru_cache
+from operator import itemgetter
 
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import (
+    RunnableBranch,
+    RunnableLambda,
+    RunnablePassthrough,
+)
+
+from ..core.config import rag_config
 from .llms import llm_generator
-from .retriever import get_retriever
+from .packing import ContextPacker, count_prompt_tokens, get_tokenizer
+from .prompts import get_prompt, get_summary_prompt
+from .registry import ChainRegistry
+from .retriever import close_qdrant_clients, get_retriever
+
+
+def token_budgets(model_name):
+    """Return the prompt token budgets of `model_name`."""
+    budgets = rag_config.PROMPT_TOKEN_BUDGETS
+    return {**budgets["default"], **budgets.get(model_name, {})}
 
 
-def get_rag_chain(model_name, prompt):
+def build_rag_chain(model_name, prompt=None):
     """Prepare and return a RAG chain with the specified model and prompt.
 
+    The retrieved documents and the chat history are packed into the token
+    budgets of the model before the prompt is filled. Outputs are the
+    "answer", the retrieved "context" and the "packed" chain inputs with
+    their token counts. Inputs already carrying a "context" (e.g. retrieved
+    in a batch) skip retrieval.
+
     parameters
     ----------
     model_name : str
         The name of the model to use (e.g., "chatgpt-4o").
     prompt : langchain_core.prompts.ChatPromptTemplate
-        The prompt template to use for the chain.
+        The prompt template to use for the chain. Defaults to `get_prompt()`.
     """
+    # The langchain package is only needed here, not when serving starts
+    from langchain.chains.combine_documents import (
+        create_stuff_documents_chain,
+    )
+
+    if prompt is None:
+        prompt = get_prompt()
     llm = llm_generator(model_name)
     retriever = get_retriever()
+    tokenizer = get_tokenizer(rag_config.TOKENIZER_ENCODING)
+    packer = ContextPacker(
+        tokenizer,
+        token_budgets(model_name),
+        system_tokens=count_prompt_tokens(tokenizer, prompt),
+    )
     llm_chain = create_stuff_documents_chain(llm, prompt)
-    qa_chain = create_retrieval_chain(retriever, llm_chain)
+    retrieve_documents = (itemgetter("input") | retriever).with_config(
+        run_name="retrieve_documents"
+    )
+    context = RunnableBranch(
+        (lambda inputs: "context" in inputs, itemgetter("context")),
+        retrieve_documents,
+    )
+    qa_chain = (
+        RunnablePassthrough.assign(context=context)
+        | RunnablePassthrough.assign(packed=RunnableLambda(packer.pack))
+        | RunnablePassthrough.assign(answer=itemgetter("packed") | llm_chain)
+    ).with_config(run_name="retrieval_chain")
     return qa_chain
+
+
+chain_registry = ChainRegistry(
+    build_rag_chain, max_size=rag_config.CHAIN_CACHE_SIZE
+)
+
+
+def get_rag_chain(model_name):
+    """Return the cached RAG chain for `model_name`, building it on first
+    use.
+
+    parameters
+    ----------
+    model_name : str
+        The name of the model to use (e.g., "chatgpt-4o").
+    """
+    return chain_registry.get(model_name)
+
+
+async def aget_rag_chain(model_name):
+    """`get_rag_chain` for the event loop: building a chain creates clients
+    with blocking I/O, so a missing chain is built in a worker thread.
+
+    parameters
+    ----------
+    model_name : str
+        The name of the model to use (e.g., "chatgpt-4o").
+    """
+    return await chain_registry.aget(model_name)
+
+
+@lru_cache(maxsize=rag_config.CHAIN_CACHE_SIZE)
+def get_summary_chain(model_name):
+    """Return the chain folding conversation messages into a summary.
+
+    parameters
+    ----------
+    model_name : str
+        The name of the model to use (e.g., "chatgpt-4o").
+    """
+    return get_summary_prompt() | llm_generator(model_name) | StrOutputParser()
+
+
+def invalidate_rag_chains(model_name=None):
+    """Drop cached chains so they are rebuilt from the current config.
+
+    parameters
+    ----------
+    model_name : str, optional
+        Only drop the chain of this model. If None, every chain is dropped
+        together with the prompt template.
+    """
+    chain_registry.invalidate(model_name)
+    get_summary_chain.cache_clear()
+    if model_name is None:
+        get_prompt.cache_clear()
+
+
+async def reload_rag_chains(model_name=None):
+    """`invalidate_rag_chains`, also closing the shared Qdrant clients when
+    every chain is dropped so that they reconnect with the current config.
+    """
+    invalidate_rag_chains(model_name)
+    if model_name is None:
+        await close_qdrant_clients()
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+import redis
+import redis.asyncio as aioredis
+from langchain_core.embeddings import Embeddings
+
+from ..core.metrics import CACHE_HITS, CACHE_MISSES
+
+
+class CachedEmbeddings(Embeddings):
+    """Memoizing wrapper around a remote embedding model.
+
+    Embeddings are cached under a hash of the model name and the
+    whitespace-normalized text, in a bounded in-memory LRU tier and
+    optionally in a Redis tier shared between processes, which stores them
+    as compact float32 bytes. Concurrent `aembed_query` calls arriving within
+    `batch_window` seconds are embedded together in one upstream request.
+
+    parameters
+    ----------
+    embeddings : langchain_core.embeddings.Embeddings
+        The embedding model doing the actual work.
+    model_name : str
+        Name of the embedding model, part of every cache key.
+    max_size : int
+        Maximum number of embeddings kept in memory.
+    redis_url : str, optional
+        Enables the Redis tier, e.g. "redis://redis_db:6379/2".
+    redis_ttl : int
+        Seconds after which embeddings expire from Redis.
+    batch_window : float
+        Seconds to wait for more queries before sending a batch.
+    max_batch_size : int
+        Maximum number of texts sent in one upstream request.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        model_name,
+        max_size=10000,
+        redis_url=None,
+        redis_ttl=86400,
+        batch_window=0.005,
+        max_batch_size=64,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.redis_ttl = redis_ttl
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.redis = redis.Redis.from_url(redis_url) if redis_url else None
+        self.aredis = aioredis.Redis.from_url(redis_url) if redis_url else None
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Queries waiting for the next batch: cache key -> (text, future)
+        self._pending = {}
+        self._flush_handle = None
+        self._batch_tasks = set()
+
+    def _key(self, text):
+        normalized = " ".join(text.split())
+        digest = hashlib.sha1(
+            f"{self.model_name}\0{normalized}".encode()
+        ).hexdigest()
+        return f"embedding:{digest}"
+
+    def _get_memory(self, key):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            return vector
+
+    def _put_memory(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, texts):
+        """Return the cache keys of `texts` and their in-memory vectors."""
+        keys = [self._key(text) for text in texts]
+        vectors = [self._get_memory(key) for key in keys]
+        return keys, vectors
+
+    def _remember(self, keys, vectors, raw_vectors):
+        """Fill cache misses with the float32 bytes found in Redis."""
+        for i, raw in raw_vectors.items():
+            vector = np.frombuffer(raw, dtype=np.float32)
+            vectors[i] = vector
+            self._put_memory(keys[i], vector)
+
+    def _count(self, hits, misses):
+        self.hits += hits
+        self.misses += misses
+        CACHE_HITS.labels("embedding").inc(hits)
+        CACHE_MISSES.labels("embedding").inc(misses)
+
+    def _missing(self, vectors):
+        return [i for i, vector in enumerate(vectors) if vector is None]
+
+    def _store(self, keys, vectors, indices, embedded):
+        """Cache freshly embedded vectors; return Redis writes to make."""
+        writes = {}
+        for i, embedding in zip(indices, embedded):
+            vector = np.asarray(embedding, dtype=np.float32)
+            vectors[i] = vector
+            self._put_memory(keys[i], vector)
+            writes[keys[i]] = vector.tobytes()
+        self._count(len(vectors) - len(indices), len(indices))
+        return writes
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup(texts)
+
+        missing = self._missing(vectors)
+        if missing and self.redis is not None:
+            raws = self.redis.mget([keys[i] for i in missing])
+            self._remember(
+                keys, vectors, {i: r for i, r in zip(missing, raws) if r}
+            )
+            missing = self._missing(vectors)
+
+        embedded = []
+        for start in range(0, len(missing), self.max_batch_size):
+            batch = missing[start : start + self.max_batch_size]
+            embedded += self.embeddings.embed_documents(
+                [texts[i] for i in batch]
+            )
+        writes = self._store(keys, vectors, missing, embedded)
+
+        if writes and self.redis is not None:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, raw in writes.items():
+                pipe.set(key, raw, ex=self.redis_ttl)
+            pipe.execute()
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup(texts)
+
+        missing = self._missing(vectors)
+        if missing and self.aredis is not None:
+            raws = await self.aredis.mget([keys[i] for i in missing])
+            self._remember(
+                keys, vectors, {i: r for i, r in zip(missing, raws) if r}
+            )
+            missing = self._missing(vectors)
+
+        batches = [
+            missing[start : start + self.max_batch_size]
+            for start in range(0, len(missing), self.max_batch_size)
+        ]
+        results = await asyncio.gather(
+            *(
+                self.embeddings.aembed_documents([texts[i] for i in batch])
+                for batch in batches
+            )
+        )
+        embedded = [vector for result in results for vector in result]
+        writes = self._store(keys, vectors, missing, embedded)
+
+        if writes and self.aredis is not None:
+            pipe = self.aredis.pipeline(transaction=False)
+            for key, raw in writes.items():
+                pipe.set(key, raw, ex=self.redis_ttl)
+            await pipe.execute()
+        return [vector.tolist() for vector in vectors]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get_memory(key)
+        if vector is not None:
+            self._count(1, 0)
+            return vector.tolist()
+
+        # Identical concurrent queries share one pending future
+        pending = self._pending.get(key)
+        if pending is not None:
+            future = pending[1]
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = (text, future)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(
+                    self.batch_window, self._flush
+                )
+        # A cancelled caller must not cancel the future of the others
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        """Send all pending queries to the embedding model as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._embed_batch(list(batch.values())))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _embed_batch(self, batch):
+        futures = [future for _, future in batch]
+        try:
+            vectors = await self.aembed_documents([text for text, _ in batch])
+        except Exception as exc:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future, vector in zip(futures, vectors):
+            if not future.done():
+                future.set_result(vector)
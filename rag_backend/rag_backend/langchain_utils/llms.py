@@ -1,30 +1,43 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from openai import OpenAI
+from functools import lru_cache
 
 from ..core.config import rag_config
+from .router import LLMRouter, RoutedChatModel
 
-openai_client = OpenAI(
-    api_key=rag_config.OPENAI_API_KEY, base_url=rag_config.OPENAI_ENDPOINT
-)
+
+@lru_cache(maxsize=1)
+def get_llm_router():
+    """Initialize and return the router shared by every chat model."""
+    return LLMRouter(
+        rag_config.OPENAI_ENDPOINTS,
+        rag_config.OPENAI_API_KEY,
+        model_endpoints=rag_config.LLM_MODEL_ENDPOINTS,
+        strategy=rag_config.LLM_ROUTING_STRATEGY,
+        failure_threshold=rag_config.LLM_FAILURE_THRESHOLD,
+        ejection_time=rag_config.LLM_EJECTION_TIME,
+        probe_interval=rag_config.LLM_PROBE_INTERVAL,
+        models_ttl=rag_config.LLM_MODELS_TTL,
+        max_attempts=rag_config.LLM_MAX_ATTEMPTS,
+    )
 
 
 def llm_generator(model_name):
-    """Initialize and return a ChatOpenAI generator instance.
+    """Initialize and return a chat model routed over the LLM endpoints.
     parameters
     ----------
     model_name : str
         The name of the model to use (e.g., "chatgpt-4o").
     """
-    return ChatOpenAI(
-        model_name=model_name,
-        api_key=rag_config.OPENAI_API_KEY,
-        base_url=rag_config.OPENAI_ENDPOINT,
-        temperature=0,
+    return RoutedChatModel(
+        router=get_llm_router(), model_name=model_name, temperature=0
     )
 
 
 def llm_embedder():
     """Initialize and return an OpenAIEmbeddings instance."""
+    # langchain_openai pulls in the whole openai package, only import it
+    # once embeddings are needed
+    from langchain_openai import OpenAIEmbeddings
+
     return OpenAIEmbeddings(
         model=rag_config.OPENAI_EMBEDDING_MODEL_NAME,
         openai_api_base=rag_config.OPENAI_ENDPOINT,
@@ -0,0 +1,177 @@
+import logging
+import re
+from functools import lru_cache
+
+from langchain_core.documents import Document
+
+from ..core.metrics import TOKENS, stage
+
+logger = logging.getLogger(__name__)
+
+# Tokens added by the chat format around every message
+MESSAGE_OVERHEAD = 4
+# Tokens of the separator between two documents in the stuffed context
+DOCUMENT_OVERHEAD = 2
+
+
+class ApproximateTokenizer:
+    """Tokenizer used when no BPE encoding can be loaded (e.g. offline).
+
+    Words, punctuation and whitespace runs count as one token each, which
+    is close to BPE token counts for English prose and code.
+    """
+
+    pattern = re.compile(r"\w+|[^\w\s]|\s+")
+
+    def encode(self, text):
+        return self.pattern.findall(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=4)
+def get_tokenizer(encoding_name="cl100k_base"):
+    """Load a tiktoken encoding once per process.
+
+    Falls back to `ApproximateTokenizer` if the encoding is not available,
+    tiktoken downloads encodings on first use.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as exc:
+        logger.warning(
+            "Tokenizer %r unavailable (%s), token counts are approximate",
+            encoding_name,
+            exc,
+        )
+        return ApproximateTokenizer()
+
+
+class ContextPacker:
+    """Fit the chat history and retrieved documents into token budgets.
+
+    The system prompt, the chat history and the retrieved context each get
+    a budget. History is kept from the most recent message backwards, after
+    the system messages (the conversation summary sent by the bot).
+    Documents are added by decreasing relevance; the first one that does
+    not fit is trimmed at both edges (where overlapping splits repeat their
+    neighbours) rather than dropped. A system prompt over its budget takes
+    the excess from the context budget.
+
+    parameters
+    ----------
+    tokenizer : object
+        Tokenizer with `encode` and `decode`, see `get_tokenizer`.
+    budgets : dict
+        Token budgets of "system", "history" and "context".
+    system_tokens : int
+        Tokens of the prompt without history, question and context.
+    min_chunk_tokens : int
+        Smallest piece of a trimmed message or document worth keeping.
+    """
+
+    def __init__(self, tokenizer, budgets, system_tokens, min_chunk_tokens=64):
+        self.tokenizer = tokenizer
+        self.budgets = budgets
+        self.system_tokens = system_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+        self._encode = lru_cache(maxsize=4096)(
+            lambda text: tuple(tokenizer.encode(text))
+        )
+
+    def _fit_messages(self, messages, remaining):
+        """Take `messages` in order while they fit in `remaining` tokens."""
+        packed = []
+        for message in messages:
+            tokens = self._encode(message["content"])
+            cost = len(tokens) + MESSAGE_OVERHEAD
+            if cost > remaining:
+                keep = remaining - MESSAGE_OVERHEAD
+                if keep >= self.min_chunk_tokens:
+                    # Keep the end of the message, closest to the question
+                    content = self.tokenizer.decode(list(tokens[-keep:]))
+                    packed.append(dict(message, content=content))
+                    remaining -= keep + MESSAGE_OVERHEAD
+                break
+            packed.append(message)
+            remaining -= cost
+        return packed, remaining
+
+    def _pack_history(self, chat_history):
+        budget = self.budgets["history"]
+        summary = [m for m in chat_history if m["role"] == "system"]
+        recent = [m for m in chat_history if m["role"] != "system"]
+        summary, remaining = self._fit_messages(summary, budget)
+        recent, remaining = self._fit_messages(reversed(recent), remaining)
+        return summary + recent[::-1], budget - remaining
+
+    def _pack_context(self, documents):
+        budget = self.budgets["context"] - max(
+            0, self.system_tokens - self.budgets["system"]
+        )
+        remaining = budget
+        ranked = sorted(
+            documents,
+            key=lambda doc: doc.metadata.get("relevance_score", 0.0),
+            reverse=True,
+        )
+        packed = []
+        for doc in ranked:
+            tokens = self._encode(doc.page_content)
+            cost = len(tokens) + DOCUMENT_OVERHEAD
+            if cost > remaining:
+                keep = remaining - DOCUMENT_OVERHEAD
+                if keep >= self.min_chunk_tokens:
+                    start = (len(tokens) - keep) // 2
+                    content = self.tokenizer.decode(
+                        list(tokens[start : start + keep])
+                    )
+                    packed.append(
+                        Document(page_content=content, metadata=doc.metadata)
+                    )
+                    remaining -= keep + DOCUMENT_OVERHEAD
+                break
+            packed.append(doc)
+            remaining -= cost
+        return packed, budget - remaining
+
+    def pack(self, inputs):
+        """Return the chain inputs with packed history and context.
+
+        The token counts of every part are added under "tokens".
+        """
+        with stage("pack").time():
+            chat_history, history_tokens = self._pack_history(
+                inputs["chat_history"]
+            )
+            context, context_tokens = self._pack_context(inputs["context"])
+            tokens = {
+                "system": self.system_tokens,
+                "history": history_tokens,
+                "input": len(self._encode(inputs["input"])),
+                "context": context_tokens,
+            }
+            tokens["total"] = sum(tokens.values())
+        TOKENS.labels("prompt").inc(tokens["total"])
+        return {
+            "input": inputs["input"],
+            "chat_history": chat_history,
+            "context": context,
+            "tokens": tokens,
+        }
+
+
+def count_prompt_tokens(tokenizer, prompt):
+    """Count the tokens of `prompt` with empty history, input and context.
+
+    This includes the message overhead of the question and the context
+    header, so only their content is counted per request.
+    """
+    messages = prompt.format_messages(input="", chat_history=[], context="")
+    return sum(
+        len(tokenizer.encode(message.content)) + MESSAGE_OVERHEAD
+        for message in messages
+    )
@@ -1,6 +1,8 @@
+from functools import lru_cache
+
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-prompt_text = """
+default_prompt_text = """
 You are a senior research assistant and expert Python software developer.
 Your role is to help researchers understand the organization's internal
 research materials, codebases, and documentation.
@@ -23,13 +25,23 @@ code or functionality.
 """
 
 
+summary_prompt_text = """
+You maintain a running summary of a conversation between a user and a
+research assistant. Update the summary with the new messages. Keep the
+facts, names, decisions, open questions and code identifiers needed to
+continue the conversation, drop greetings and repetitions. Answer with the
+updated summary only, in at most 300 words.
+"""
+
+
+@lru_cache(maxsize=8)
 def get_prompt(prompt_text=None):
     """Get the chat prompt template. If no prompt_text is provided, use the
     default.
     """
 
     if prompt_text is None:
-        prompt_text = prompt_text
+        prompt_text = default_prompt_text
 
     return ChatPromptTemplate.from_messages(
         [
@@ -43,3 +55,17 @@ def get_prompt(prompt_text=None):
             ("system", "Context retrieved from documents:\n{context}"),
         ]
     )
+
+
+@lru_cache(maxsize=1)
+def get_summary_prompt():
+    """Get the chat prompt template folding messages into a summary."""
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", summary_prompt_text),
+            (
+                "user",
+                "Current summary:\n{summary}\n\nNew messages:\n{messages}",
+            ),
+        ]
+    )
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ChainRegistry:
+    """Process-wide, size-bounded cache of objects built per model name.
+
+    Building a RAG chain allocates a new LLM client, retriever and LangChain
+    runnables, so it is done once per model and the result is reused by all
+    later requests. The least recently used entry is evicted once more than
+    ``max_size`` models are cached.
+
+    parameters
+    ----------
+    factory : callable
+        Called with the model name to build a missing entry.
+    max_size : int
+        Maximum number of cached entries.
+    """
+
+    def __init__(self, factory, max_size=16):
+        self.factory = factory
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        # Model name -> future of the entry being built
+        self._building = {}
+        # Bumped by every invalidation, entries built meanwhile may be
+        # stale and are not cached
+        self._generation = 0
+        # Entries are built in threads, guard the shared dicts. Builds run
+        # outside of it: they do blocking I/O and must not hold up other
+        # models nor the lookups of cached entries.
+        self._lock = threading.Lock()
+
+    def cached(self, model_name):
+        """Return the cached entry for `model_name`, or None, never
+        building it.
+        """
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is not None:
+                self._entries.move_to_end(model_name)
+            return entry
+
+    def get(self, model_name):
+        """Return the cached entry for `model_name`, building it if needed.
+
+        Concurrent callers asking for the same missing entry wait for a
+        single build.
+        """
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is not None:
+                self._entries.move_to_end(model_name)
+                return entry
+            building = self._building.get(model_name)
+            if building is None:
+                building = self._building[model_name] = Future()
+                generation = self._generation
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return building.result()
+
+        try:
+            entry = self.factory(model_name)
+        except BaseException as exc:
+            with self._lock:
+                if self._building.get(model_name) is building:
+                    del self._building[model_name]
+            building.set_exception(exc)
+            raise
+        with self._lock:
+            if self._building.get(model_name) is building:
+                del self._building[model_name]
+            if generation == self._generation:
+                self._entries[model_name] = entry
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        building.set_result(entry)
+        return entry
+
+    async def aget(self, model_name):
+        """`get` for the event loop: a missing entry is built in a worker
+        thread.
+        """
+        entry = self.cached(model_name)
+        if entry is None:
+            entry = await asyncio.to_thread(self.get, model_name)
+        return entry
+
+    def invalidate(self, model_name=None):
+        """Drop the entry of `model_name`, or every entry if it is None.
+
+        Builds in progress complete for their callers but are not cached.
+        """
+        with self._lock:
+            self._generation += 1
+            if model_name is None:
+                self._entries.clear()
+                self._building.clear()
+            else:
+                self._entries.pop(model_name, None)
+                self._building.pop(model_name, None)
+
+    def warmup(self, model_names):
+        """Build the entries of `model_names` ahead of the first request."""
+        for model_name in model_names:
+            self.get(model_name)
+
+    def __contains__(self, model_name):
+        return model_name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,75 @@
+import importlib
+
+import numpy as np
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _min_max(scores):
+    low, high = scores.min(), scores.max()
+    return (
+        (scores - low) / (high - low) if high > low else np.ones_like(scores)
+    )
+
+
+def mmr_select(query_vector, doc_vectors, k, lambda_mult=0.7, scores=None):
+    """Select `k` relevant and mutually diverse candidates.
+
+    Maximal marginal relevance: every step picks the candidate maximizing
+    ``lambda_mult * relevance - (1 - lambda_mult) * redundancy``, where the
+    redundancy is the highest cosine similarity to an already selected
+    candidate. All pairwise similarities are computed in one matrix product
+    up front, so each step is a vector update.
+
+    parameters
+    ----------
+    query_vector : list of float
+        Embedding of the query.
+    doc_vectors : list of list of float
+        Embeddings of the candidates.
+    k : int
+        Number of candidates to select.
+    lambda_mult : float
+        1 ranks by relevance only, 0 by diversity only.
+    scores : list of float, optional
+        Relevance of the candidates, e.g. from a reranker, instead of the
+        cosine similarity to the query.
+
+    Returns the indices of the selected candidates, best first, and their
+    relevance.
+    """
+    docs = _unit_rows(np.asarray(doc_vectors, dtype=np.float32))
+    query = _unit_rows(np.asarray(query_vector, dtype=np.float32))
+    if scores is None:
+        relevance = docs @ query
+    else:
+        relevance = _min_max(np.asarray(scores, dtype=np.float32))
+    similarity = docs @ docs.T
+
+    k = min(k, len(docs))
+    selected = []
+    redundancy = np.zeros(len(docs), dtype=np.float32)
+    available = np.ones(len(docs), dtype=bool)
+    for _ in range(k):
+        mmr = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        best = int(np.argmax(np.where(available, mmr, -np.inf)))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected, relevance[selected].tolist()
+
+
+def load_reranker(path):
+    """Import a reranker from a "package.module:function" path.
+
+    A reranker is called as ``reranker(query, texts)`` and returns one
+    relevance score per text, higher is better (e.g. a local cross-encoder).
+    Returns None if `path` is empty.
+    """
+    if not path:
+        return None
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
@@ -1,29 +1,342 @@
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Any, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import (
+    Fusion,
+    FusionQuery,
+    Prefetch,
+    QuantizationSearchParams,
+    QueryRequest,
+    SearchParams,
+)
 
 from ..core.config import rag_config
+from ..core.metrics import stage
+from .embeddings import CachedEmbeddings
 from .llms import llm_embedder
+from .rerank import load_reranker, mmr_select
+from .sparse import encode_query
+
+# Payload keys used by `QdrantVectorStore` when documents are ingested
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+# Collection metadata key changed by the ingestion script on every write
+INGEST_VERSION_KEY = "ingest_version"
 
-embedder = llm_embedder()
+logger = logging.getLogger(__name__)
 
 
-def get_vectorstore():
-    """Initialize and return the Qdrant vector store."""
-    qdrant_client = QdrantClient(
-        host=rag_config.VECTORDB_HOST, port=rag_config.VECTORDB_PORT
+@lru_cache(maxsize=1)
+def get_embedder():
+    """Initialize and return the shared cached query embedder."""
+    return CachedEmbeddings(
+        llm_embedder(),
+        model_name=rag_config.OPENAI_EMBEDDING_MODEL_NAME,
+        max_size=rag_config.EMBEDDING_CACHE_SIZE,
+        redis_url=rag_config.EMBEDDING_CACHE_REDIS_URL,
+        redis_ttl=rag_config.EMBEDDING_CACHE_TTL,
+        batch_window=rag_config.EMBEDDING_BATCH_WINDOW_MS / 1000,
+        max_batch_size=rag_config.EMBEDDING_MAX_BATCH_SIZE,
     )
 
-    vectordb = QdrantVectorStore(
-        client=qdrant_client,
-        collection_name=rag_config.VECTORDB_COLLECTION,
-        embedding=embedder,
+
+@lru_cache(maxsize=1)
+def get_qdrant_client():
+    """Initialize and return the shared synchronous Qdrant client."""
+    return QdrantClient(
+        host=rag_config.VECTORDB_HOST,
+        port=rag_config.VECTORDB_PORT,
+        grpc_port=rag_config.VECTORDB_GRPC_PORT,
+        prefer_grpc=rag_config.VECTORDB_PREFER_GRPC,
     )
-    return vectordb
 
 
+@lru_cache(maxsize=1)
+def get_async_qdrant_client():
+    """Initialize and return the shared asynchronous Qdrant client."""
+    return AsyncQdrantClient(
+        host=rag_config.VECTORDB_HOST,
+        port=rag_config.VECTORDB_PORT,
+        grpc_port=rag_config.VECTORDB_GRPC_PORT,
+        prefer_grpc=rag_config.VECTORDB_PREFER_GRPC,
+    )
+
+
+async def close_qdrant_clients():
+    """Close the shared Qdrant clients that were built and drop them with
+    the retriever using them, so the next use builds new ones.
+    """
+    get_retriever.cache_clear()
+    clients = []
+    for getter in (get_qdrant_client, get_async_qdrant_client):
+        if getter.cache_info().currsize:
+            clients.append(getter())
+        getter.cache_clear()
+    for client in clients:
+        closed = client.close()
+        if asyncio.iscoroutine(closed):
+            await closed
+
+
+def get_search_params():
+    """Return the configured search parameters, or None for Qdrant's
+    defaults.
+
+    The quantization parameters only apply to quantized collections, where
+    `oversampling` times more candidates are fetched with the quantized
+    vectors and rescored with the original ones.
+    """
+    quantization = None
+    if rag_config.VECTORDB_OVERSAMPLING or not rag_config.VECTORDB_RESCORE:
+        quantization = QuantizationSearchParams(
+            rescore=rag_config.VECTORDB_RESCORE,
+            oversampling=rag_config.VECTORDB_OVERSAMPLING or None,
+        )
+    if not (
+        rag_config.VECTORDB_HNSW_EF
+        or rag_config.VECTORDB_EXACT
+        or quantization
+    ):
+        return None
+    return SearchParams(
+        hnsw_ef=rag_config.VECTORDB_HNSW_EF or None,
+        exact=rag_config.VECTORDB_EXACT,
+        quantization=quantization,
+    )
+
+
+async def get_corpus_version():
+    """Return the version of the collection content written at ingestion."""
+    info = await get_async_qdrant_client().get_collection(
+        rag_config.VECTORDB_COLLECTION
+    )
+    return str((info.config.metadata or {}).get(INGEST_VERSION_KEY, ""))
+
+
+class QdrantRetriever(BaseRetriever):
+    """Retriever searching a Qdrant collection with sync or async clients.
+
+    `QdrantVectorStore` only implements synchronous search, so in an async
+    chain the query embedding and the search would be pushed to a thread.
+    This retriever awaits both natively on the event loop instead, and keeps
+    a synchronous path for `invoke`.
+
+    In "hybrid" mode a dense and a sparse (BM25) search are run in the same
+    request and their results merged with reciprocal rank fusion, which
+    keeps exact matches of identifiers that dense embeddings tend to miss.
+
+    With `fetch_k` larger than `k`, `fetch_k` candidates are fetched with
+    their vectors and the `k` handed to the LLM are chosen by maximal
+    marginal relevance, so near-duplicate chunks of overlapping splits do not
+    fill the prompt. An optional `reranker` scores the candidates first.
+
+    `abatch_retrieve` serves many queries with one embedding request and
+    Qdrant batch searches.
+
+    `search_params` (e.g. `hnsw_ef`, exact search or the oversampling of
+    quantized vectors) apply to the dense search, and Qdrant aborts
+    searches taking longer than `timeout` seconds.
+    """
+
+    client: Any
+    async_client: Any
+    embeddings: Any
+    collection_name: str
+    k: int = 5
+    mode: str = "dense"
+    sparse_vector_name: str = "sparse"
+    prefetch_k: int = 20
+    fetch_k: int = 0
+    mmr_lambda: float = 0.7
+    reranker: Any = None
+    search_params: Any = None
+    timeout: Optional[int] = None
+
+    @property
+    def _reranking(self):
+        return self.fetch_k > self.k
+
+    def _query_kwargs(self, query, vector):
+        kwargs = {
+            "limit": self.fetch_k if self._reranking else self.k,
+            "with_vectors": self._reranking,
+        }
+        if self.mode != "hybrid":
+            return dict(kwargs, query=vector, search_params=self.search_params)
+        prefetch_limit = max(self.prefetch_k, kwargs["limit"])
+        return dict(
+            kwargs,
+            prefetch=[
+                Prefetch(
+                    query=vector,
+                    params=self.search_params,
+                    limit=prefetch_limit,
+                ),
+                Prefetch(
+                    query=encode_query(query),
+                    using=self.sparse_vector_name,
+                    limit=prefetch_limit,
+                ),
+            ],
+            query=FusionQuery(fusion=Fusion.RRF),
+        )
+
+    def _rerank(self, query, vector, points):
+        """Pick the best `k` diverse points out of the fetched candidates."""
+        if not self._reranking or not points:
+            return self._to_documents(points)
+        documents = self._to_documents(points)
+        scores = None
+        if self.reranker is not None:
+            texts = [doc.page_content for doc in documents]
+            scores = self.reranker(query, texts)
+        elif self.mode == "hybrid":
+            # Keep the fused ranking, the dense similarity alone would undo it
+            scores = [point.score for point in points]
+        # Collections with a sparse vector return the vectors by name
+        doc_vectors = [
+            p.vector[""] if isinstance(p.vector, dict) else p.vector
+            for p in points
+        ]
+        selected, relevance = mmr_select(
+            vector, doc_vectors, self.k, self.mmr_lambda, scores
+        )
+        for i, score in zip(selected, relevance):
+            documents[i].metadata["relevance_score"] = score
+        return [documents[i] for i in selected]
+
+    @staticmethod
+    def _to_documents(points):
+        return [
+            Document(
+                page_content=point.payload.get(CONTENT_KEY, ""),
+                metadata=point.payload.get(METADATA_KEY) or {},
+            )
+            for point in points
+        ]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager=None
+    ) -> List[Document]:
+        with stage("embed").time():
+            vector = self.embeddings.embed_query(query)
+        with stage("search").time():
+            response = self.client.query_points(
+                self.collection_name,
+                timeout=self.timeout,
+                **self._query_kwargs(query, vector),
+            )
+        with stage("rerank").time():
+            return self._rerank(query, vector, response.points)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager=None
+    ) -> List[Document]:
+        with stage("embed").time():
+            vector = await self.embeddings.aembed_query(query)
+        with stage("search").time():
+            response = await self.async_client.query_points(
+                self.collection_name,
+                timeout=self.timeout,
+                **self._query_kwargs(query, vector),
+            )
+        with stage("rerank").time():
+            if self.reranker is not None:
+                # A local reranker model would block the event loop
+                return await asyncio.to_thread(
+                    self._rerank, query, vector, response.points
+                )
+            return self._rerank(query, vector, response.points)
+
+    async def abatch_retrieve(self, queries, vectors=None, batch_size=64):
+        """Retrieve the documents of many queries at once.
+
+        parameters
+        ----------
+        queries : list of str
+            The queries to retrieve documents for.
+        vectors : list of list of float, optional
+            Embeddings of `queries`, embedded in one batch if not given.
+        batch_size : int
+            Maximum number of searches sent in one Qdrant request.
+        """
+        if vectors is None:
+            with stage("embed").time():
+                vectors = await self.embeddings.aembed_documents(queries)
+        requests = []
+        for query, vector in zip(queries, vectors):
+            kwargs = self._query_kwargs(query, vector)
+            requests.append(
+                QueryRequest(
+                    with_vector=kwargs.pop("with_vectors"),
+                    params=kwargs.pop("search_params", None),
+                    with_payload=True,
+                    **kwargs,
+                )
+            )
+        with stage("search").time():
+            responses = await asyncio.gather(
+                *(
+                    self.async_client.query_batch_points(
+                        self.collection_name,
+                        requests=requests[start : start + batch_size],
+                        timeout=self.timeout,
+                    )
+                    for start in range(0, len(requests), batch_size)
+                )
+            )
+        points = [r.points for batch in responses for r in batch]
+        with stage("rerank").time():
+            if self.reranker is not None:
+                return await asyncio.to_thread(
+                    lambda: list(map(self._rerank, queries, vectors, points))
+                )
+            return list(map(self._rerank, queries, vectors, points))
+
+
+def get_retrieval_mode(client):
+    """Return the configured retrieval mode, or "dense" if it is "hybrid"
+    but the collection was created without the sparse vector, which every
+    hybrid search would fail on.
+    """
+    if rag_config.RETRIEVAL_MODE != "hybrid":
+        return rag_config.RETRIEVAL_MODE
+    collection = client.get_collection(rag_config.VECTORDB_COLLECTION)
+    if rag_config.VECTORDB_SPARSE_NAME in (
+        collection.config.params.sparse_vectors or {}
+    ):
+        return "hybrid"
+    logger.warning(
+        f"Collection {rag_config.VECTORDB_COLLECTION} has no "
+        f"'{rag_config.VECTORDB_SPARSE_NAME}' sparse vector, falling back "
+        "to dense retrieval; recreate and ingest it again for hybrid"
+    )
+    return "dense"
+
+
+@lru_cache(maxsize=1)
 def get_retriever():
-    """Get a retriever from the vector store with specified search
-    parameters.
+    """Initialize and return the shared retriever of the vector store with
+    the configured search parameters, used by the chains of every model.
     """
-    vectordb = get_vectorstore()
-    return vectordb.as_retriever(search_kwargs={"k": rag_config.VECTORDB_TOPK})
+    client = get_qdrant_client()
+    return QdrantRetriever(
+        client=client,
+        async_client=get_async_qdrant_client(),
+        embeddings=get_embedder(),
+        collection_name=rag_config.VECTORDB_COLLECTION,
+        k=int(rag_config.VECTORDB_TOPK),
+        mode=get_retrieval_mode(client),
+        sparse_vector_name=rag_config.VECTORDB_SPARSE_NAME,
+        prefetch_k=rag_config.VECTORDB_PREFETCH_K,
+        fetch_k=rag_config.RERANK_FETCH_K,
+        mmr_lambda=rag_config.RERANK_MMR_LAMBDA,
+        reranker=load_reranker(rag_config.RERANKER),
+        search_params=get_search_params(),
+        timeout=rag_config.VECTORDB_TIMEOUT or None,
+    )
@@ -0,0 +1,513 @@
+import asyncio
+import logging
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from ..core.metrics import (
+    LLM_ENDPOINT_FAILURES,
+    LLM_ENDPOINT_HEALTHY,
+    LLM_ENDPOINT_OUTSTANDING,
+    TOKENS,
+    TOKENS_PER_SECOND,
+    stage,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def failover_errors():
+    """Return the errors another endpoint may not have; others (e.g. a bad
+    request) would fail the same way everywhere.
+
+    The openai package is slow to import and only needed once a router is
+    built, so it is not imported with this module.
+    """
+    import openai
+
+    return (
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        openai.RateLimitError,
+    )
+
+
+class Endpoint:
+    """An OpenAI-compatible inference server and its health statistics."""
+
+    def __init__(self, url, api_key):
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        self.url = url
+        # Shared with the chat models, so the connections opened by listing
+        # the models are reused by the first generations
+        self.http_client = DefaultAsyncHttpxClient()
+        self.client = AsyncOpenAI(
+            api_key=api_key, base_url=url, http_client=self.http_client
+        )
+        self._outstanding_gauge = LLM_ENDPOINT_OUTSTANDING.labels(url)
+        self._healthy_gauge = LLM_ENDPOINT_HEALTHY.labels(url)
+        self.failures_counter = LLM_ENDPOINT_FAILURES.labels(url)
+        self.outstanding = 0
+        # Exponentially weighted moving average of the latency in seconds
+        self.latency = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    # Mirrored into gauges on change, so that they can be merged over the
+    # workers of a multi-process server
+
+    @property
+    def outstanding(self):
+        return self._outstanding
+
+    @outstanding.setter
+    def outstanding(self, value):
+        self._outstanding = value
+        self._outstanding_gauge.set(value)
+
+    @property
+    def ejected_until(self):
+        return self._ejected_until
+
+    @ejected_until.setter
+    def ejected_until(self, value):
+        # The gauge reads 1 again once the endpoint answered, not as soon as
+        # the ejection time ran out
+        self._ejected_until = value
+        self._healthy_gauge.set(int(time.monotonic() >= value))
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.ejected_until
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "latency_ewma": self.latency,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class LLMRouter:
+    """Load balancer over OpenAI-compatible endpoints serving the models.
+
+    Each call goes to the healthy endpoint serving the model with the
+    fewest outstanding requests ("least_outstanding") or the lowest latency
+    EWMA weighted by its outstanding requests ("ewma"). An endpoint failing
+    `failure_threshold` times in a row is ejected for `ejection_time`
+    seconds; a background probe lists its models to readmit it as soon as
+    it answers again.
+
+    Which endpoint serves which model is read from `model_endpoints` or
+    else discovered by listing the models of every endpoint, refreshed
+    every `models_ttl` seconds. Models not found anywhere are tried on all
+    endpoints.
+
+    parameters
+    ----------
+    urls : list of str
+        Base URLs of the endpoints.
+    api_key : str
+        API key sent to every endpoint.
+    model_endpoints : dict, optional
+        Model name -> base URLs serving it, overriding discovery.
+    strategy : str
+        "least_outstanding" or "ewma".
+    failure_threshold : int
+        Consecutive failures after which an endpoint is ejected.
+    ejection_time : float
+        Seconds an ejected endpoint is skipped unless a probe readmits it.
+    probe_interval : float
+        Seconds between probes of ejected endpoints.
+    models_ttl : float
+        Seconds the discovered model lists are reused.
+    max_attempts : int
+        Endpoints tried per call before the error is raised.
+    ewma_alpha : float
+        Weight of the latest latency in the moving average.
+    """
+
+    def __init__(
+        self,
+        urls,
+        api_key,
+        model_endpoints=None,
+        strategy="least_outstanding",
+        failure_threshold=3,
+        ejection_time=30.0,
+        probe_interval=10.0,
+        models_ttl=60.0,
+        max_attempts=3,
+        ewma_alpha=0.3,
+    ):
+        if strategy not in ("least_outstanding", "ewma"):
+            raise ValueError(f"Unknown LLM routing strategy {strategy!r}")
+        if max_attempts < 1:
+            raise ValueError(
+                f"LLM max attempts must be at least 1, got {max_attempts}"
+            )
+        self.api_key = api_key
+        self.endpoints = [Endpoint(url, api_key) for url in urls]
+        self.model_endpoints = model_endpoints or {}
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.ejection_time = ejection_time
+        self.probe_interval = probe_interval
+        self.models_ttl = models_ttl
+        self.max_attempts = max_attempts
+        self.ewma_alpha = ewma_alpha
+        # url -> model names, discovered from the endpoints
+        self._models = {}
+        self._models_updated = None
+        self._refreshing = None
+        self._probe_task = None
+        # (base URL, model name, temperature) -> ChatOpenAI
+        self._chat_models = {}
+
+    def chat_model(self, endpoint, model_name, temperature):
+        """Return the client calling `model_name` on `endpoint`."""
+        key = (endpoint.url, model_name, temperature)
+        if key not in self._chat_models:
+            from langchain_openai import ChatOpenAI
+
+            self._chat_models[key] = ChatOpenAI(
+                model_name=model_name,
+                api_key=self.api_key,
+                base_url=endpoint.url,
+                temperature=temperature,
+                http_async_client=endpoint.http_client,
+                # Failing over replaces the retries of the client
+                max_retries=0,
+            )
+        return self._chat_models[key]
+
+    def warmup(self, model_names, temperature=0):
+        """Create the clients of `model_names` on the endpoints serving them
+        ahead of their first call.
+        """
+        for model_name in model_names:
+            for endpoint in self._candidates(model_name):
+                self.chat_model(endpoint, model_name, temperature)
+
+    def _candidates(self, model_name):
+        urls = self.model_endpoints.get(model_name)
+        if urls is None:
+            urls = [
+                u for u, names in self._models.items() if model_name in names
+            ]
+        endpoints = [e for e in self.endpoints if e.url in urls]
+        return endpoints or self.endpoints
+
+    def choose(self, model_name, exclude=()):
+        """Return the endpoint the next call for `model_name` goes to."""
+        candidates = [
+            e for e in self._candidates(model_name) if e not in exclude
+        ] or self._candidates(model_name)
+        # Ejected endpoints are only used when nothing else is left
+        healthy = [e for e in candidates if e.healthy] or candidates
+        if self.strategy == "ewma":
+            return min(
+                healthy,
+                key=lambda e: ((e.latency or 0.0) * (e.outstanding + 1)),
+            )
+        return min(healthy, key=lambda e: (e.outstanding, e.latency or 0.0))
+
+    def _record_success(self, endpoint, latency):
+        endpoint.consecutive_failures = 0
+        endpoint.ejected_until = 0.0
+        if endpoint.latency is None:
+            endpoint.latency = latency
+        else:
+            endpoint.latency += self.ewma_alpha * (latency - endpoint.latency)
+
+    def _record_failure(self, endpoint, exc):
+        endpoint.failures += 1
+        endpoint.failures_counter.inc()
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.failure_threshold:
+            endpoint.ejected_until = time.monotonic() + self.ejection_time
+            logger.warning(f"Ejecting LLM endpoint {endpoint.url}: {exc}")
+
+    def _attempts(self, model_name):
+        """Yield endpoints to try, never the same twice while others
+        are left.
+        """
+        tried = []
+        for _ in range(self.max_attempts):
+            endpoint = self.choose(model_name, exclude=tried)
+            tried.append(endpoint)
+            yield endpoint
+
+    async def _list_endpoint_models(self, endpoint):
+        page = await endpoint.client.models.list()
+        return {model.id for model in page.data}
+
+    async def refresh_models(self):
+        """List the models of every endpoint, probing them at the same
+        time.
+
+        Returns the number of endpoints that answered.
+        """
+        results = await asyncio.gather(
+            *(self._list_endpoint_models(e) for e in self.endpoints),
+            return_exceptions=True,
+        )
+        for endpoint, result in zip(self.endpoints, results):
+            if isinstance(result, Exception):
+                self._record_failure(endpoint, result)
+            else:
+                self._models[endpoint.url] = result
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = 0.0
+        self._models_updated = time.monotonic()
+        return sum(not isinstance(r, Exception) for r in results)
+
+    async def list_models(self):
+        """Return the models served by any endpoint.
+
+        Upstream is only asked once the lists are older than `models_ttl`,
+        and concurrent callers share the refresh.
+        """
+        stale = (
+            self._models_updated is None
+            or time.monotonic() - self._models_updated > self.models_ttl
+        )
+        if stale:
+            if self._refreshing is None or self._refreshing.done():
+                self._refreshing = asyncio.create_task(self.refresh_models())
+            await asyncio.shield(self._refreshing)
+        names = set(self.model_endpoints)
+        for models in self._models.values():
+            names |= models
+        return sorted(names)
+
+    async def _probe(self):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                ejected = [e for e in self.endpoints if not e.healthy]
+                stale = (
+                    self._models_updated is None
+                    or time.monotonic() - self._models_updated
+                    > self.models_ttl
+                )
+                if ejected or stale:
+                    await self.refresh_models()
+            except Exception as exc:
+                logger.error(f"Probing LLM endpoints failed: {exc}")
+
+    def start(self):
+        """Start probing ejected endpoints in the background."""
+        if self._probe_task is None and len(self.endpoints) > 1:
+            self._probe_task = asyncio.create_task(self._probe())
+
+    async def close(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+    def stats(self):
+        """Return the health statistics of every endpoint."""
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+
+class RoutedChatModel(BaseChatModel):
+    """Chat model sending each call to an endpoint picked by a router.
+
+    A call failing with a connection, server or rate limit error is retried
+    on another endpoint. Streams fail over only until the first token is
+    received, later errors are raised since the client has seen output.
+    """
+
+    router: Any
+    model_name: str
+    temperature: float = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-openai"
+
+    def _failover(self, call, release=True):
+        """Run ``call(model)`` on the chosen endpoints until one succeeds.
+
+        Returns the endpoint and the result. With `release` False the
+        endpoint stays counted as busy until the caller releases it.
+        """
+        error = None
+        for endpoint in self.router._attempts(self.model_name):
+            model = self.router.chat_model(
+                endpoint, self.model_name, self.temperature
+            )
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            started = time.monotonic()
+            try:
+                result = call(model)
+            except failover_errors() as exc:
+                endpoint.outstanding -= 1
+                self.router._record_failure(endpoint, exc)
+                error = exc
+                continue
+            except BaseException:
+                endpoint.outstanding -= 1
+                raise
+            if release:
+                endpoint.outstanding -= 1
+            self.router._record_success(endpoint, time.monotonic() - started)
+            return endpoint, result
+        raise error
+
+    async def _afailover(self, call, release=True):
+        """Async variant of `_failover`, awaiting ``call(model)``."""
+        error = None
+        for endpoint in self.router._attempts(self.model_name):
+            model = self.router.chat_model(
+                endpoint, self.model_name, self.temperature
+            )
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            started = time.monotonic()
+            try:
+                result = await call(model)
+            except failover_errors() as exc:
+                endpoint.outstanding -= 1
+                self.router._record_failure(endpoint, exc)
+                error = exc
+                continue
+            except BaseException:
+                endpoint.outstanding -= 1
+                raise
+            if release:
+                endpoint.outstanding -= 1
+            self.router._record_success(endpoint, time.monotonic() - started)
+            return endpoint, result
+        raise error
+
+    @staticmethod
+    def _observe_result(result, seconds):
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        TOKENS.labels("completion").inc(usage.get("completion_tokens") or 0)
+        stage("llm_generation").observe(seconds)
+
+    @staticmethod
+    def _observe_stream(started, first_token, chunks):
+        """Record the generation after the first token of a stream."""
+        generation = time.monotonic() - first_token
+        stage("llm_first_token").observe(first_token - started)
+        stage("llm_generation").observe(generation)
+        # Servers send about one token per chunk
+        TOKENS.labels("completion").inc(chunks)
+        if chunks > 1 and generation > 0:
+            TOKENS_PER_SECOND.observe((chunks - 1) / generation)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        started = time.monotonic()
+        _, result = self._failover(
+            lambda model: model._generate(
+                messages, stop, run_manager, **kwargs
+            )
+        )
+        self._observe_result(result, time.monotonic() - started)
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        started = time.monotonic()
+        _, result = await self._afailover(
+            lambda model: model._agenerate(
+                messages, stop, run_manager, **kwargs
+            )
+        )
+        self._observe_result(result, time.monotonic() - started)
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        def first_chunk(model):
+            stream = model._stream(messages, stop, run_manager, **kwargs)
+            try:
+                return stream, next(stream, None)
+            except BaseException:
+                # Release its connection before trying another endpoint
+                stream.close()
+                raise
+
+        started = time.monotonic()
+        endpoint, (stream, chunk) = self._failover(first_chunk, False)
+        first_token = time.monotonic()
+        chunks = 0
+        try:
+            if chunk is not None:
+                chunks += 1
+                yield chunk
+                for chunk in stream:
+                    chunks += 1
+                    yield chunk
+        finally:
+            # Also if the caller stops reading midway
+            stream.close()
+            endpoint.outstanding -= 1
+        self._observe_stream(started, first_token, chunks)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async def first_chunk(model):
+            stream = model._astream(messages, stop, run_manager, **kwargs)
+            try:
+                return stream, await anext(stream, None)
+            except BaseException:
+                # Release its connection before trying another endpoint
+                await stream.aclose()
+                raise
+
+        started = time.monotonic()
+        endpoint, (stream, chunk) = await self._afailover(first_chunk, False)
+        first_token = time.monotonic()
+        chunks = 0
+        try:
+            if chunk is not None:
+                chunks += 1
+                yield chunk
+                async for chunk in stream:
+                    chunks += 1
+                    yield chunk
+        finally:
+            # Also if the caller stops reading midway
+            await stream.aclose()
+            endpoint.outstanding -= 1
+        self._observe_stream(started, first_token, chunks)
@@ -0,0 +1,55 @@
+import re
+import zlib
+from collections import Counter
+
+from qdrant_client.models import SparseVector
+
+# Words, numbers and identifiers such as `get_rag_chain` or `Config2`
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lower-case tokens of `text`.
+
+    Identifiers are kept whole so exact function and variable names can be
+    matched, and their snake_case parts are added as separate tokens.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if "_" in token:
+            tokens += [part for part in token.split("_") if part]
+    return tokens
+
+
+def term_index(token):
+    """Stable 32-bit index of a token in the sparse vector space."""
+    return zlib.crc32(token.encode())
+
+
+def encode_query(text):
+    """Encode a query as a BM25 sparse vector.
+
+    Every distinct term gets weight 1. The document side (term frequency
+    saturation) is computed at ingestion by `encode_document`, and Qdrant
+    applies the inverse document frequency through the ``idf`` modifier of
+    the sparse vector.
+    """
+    indices = sorted({term_index(token) for token in tokenize(text)})
+    return SparseVector(indices=indices, values=[1.0] * len(indices))
+
+
+def encode_document(text, k1=1.2, b=0.75, avg_doc_length=150):
+    """Encode a chunk as a BM25 sparse vector (used by the ingestion).
+
+    Values are the saturated term frequencies of BM25, the inverse document
+    frequency is applied by Qdrant at query time (``idf`` modifier).
+    """
+    counts = Counter(term_index(token) for token in tokenize(text))
+    length = sum(counts.values())
+    norm = k1 * (1 - b + b * length / avg_doc_length)
+    indices = sorted(counts)
+    return SparseVector(
+        indices=indices,
+        values=[counts[i] * (k1 + 1) / (counts[i] + norm) for i in indices],
+    )
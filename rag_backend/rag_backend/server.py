@@ -0,0 +1,172 @@
+"""Multi-worker serving of the backend with gunicorn and uvicorn workers.
+
+The master process imports the app and the modules its clients load
+lazily before forking, so the workers share them copy-on-write. Clients and
+their connection pools are only built inside each worker, on first use or
+by its warmup.
+
+Signals sent to the master:
+
+- HUP: gracefully replace the workers; without preloading they load the
+  current code and settings;
+- USR2 then WINCH and QUIT to the old master: upgrade a preloaded server
+  to new code without downtime;
+- TERM: graceful shutdown, waiting up to the graceful timeout for the
+  requests in progress.
+"""
+
+import importlib
+import logging
+import os
+import shutil
+import signal
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger(__name__)
+
+# Imported on first use by the workers, loaded in the master when preloading
+LAZY_MODULES = (
+    "openai",
+    "langchain_openai",
+    "langchain.chains.combine_documents",
+)
+
+
+def preload():
+    """Import the app and the modules its clients would import lazily."""
+    for name in LAZY_MODULES:
+        importlib.import_module(name)
+    from .app import app
+
+    return app
+
+
+def post_fork(server, worker):
+    """Drop clients a worker may have inherited from the master, so it opens
+    its own connections instead of sharing the sockets of its siblings.
+    """
+    from .api import rag
+    from .core.config import rag_config
+    from .core.semantic_cache import build_semantic_cache
+    from .langchain_utils.chain import invalidate_rag_chains
+    from .langchain_utils.llms import get_llm_router
+    from .langchain_utils.retriever import (
+        get_async_qdrant_client,
+        get_corpus_version,
+        get_embedder,
+        get_qdrant_client,
+        get_retriever,
+    )
+
+    # Dropped without closing them, their sockets belong to the master
+    invalidate_rag_chains()
+    get_retriever.cache_clear()
+    get_qdrant_client.cache_clear()
+    get_async_qdrant_client.cache_clear()
+    get_embedder.cache_clear()
+    get_llm_router.cache_clear()
+    rag.semantic_cache = build_semantic_cache(
+        rag_config, version_loader=get_corpus_version
+    )
+    # /rag/chains/invalidate reaches a single worker, it replaces them all
+    rag.reload_workers = lambda: os.kill(server.pid, signal.SIGHUP)
+
+
+def child_exit(server, worker):
+    """Merge the metrics of a stopped worker into the totals."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+class PreforkServer(BaseApplication):
+    """Gunicorn application serving the backend with uvicorn workers.
+
+    parameters
+    ----------
+    options : dict
+        Gunicorn settings, e.g. "bind", "workers" or "max_requests".
+    """
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set("worker_class", "uvicorn_worker.UvicornWorker")
+        self.cfg.set("post_fork", post_fork)
+        self.cfg.set("child_exit", child_exit)
+
+    def load(self):
+        return preload()
+
+
+def run(
+    host,
+    port,
+    workers,
+    max_requests=0,
+    max_requests_jitter=0,
+    graceful_timeout=30,
+    preload_app=True,
+):
+    """Serve the backend with `workers` processes until stopped.
+
+    parameters
+    ----------
+    host, port
+        Address the master listens on for every worker.
+    workers : int
+        Worker processes.
+    max_requests : int
+        Requests after which a worker is replaced (0: never), bounding the
+        growth of its memory.
+    max_requests_jitter : int
+        Random extra requests per worker, so they are not all replaced at
+        once.
+    graceful_timeout : float
+        Seconds a stopping worker gets to finish its requests.
+    preload_app : bool
+        Import the app in the master before forking.
+    """
+    from .core.config import rag_config
+
+    if rag_config.SEMANTIC_CACHE == "memory":
+        logger.warning(
+            "SEMANTIC_CACHE=memory keeps one answer cache per worker, use "
+            "SEMANTIC_CACHE=redis to share it"
+        )
+
+    # Metrics of all workers are written to files merged on scrape; set
+    # before prometheus_client is imported by the app
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    temporary = not metrics_dir
+    if temporary:
+        metrics_dir = tempfile.mkdtemp(prefix="rag-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    else:
+        # Left over by an earlier run, their workers are gone
+        for name in os.listdir(metrics_dir):
+            if name.endswith(".db"):
+                os.remove(os.path.join(metrics_dir, name))
+    master = os.getpid()
+    try:
+        PreforkServer(
+            {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "max_requests": max_requests,
+                "max_requests_jitter": max_requests_jitter,
+                "graceful_timeout": graceful_timeout,
+                "preload_app": preload_app,
+                "loglevel": "info",
+            }
+        ).run()
+    finally:
+        # Workers exit through here too, only the master cleans up
+        if temporary and os.getpid() == master:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
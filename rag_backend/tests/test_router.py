@@ -0,0 +1,146 @@
+import asyncio
+from typing import Any, List
+
+import httpx
+import openai
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import (
+    ChatGeneration,
+    ChatGenerationChunk,
+    ChatResult,
+)
+
+from rag_backend.langchain_utils.router import LLMRouter, RoutedChatModel
+
+URLS = ["http://llm-a/v1", "http://llm-b/v1"]
+
+
+def connection_error():
+    return openai.APIConnectionError(
+        request=httpx.Request("POST", "http://llm/v1/chat/completions")
+    )
+
+
+class StubChatModel(BaseChatModel):
+    """Answers `reply` token by token, or raises `error`."""
+
+    reply: str = "hello there"
+    error: Any = None
+    calls: int = 0
+    closed_streams: List[bool] = []
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(self.reply))]
+        )
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kw):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        try:
+            for token in self.reply.split():
+                yield ChatGenerationChunk(message=AIMessageChunk(token))
+                await asyncio.sleep(0)
+        finally:
+            self.closed_streams.append(True)
+
+
+def routed(models, **kwargs):
+    router = LLMRouter(URLS, "key", model_endpoints={"m": URLS}, **kwargs)
+    router.chat_model = lambda endpoint, model_name, temperature: models[
+        endpoint.url
+    ]
+    return router, RoutedChatModel(router=router, model_name="m")
+
+
+def test_calls_fail_over_to_another_endpoint():
+    models = {
+        URLS[0]: StubChatModel(error=connection_error()),
+        URLS[1]: StubChatModel(reply="from b"),
+    }
+    router, llm = routed(models)
+
+    assert llm.invoke("q").content == "from b"
+    assert [e.failures for e in router.endpoints] == [1, 0]
+    assert [e.outstanding for e in router.endpoints] == [0, 0]
+
+
+def test_other_errors_are_not_retried():
+    models = {
+        URLS[0]: StubChatModel(error=ValueError("bad request")),
+        URLS[1]: StubChatModel(error=ValueError("bad request")),
+    }
+    _, llm = routed(models)
+
+    with pytest.raises(ValueError):
+        llm.invoke("q")
+    assert sum(model.calls for model in models.values()) == 1
+
+
+def test_last_error_is_raised_when_every_attempt_failed():
+    models = {url: StubChatModel(error=connection_error()) for url in URLS}
+    router, llm = routed(models, max_attempts=3)
+
+    with pytest.raises(openai.APIConnectionError):
+        llm.invoke("q")
+    assert sum(model.calls for model in models.values()) == 3
+    assert [e.outstanding for e in router.endpoints] == [0, 0]
+
+
+def test_failing_endpoints_are_ejected():
+    models = {
+        URLS[0]: StubChatModel(error=connection_error()),
+        URLS[1]: StubChatModel(),
+    }
+    router, llm = routed(models, failure_threshold=2)
+
+    for _ in range(2):
+        llm.invoke("q")
+    assert not router.endpoints[0].healthy
+    llm.invoke("q")
+    # The ejected endpoint is skipped while the other one is healthy
+    assert models[URLS[0]].calls == 2
+
+
+def test_max_attempts_must_be_positive():
+    with pytest.raises(ValueError):
+        LLMRouter(URLS, "key", max_attempts=0)
+
+
+def test_streams_fail_over_before_the_first_token():
+    async def main():
+        models = {
+            URLS[0]: StubChatModel(error=connection_error()),
+            URLS[1]: StubChatModel(reply="from b"),
+        }
+        router, llm = routed(models)
+
+        chunks = [chunk.content async for chunk in llm.astream("q")]
+        assert "".join(chunks) == "fromb"
+        assert [e.outstanding for e in router.endpoints] == [0, 0]
+
+    asyncio.run(main())
+
+
+def test_streams_left_midway_are_closed():
+    async def main():
+        model = StubChatModel(reply="one two three", closed_streams=[])
+        router, llm = routed({url: model for url in URLS})
+
+        stream = llm.astream("q")
+        assert (await anext(stream)).content == "one"
+        await stream.aclose()
+        assert model.closed_streams == [True]
+        assert [e.outstanding for e in router.endpoints] == [0, 0]
+
+    asyncio.run(main())
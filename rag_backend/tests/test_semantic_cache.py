@@ -0,0 +1,165 @@
+import asyncio
+
+import fakeredis
+import numpy as np
+
+from rag_backend.core.semantic_cache import (
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+    SemanticCache,
+)
+
+HISTORY = [{"role": "user", "content": "hello"}]
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def redis_backend(server, **kwargs):
+    backend = RedisCacheBackend("redis://localhost", **kwargs)
+    backend.redis = fakeredis.FakeAsyncRedis(server=server)
+    return backend
+
+
+async def store(cache, query_vector, answer, model="m", history=HISTORY):
+    await cache.store(model, query_vector, history, answer, [], 1.0)
+
+
+def test_similar_queries_hit_and_others_miss():
+    async def main():
+        cache = SemanticCache(InMemoryCacheBackend(), threshold=0.9)
+        await store(cache, [1.0, 0.0], "answer")
+
+        hit = await cache.lookup("m", [0.99, 0.05], HISTORY)
+        assert hit["answer"] == "answer"
+        assert await cache.lookup("m", [0.0, 1.0], HISTORY) is None
+        assert await cache.lookup("other", [1.0, 0.0], HISTORY) is None
+        assert await cache.lookup("m", [1.0, 0.0], []) is None
+        assert cache.stats()["hits"] == 1
+
+    asyncio.run(main())
+
+
+def test_corpus_version_change_invalidates_entries():
+    async def main():
+        version = {"value": "v1"}
+
+        async def load_version():
+            return version["value"]
+
+        cache = SemanticCache(
+            redis_backend(fakeredis.FakeServer()),
+            version_loader=load_version,
+            version_check_interval=0,
+        )
+        await store(cache, [1.0, 0.0], "before ingestion")
+        assert await cache.lookup("m", [1.0, 0.0], HISTORY) is not None
+
+        version["value"] = "v2"
+        assert await cache.lookup("m", [1.0, 0.0], HISTORY) is None
+        await store(cache, [1.0, 0.0], "after ingestion")
+        hit = await cache.lookup("m", [1.0, 0.0], HISTORY)
+        assert hit["answer"] == "after ingestion"
+
+    asyncio.run(main())
+
+
+def test_version_is_reused_within_the_check_interval():
+    async def main():
+        loads = []
+
+        async def load_version():
+            loads.append(1)
+            return "v1"
+
+        cache = SemanticCache(
+            InMemoryCacheBackend(),
+            version_loader=load_version,
+            version_check_interval=60,
+        )
+        for _ in range(3):
+            await cache.lookup("m", [1.0, 0.0], HISTORY)
+        assert len(loads) == 1
+
+    asyncio.run(main())
+
+
+def test_entries_of_other_workers_are_found():
+    async def main():
+        server = fakeredis.FakeServer()
+        worker, other_worker = redis_backend(server), redis_backend(server)
+
+        # Loads the (empty) vectors into the process copy of the worker
+        assert await worker.search("ns", vector(1, 0), 0.9) is None
+        await other_worker.put(
+            "ns",
+            vector(1, 0),
+            {"answer": "a", "relevant_docs": [], "generation_time": 1.0},
+        )
+        hit = await worker.search("ns", vector(1, 0), 0.9)
+        assert hit["answer"] == "a"
+
+    asyncio.run(main())
+
+
+def test_search_reuses_vectors_until_the_version_changes():
+    async def main():
+        backend = redis_backend(fakeredis.FakeServer())
+        entry = {"answer": "a", "relevant_docs": [], "generation_time": 1.0}
+        await backend.put("ns", vector(1, 0), entry)
+        loads = []
+        load = backend._load
+
+        async def counted_load(namespace):
+            loads.append(namespace)
+            return await load(namespace)
+
+        backend._load = counted_load
+        await asyncio.gather(
+            *(backend.search("ns", vector(1, 0), 0.9) for _ in range(5))
+        )
+        assert len(loads) == 1
+
+        await backend.put("ns", vector(0, 1), entry)
+        await backend.search("ns", vector(0, 1), 0.9)
+        assert len(loads) == 2
+
+    asyncio.run(main())
+
+
+def test_entries_gone_from_redis_are_misses():
+    async def main():
+        backend = redis_backend(fakeredis.FakeServer())
+        entry = {"answer": "a", "relevant_docs": [], "generation_time": 1.0}
+        await backend.put("ns", vector(1, 0), entry)
+        assert await backend.search("ns", vector(1, 0), 0.9) is not None
+
+        # Expired behind the back of the process copy
+        keys = await backend.redis.keys("semantic_cache:ns:*")
+        await backend.redis.delete(
+            *(k for k in keys if not k.endswith((b":index", b":version")))
+        )
+        assert await backend.search("ns", vector(1, 0), 0.9) is None
+        assert await backend.redis.zcard(backend._index_key("ns")) == 0
+
+    asyncio.run(main())
+
+
+def test_least_recently_used_entries_are_evicted():
+    async def main():
+        backend = redis_backend(fakeredis.FakeServer(), max_size=2)
+        for i, v in enumerate([vector(1, 0), vector(0, 1), vector(-1, 0)]):
+            await backend.put(
+                "ns",
+                v,
+                {"answer": str(i), "relevant_docs": [], "generation_time": 0},
+            )
+            await asyncio.sleep(0.01)
+
+        assert await backend.search("ns", vector(1, 0), 0.9) is None
+        assert (await backend.search("ns", vector(-1, 0), 0.9))[
+            "answer"
+        ] == "2"
+
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from rag_backend.core.single_flight import SingleFlight, request_key
+
+
+def test_request_key_ignores_case_and_whitespace():
+    history = [{"role": "user", "content": "hi"}]
+    assert request_key("m", " What  is RAG?", history) == request_key(
+        "m", "what is rag?", history
+    )
+    assert request_key("m", "q", history) != request_key("m", "q", [])
+    assert request_key("m", "q", []) != request_key("other", "q", [])
+
+
+def test_concurrent_calls_share_one_computation():
+    async def main():
+        flight = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"answer": 42}
+
+        results = await asyncio.gather(
+            *(flight.do("key", compute) for _ in range(5))
+        )
+        assert len(calls) == 1
+        assert results == [{"answer": 42}] * 5
+        assert flight.stats()["coalesced"] == 4
+        assert flight.stats()["in_flight"] == 0
+
+        # Finished computations are not reused
+        await flight.do("key", compute)
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+
+def test_errors_are_raised_to_every_caller():
+    async def main():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(flight.do("key", fail) for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(main())
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    async def main():
+        flight = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(main())
+
+
+def test_late_stream_subscribers_replay_earlier_items():
+    async def main():
+        flight = SingleFlight()
+        second_joined = asyncio.Event()
+
+        async def frames():
+            yield "a"
+            await second_joined.wait()
+            yield "b"
+
+        async def first():
+            return [item async for item in flight.stream("key", frames)]
+
+        task = asyncio.create_task(first())
+        await asyncio.sleep(0.01)
+        second = flight.stream("key", frames)
+        second_joined.set()
+        assert [item async for item in second] == ["a", "b"]
+        assert await task == ["a", "b"]
+        assert flight.stats()["computed"] == 1
+
+    asyncio.run(main())
+
+
+def test_stream_is_cancelled_once_every_subscriber_left():
+    async def main():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def frames():
+            try:
+                yield "a"
+                await asyncio.sleep(10)
+                yield "b"
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        stream = flight.stream("key", frames)
+        assert await anext(stream) == "a"
+        await stream.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())